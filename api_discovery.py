@@ -0,0 +1,285 @@
+# api_discovery.py
+"""
+Поиск JSON-эндпоинта каталога партнёров для parser_type='api_json'.
+
+Один прогон Selenium с включённым performance-логом Chrome: открываем
+категорию банка, жмём «Показать ещё» несколько раз, затем из сетевого лога
+выбираем XHR/Fetch-ответ с JSON, в котором нашлись партнёры со страницы,
+и вычисляем параметр пагинации по разнице между запросами.
+
+Запуск:
+    python api_discovery.py --bank 5               # показать найденный конфиг
+    python api_discovery.py --bank 5 --save        # сохранить в banks.api_config
+    python api_discovery.py --bank 5 --activate    # + parser_type='api_json'
+    python api_discovery.py --bank 5 --url <URL категории>
+"""
+import argparse
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from back_db import (
+    normalize,
+    fetch_categories_scrape_config,
+    fetch_partners_scrape_config,
+    get_latest_categories_by_bank,
+    set_bank_api_config,
+)
+from driver_pool import chrome_options
+from update_nw import extract_cards, _click_cookie
+from waits import settle, wait_count_changed
+from api_parser import fetch_items, get_path
+
+MORE_CLICKS = 3
+# типичные имена параметров пагинации — если кликов «ещё» не было
+PAGE_PARAM_NAMES = ("page", "PAGEN_1", "p", "pageNumber", "offset", "skip", "from", "start")
+OFFSET_PARAM_NAMES = ("offset", "skip", "from", "start")
+LINK_KEYS = ("url", "link", "href", "slug", "code", "path")
+
+
+# ---------- СБОР СЕТЕВОГО ЛОГА ----------
+def _perf_driver() -> webdriver.Chrome:
+    opts = chrome_options()
+    opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return webdriver.Chrome(options=opts)
+
+
+def _click_more(driver: webdriver.Chrome, pcfg: Dict[str, Any], times: int) -> int:
+    clicks = 0
+    for _ in range(times):
+        try:
+            btn = WebDriverWait(driver, 5).until(
+                EC.element_to_be_clickable(
+                    (By.XPATH, f"//button[contains(., '{pcfg['button_more']}')]")
+                )
+            )
+        except TimeoutException:
+            break
+        before = driver.execute_script(
+            "return document.querySelectorAll(arguments[0]).length;", pcfg["partners_list"]
+        )
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
+        driver.execute_script("arguments[0].click();", btn)
+        wait_count_changed(driver, pcfg["partners_list"], before, timeout=10)
+        settle(driver, "network", pcfg["partners_list"], legacy_sleep=2)
+        clicks += 1
+    return clicks
+
+
+def _json_responses(driver: webdriver.Chrome) -> List[Dict[str, Any]]:
+    """[{url, method, post, data}] — все XHR/Fetch-ответы с JSON из performance-лога."""
+    requests_by_id: Dict[str, Dict[str, Any]] = {}
+    json_ids: List[str] = []
+    for entry in driver.get_log("performance"):
+        msg = json.loads(entry["message"])["message"]
+        params = msg.get("params", {})
+        if msg.get("method") == "Network.requestWillBeSent":
+            req = params["request"]
+            requests_by_id[params["requestId"]] = {
+                "url": req["url"], "method": req["method"], "post": req.get("postData"),
+            }
+        elif msg.get("method") == "Network.responseReceived":
+            mime = params.get("response", {}).get("mimeType") or ""
+            if "json" in mime and params.get("type") in ("XHR", "Fetch"):
+                json_ids.append(params["requestId"])
+
+    out: List[Dict[str, Any]] = []
+    for rid in json_ids:
+        try:
+            body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": rid})
+            text = base64.b64decode(body["body"]).decode("utf-8") if body.get("base64Encoded") else body["body"]
+            out.append({**requests_by_id.get(rid, {}), "data": json.loads(text)})
+        except Exception:
+            continue
+    return out
+
+
+# ---------- АНАЛИЗ ----------
+def _item_lists(obj: Any, path: str = "") -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Все списки словарей внутри JSON с путями до них."""
+    found: List[Tuple[str, List[Dict[str, Any]]]] = []
+    if isinstance(obj, list):
+        if obj and all(isinstance(x, dict) for x in obj):
+            found.append((path, obj))
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            found.extend(_item_lists(value, f"{path}.{key}" if path else key))
+    return found
+
+
+def _flat_fields(item: Dict[str, Any], prefix: str = "", depth: int = 2) -> Dict[str, Any]:
+    """{'title': ..., 'bonus.value': ...} — скалярные поля карточки до depth уровней."""
+    out: Dict[str, Any] = {}
+    for key, value in item.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict) and depth > 1:
+            out.update(_flat_fields(value, path, depth - 1))
+        elif isinstance(value, (str, int, float)):
+            out[path] = value
+    return out
+
+
+def _best_field(items: List[Dict[str, Any]], expected: List[str]) -> Tuple[Optional[str], int]:
+    """Поле, значения которого чаще всего совпадают с ожидаемыми (после normalize)."""
+    wanted = {normalize(x) for x in expected if x}
+    scores: Dict[str, int] = {}
+    for item in items:
+        for key, value in _flat_fields(item).items():
+            if normalize(str(value)) in wanted:
+                scores[key] = scores.get(key, 0) + 1
+    if not scores:
+        return None, 0
+    key = max(scores, key=scores.get)
+    return key, scores[key]
+
+
+def _request_params(resp: Dict[str, Any]) -> Dict[str, Any]:
+    if resp.get("method") == "POST" and resp.get("post"):
+        try:
+            body = json.loads(resp["post"])
+            return body if isinstance(body, dict) else {}
+        except ValueError:
+            return {}
+    return {k: v[0] if len(v) == 1 else v for k, v in parse_qs(urlsplit(resp["url"]).query).items()}
+
+
+def _endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pagination(calls: List[Dict[str, Any]], page_size: int) -> Tuple[Optional[str], int, int]:
+    """(page_param, page_start, page_step) по числовому параметру, который менялся между запросами."""
+    params = [_request_params(c) for c in calls]
+    if len(params) >= 2:
+        for key, first in params[0].items():
+            a, b = _as_int(first), _as_int(params[1].get(key))
+            if a is not None and b is not None and b != a:
+                return key, a, b - a
+    for key in PAGE_PARAM_NAMES:
+        if key in params[0] and _as_int(params[0][key]) is not None:
+            start = _as_int(params[0][key])
+            step = page_size if key in OFFSET_PARAM_NAMES else 1
+            return key, start, step
+    return None, 1, 1
+
+
+def discover(driver: webdriver.Chrome, bank_id: int, category_url: str) -> Optional[Dict[str, Any]]:
+    cfg = fetch_categories_scrape_config(bank_id)
+    pcfg = fetch_partners_scrape_config(bank_id)
+
+    driver.get(category_url)
+    _click_cookie(driver, cfg.get("cookie_text", ""))
+    settle(driver, "network", pcfg["partners_list"], legacy_sleep=3)
+    clicks = _click_more(driver, pcfg, MORE_CLICKS)
+
+    dom_cards = extract_cards(driver, pcfg)
+    dom_names = [c["name"].split(",", 1)[0].strip() for c in dom_cards if c.get("name")]
+    dom_bonuses = [c["bonus"].replace(pcfg["bonus_unit"], "").strip() for c in dom_cards if c.get("bonus")]
+    responses = _json_responses(driver)
+    print(f"🔎 Карточек в DOM: {len(dom_cards)}, кликов «ещё»: {clicks}, JSON-ответов: {len(responses)}")
+
+    # ответ, в котором больше всего карточек со страницы
+    best = None
+    for resp in responses:
+        for path, items in _item_lists(resp["data"]):
+            name_key, score = _best_field(items, dom_names)
+            if name_key and (best is None or score > best[3]):
+                best = (resp, path, items, score, name_key)
+    if best is None or best[3] == 0:
+        print("❌ Не найден JSON с партнёрами со страницы")
+        return None
+    resp, items_path, items, _, name_key = best
+
+    endpoint = _endpoint(resp["url"])
+    calls = [r for r in responses if _endpoint(r["url"]) == endpoint and r.get("method") == resp.get("method")]
+    page_param, page_start, page_step = _pagination(calls, len(items))
+    # первый XHR обычно уже за второй порцией (первая пришла в HTML) — отматываем к началу
+    if page_param and page_step > 0:
+        floor = 0 if page_param in OFFSET_PARAM_NAMES else 1
+        while page_start - page_step >= floor:
+            page_start -= page_step
+
+    bonus_key, _ = _best_field(items, dom_bonuses)
+    link_key = next(
+        (k for k in _flat_fields(items[0]) if k.split(".")[-1].lower() in LINK_KEYS), None
+    )
+
+    # параметры запроса, совпадающие с параметрами URL категории, подставляются по категории
+    url_query = {k: v[0] for k, v in parse_qs(urlsplit(category_url).query).items()}
+    fixed = _request_params(calls[0])
+    category_params = {}
+    for key, value in list(fixed.items()):
+        if key == page_param:
+            fixed.pop(key)
+            continue
+        url_key = next((uk for uk, uv in url_query.items() if str(uv) == str(value)), None)
+        if url_key:
+            category_params[key] = url_key
+            fixed.pop(key)
+
+    return {
+        "endpoint": endpoint,
+        "method": resp.get("method") or "GET",
+        "params": fixed,
+        "category_params": category_params,
+        "page_param": page_param,
+        "page_start": page_start,
+        "page_step": page_step,
+        "items_path": items_path,
+        "fields": {"name": name_key, "bonus": bonus_key, "link": link_key},
+        "link_base": category_url,
+    }
+
+
+def run(bank_id: int, category_url: Optional[str], save: bool, activate: bool) -> None:
+    if not category_url:
+        categories = get_latest_categories_by_bank(bank_id)
+        if not categories:
+            print(f"❌ У банка {bank_id} нет сохранённых категорий — укажите --url")
+            return
+        category_url = categories[0][2]
+
+    driver = _perf_driver()
+    try:
+        api_cfg = discover(driver, bank_id, category_url)
+    finally:
+        driver.quit()
+    if not api_cfg:
+        return
+
+    print(json.dumps(api_cfg, ensure_ascii=False, indent=2))
+    stats: dict = {}
+    items = fetch_items(api_cfg, category_url, stats)
+    sample = [get_path(it, api_cfg["fields"]["name"]) for it in items[:5]]
+    print(f"✅ Проверка без браузера: {len(items)} карточек, например: {sample}")
+    if stats.get("truncated"):
+        print("⚠️ Пагинация не закончилась за MAX_PAGES — проверьте page_param/page_step")
+
+    if save or activate:
+        set_bank_api_config(bank_id, api_cfg, activate=activate)
+        print(f"💾 api_config сохранён для банка {bank_id}" + (" (parser_type=api_json)" if activate else ""))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--bank", type=int, required=True)
+    ap.add_argument("--url", default=None, help="URL категории (по умолчанию — первая сохранённая)")
+    ap.add_argument("--save", action="store_true")
+    ap.add_argument("--activate", action="store_true")
+    args = ap.parse_args()
+    run(args.bank, args.url, args.save, args.activate)
@@ -0,0 +1,194 @@
+# api_parser.py
+"""
+Парсер parser_type='api_json': партнёры берутся прямо из JSON-эндпоинта,
+через который страница банка сама подгружает карточки («Показать ещё»),
+без браузера.
+
+Конфиг эндпоинта хранится в banks.api_config (JSON), его находит
+api_discovery.py по сетевому логу одного Selenium-прогона:
+    {
+      "endpoint": "https://bank.by/api/partners",
+      "method": "GET",                      # или POST (параметры — JSON-тело)
+      "params": {"limit": 12},              # неизменные параметры
+      "category_params": {"cat": "category"},  # параметр API ← параметр URL категории
+      "page_param": "page", "page_start": 1, "page_step": 1,
+      "items_path": "data.items",           # где в ответе список карточек
+      "fields": {"name": "title", "bonus": "cashback", "link": "url"},
+      "link_base": "https://bank.by/"
+    }
+Категории — последние сохранённые для банка (их URL даёт category_params).
+"""
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from back_db import (
+    fetch_partners_scrape_config,
+    get_bank_api_config,
+    get_latest_categories_by_bank,
+    save_partners,
+    save_single_category,
+)
+import http_client
+
+ProgressFn = Optional[Callable[[int, int, str], None]]
+
+MAX_PAGES = 50
+
+
+def get_path(obj: Any, path: str) -> Any:
+    """Значение по пути вида 'data.items' / 'bonus.value' / 'images.0.url'."""
+    if not path:
+        return obj
+    for key in path.split("."):
+        if isinstance(obj, list) and key.isdigit():
+            idx = int(key)
+            obj = obj[idx] if idx < len(obj) else None
+        elif isinstance(obj, dict):
+            obj = obj.get(key)
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def _request_page(cfg: Dict[str, Any], params: Dict[str, Any]) -> Any:
+    session = http_client.get_session()
+    if (cfg.get("method") or "GET").upper() == "POST":
+        resp = session.post(cfg["endpoint"], json=params, timeout=20)
+    else:
+        resp = session.get(cfg["endpoint"], params=params, timeout=20)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _category_params(cfg: Dict[str, Any], category_url: str) -> Dict[str, Any]:
+    query = parse_qs(urlsplit(category_url or "").query)
+    params: Dict[str, Any] = {}
+    for api_param, url_param in (cfg.get("category_params") or {}).items():
+        values = query.get(url_param)
+        if values:
+            params[api_param] = values[0] if len(values) == 1 else values
+    return params
+
+
+def fetch_items(
+    cfg: Dict[str, Any],
+    category_url: str = "",
+    stats: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Все карточки категории: листаем page_param, пока приходят новые.
+    stats["truncated"] = True — упёрлись в MAX_PAGES, а страницы ещё шли
+    (список неполный).
+    """
+    base = {**(cfg.get("params") or {}), **_category_params(cfg, category_url)}
+    page_param = cfg.get("page_param")
+    page = cfg.get("page_start", 1)
+    step = cfg.get("page_step", 1)
+
+    items: List[Dict[str, Any]] = []
+    seen_pages = set()
+    for _ in range(MAX_PAGES):
+        params = dict(base)
+        if page_param:
+            params[page_param] = page
+        batch = get_path(_request_page(cfg, params), cfg.get("items_path", "")) or []
+        if not isinstance(batch, list) or not batch:
+            break
+        # защита от зацикливания: сервер отдаёт одну и ту же страницу
+        fingerprint = repr(batch[0])[:500] + repr(batch[-1])[:500]
+        if fingerprint in seen_pages:
+            break
+        seen_pages.add(fingerprint)
+        items.extend(it for it in batch if isinstance(it, dict))
+        if not page_param:
+            break
+        page += step
+    else:
+        print(f"⚠️ API: достигнут лимит {MAX_PAGES} страниц, список карточек неполный")
+        if stats is not None:
+            stats["truncated"] = True
+    return items
+
+
+def item_to_partner(item: Dict[str, Any], cfg: Dict[str, Any], bonus_unit: str = "") -> Optional[Dict[str, Any]]:
+    fields = cfg.get("fields") or {}
+    name = get_path(item, fields.get("name", ""))
+    name = " ".join(str(name).split()) if name is not None else ""
+    if not name:
+        return None
+
+    bonus = get_path(item, fields["bonus"]) if fields.get("bonus") else None
+    if bonus is not None:
+        bonus = str(bonus)
+        if bonus_unit:
+            bonus = bonus.replace(bonus_unit, "")
+        bonus = bonus.strip() or None
+
+    link = get_path(item, fields["link"]) if fields.get("link") else None
+    link = urljoin(cfg.get("link_base") or cfg["endpoint"], str(link)) if link else ""
+
+    return {
+        "partner_name": name,
+        "partner_bonus": bonus,
+        "partner_link": link,
+    }
+
+
+def fetch_api_json(
+    bank_id: int,
+    progress: ProgressFn = None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Партнёры всех категорий банка через JSON-эндпоинт. None (ничего не
+    записано), если конфига нет, категорий нет или API не вернул ни одной
+    карточки — тогда вызывающий код откатывается на Selenium.
+    Категория с неполным списком (лимит страниц) или пустая, когда в других
+    карточки есть, не сохраняется: сверка по такому списку пометила бы
+    непришедших партнёров удалёнными.
+    """
+    cfg = get_bank_api_config(bank_id)
+    if not cfg:
+        print(f"[bank {bank_id}] ⚠️ api_config пуст — запустите api_discovery.py")
+        return None
+    categories = get_latest_categories_by_bank(bank_id)
+    if not categories:
+        return None
+    bonus_unit = fetch_partners_scrape_config(bank_id)["bonus_unit"]
+
+    scraped = []
+    try:
+        for idx, (_, category_name, category_url) in enumerate(categories, start=1):
+            stats: Dict[str, Any] = {}
+            items = fetch_items(cfg, category_url, stats)
+            partners = [p for p in (item_to_partner(it, cfg, bonus_unit) for it in items) if p]
+            note = f"[bank {bank_id} cat {idx}/{len(categories)} '{category_name}'] 🔌 API: партнёров {len(partners)}"
+            print(note)
+            if progress:
+                progress(banks_done, banks_total, note)
+            scraped.append((category_name, category_url, partners, stats.get("truncated", False)))
+    except Exception as e:
+        print(f"[bank {bank_id}] ❌ Ошибка API-парсинга: {e}")
+        return None
+
+    if not any(partners for _, _, partners, _ in scraped):
+        return None
+
+    result: List[Dict[str, Any]] = []
+    for category_name, category_url, partners, truncated in scraped:
+        if truncated or not partners:
+            reason = f"лимит {MAX_PAGES} страниц" if truncated else "пустой ответ"
+            print(f"[bank {bank_id}] ⚠️ API: '{category_name}' не сохраняем ({reason}), прежний список остаётся")
+            continue
+        category = {
+            "category_name": category_name,
+            "partners_count": None,
+            "category_url": category_url,
+        }
+        category_id = save_single_category(category, bank_id)
+        save_partners(partners, bank_id, category_id)
+        result.append(category)
+    return result
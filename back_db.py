@@ -1,33 +1,52 @@
 # db_sql.py
 import os
+import json
 import sqlite3
 import datetime
 from typing import Any, Dict, List, Tuple, Optional
 
+import db_migrations
+from db_pool import ConnectionPool
+
 DB_PATH = "banks_backup_20260226_111432.db"
 
+_pool: Optional[ConnectionPool] = None
+
 
 def _conn() -> sqlite3.Connection:
+    """Отдельное короткоживущее соединение (бэкап, разовые операции)."""
     conn = sqlite3.connect(DB_PATH)
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
 
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def _read():
+    """Переиспользуемое соединение для чтения текущего потока."""
+    return get_pool().read()
+
+
+def _write():
+    """Общее соединение для записи (сериализовано, commit в конце блока)."""
+    return get_pool().write()
+
+
 # ---------- BANKS ----------
 def get_banks() -> List[Tuple[int, str, str]]:
     """[(id, name, loyalty_url), ...]"""
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT id, name, loyalty_url FROM banks ORDER BY name;")
         return cur.fetchall()
-    finally:
-        conn.close()
-    print(cur.fetchall())
 
 def get_banks_name(bank_id: int) -> str:
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT name FROM banks WHERE id=?;", (bank_id,))
         result = cur.fetchone() 
@@ -35,13 +54,10 @@ def get_banks_name(bank_id: int) -> str:
         if result:
             return result[0] 
         return None
-    finally:
-        conn.close()
 
 def get_categories(category_id: int) -> Tuple[str, str]:
     """Возвращает (название, ссылку) категории"""
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT name, url FROM categories WHERE id=?;", (category_id,))
         result = cur.fetchone()
@@ -49,28 +65,23 @@ def get_categories(category_id: int) -> Tuple[str, str]:
             name, url = result  # распаковываем кортеж
             return name, url
         return None, None
-    finally:
-        conn.close()
 
 
 def get_all_bank_ids() -> List[int]:
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT id FROM banks;")
         return [r[0] for r in cur.fetchall()]
-    finally:
-        conn.close()
 
 
 
 # ---------- SCRAPER CONFIG ----------
 def fetch_categories_scrape_config(bank_id: int) -> Dict[str, Any]:
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT loyalty_url, cookie, container, element, parser_type
+            SELECT loyalty_url, cookie, container, element, parser_type, wait_strategy, lean_browsing,
+                   scrape_engine
             FROM banks WHERE id=?
         """, (bank_id,))
         row = cur.fetchone()
@@ -82,18 +93,44 @@ def fetch_categories_scrape_config(bank_id: int) -> Dict[str, Any]:
             "container_selector": row[2] or "",
             "element_selector": row[3] or "",
             "parser_type": row[4] or "default",
+            "wait_strategy": row[5] or "",
+            "lean_browsing": row[6] != 0,
+            "scrape_engine": row[7] or "",
         }
-    finally:
-        conn.close()
 
 
 
+def set_bank_scrape_engine(bank_id: int, engine: str) -> None:
+    """Запоминает, каким движком (http / selenium) банк парсится успешно."""
+    with _write() as conn:
+        conn.execute("UPDATE banks SET scrape_engine = ? WHERE id = ?;", (engine, bank_id))
+
+
+def get_bank_api_config(bank_id: int) -> Optional[Dict[str, Any]]:
+    """banks.api_config (JSON-эндпоинт для parser_type='api_json'), None — если не задан."""
+    with _read() as conn:
+        row = conn.execute("SELECT api_config FROM banks WHERE id = ?;", (bank_id,)).fetchone()
+    if not row or not row[0]:
+        return None
+    return json.loads(row[0])
+
+
+def set_bank_api_config(bank_id: int, api_config: Dict[str, Any], activate: bool = False) -> None:
+    """Сохраняет найденный api_discovery конфиг; activate — сразу переключить банк на api_json."""
+    with _write() as conn:
+        conn.execute(
+            "UPDATE banks SET api_config = ? WHERE id = ?;",
+            (json.dumps(api_config, ensure_ascii=False), bank_id),
+        )
+        if activate:
+            conn.execute("UPDATE banks SET parser_type = 'api_json' WHERE id = ?;", (bank_id,))
+
+
 def fetch_partners_scrape_config(bank_id: int) -> Dict[str, Any]:
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT button_more, partners_list, partner_name, partner_bonus, bonus_unit
+            SELECT button_more, partners_list, partner_name, partner_bonus, bonus_unit, wait_strategy
             FROM banks WHERE id=?
         """, (bank_id,))
         row = cur.fetchone()
@@ -105,9 +142,8 @@ def fetch_partners_scrape_config(bank_id: int) -> Dict[str, Any]:
             "partner_name": row[2] or "",
             "partner_bonus": row[3] or "",
             "bonus_unit": row[4] or "",
+            "wait_strategy": row[5] or "",
         }
-    finally:
-        conn.close()
 
 
 def get_today_partner_changes() -> list[dict]:
@@ -115,46 +151,26 @@ def get_today_partner_changes() -> list[dict]:
     since = datetime.datetime.combine(today, datetime.time(0, 0, 0))
     since_str = since.strftime("%Y-%m-%d %H:%M:%S")
 
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
-            WITH latest AS (
-                SELECT
-                    p.bank_id,
-                    p.category_id,
-                    p.partner_name,
-                    p.partner_bonus,
-                    p.partner_link,
-                    p.checked_at,
-                    p.status
-                FROM partners p
-                WHERE p.checked_at = (
-                    SELECT MAX(p2.checked_at)
-                    FROM partners p2
-                    WHERE p2.bank_id = p.bank_id
-                      AND p2.category_id = p.category_id
-                      AND p2.partner_name = p.partner_name
-                )
-            )
             SELECT
                 b.name as bank_name,
-                c.name as category_name,
+                {category_name} as category_name,
                 l.partner_name,
                 l.partner_bonus,
                 l.partner_link,
                 l.checked_at,
                 l.status,
                 b.bonus_unit
-            FROM latest l
+            FROM partners_current l
             JOIN banks b ON b.id = l.bank_id
-            JOIN categories c ON c.id = l.category_id
+            LEFT JOIN categories c ON c.id = l.category_id
             WHERE l.checked_at >= ?
-            ORDER BY b.name, c.name, l.partner_name;
-        """, (since_str,))
+              AND category_name IS NOT NULL
+            ORDER BY b.name, category_name, l.partner_name;
+        """.format(category_name=_CATEGORY_NAME_SQL.format(t="l")), (since_str,))
         rows = cur.fetchall()
-    finally:
-        conn.close()
 
     result: list[dict] = []
     for bank_name, category_name, partner_name, partner_bonus, partner_link, checked_at, status, bonus_unit in rows:
@@ -181,53 +197,29 @@ def get_today_partner_changes() -> list[dict]:
     return result
 
 
-# ---------- TABLE ENSURE ----------
-def ensure_categories_table(conn: Optional[sqlite3.Connection] = None) -> None:
-    close = False
-    if conn is None:
-        conn = _conn()
-        close = True
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            bank_id INTEGER NOT NULL,
-            partners_count INTEGER,
-            checked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            name TEXT NOT NULL,
-            url TEXT NOT NULL,
-            FOREIGN KEY(bank_id) REFERENCES banks(id)
-        );
-    """)
-    conn.commit()
-    if close:
+# ---------- SCHEMA ----------
+def init_db() -> List[int]:
+    """
+    Доводит схему БД до актуальной версии (db_migrations) — один раз при старте.
+    Хендлеры и сохранение после этого выполняют только свои запросы, без
+    CREATE TABLE / ALTER TABLE на каждый вызов.
+    Падает SchemaVersionError, если БД новее, чем знает код.
+    """
+    conn = _conn()
+    try:
+        # шаги миграций нормализуют имена тем же normalize, что и код
+        conn.create_function("normalize_name", 1, normalize, deterministic=True)
+        applied = db_migrations.migrate(conn)
+    finally:
         conn.close()
+    if applied:
+        print(f"✅ Схема БД обновлена до версии {applied[-1]} ({DB_PATH})")
+    return applied
 
 
-def ensure_partners_table(conn: Optional[sqlite3.Connection] = None) -> None:
-    close = False
-    if conn is None:
-        conn = _conn()
-        close = True
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS partners (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            bank_id INTEGER NOT NULL,
-            category_id INTEGER NOT NULL,
-            partner_name TEXT NOT NULL,
-            partner_bonus TEXT,
-            partner_link TEXT,
-            checked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            status TEXT,
-            FOREIGN KEY(bank_id) REFERENCES banks(id),
-            FOREIGN KEY(category_id) REFERENCES categories(id)
-        );
-    """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_partners_bank_cat_name ON partners(bank_id, category_id, partner_name);")
-    conn.commit()
-    if close:
-        conn.close()
+def ensure_status_columns() -> None:
+    """Для /init_status: статусы partners и status_log создаются миграциями."""
+    init_db()
 
 
 # ---------- CATEGORIES ----------
@@ -235,9 +227,7 @@ def save_single_category(category: Dict[str, Any], bank_id: int) -> int:
     """
     Создаёт новую запись категории, если изменились url/partners_count, иначе возвращает id последней.
     """
-    conn = _conn()
-    try:
-        ensure_categories_table(conn)
+    with _write() as conn:
         cur = conn.cursor()
         checked_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -263,18 +253,14 @@ def save_single_category(category: Dict[str, Any], bank_id: int) -> int:
         else:
             category_id = last[0]
 
-        conn.commit()
         return category_id
-    finally:
-        conn.close()
 
 
 def get_latest_categories_by_bank(bank_id: int) -> List[Tuple[int, str, str]]:
     """
     [(category_id, name, url), ...] — только последние версии категорий по имени.
     """
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT c.id, c.name, c.url
@@ -289,181 +275,494 @@ def get_latest_categories_by_bank(bank_id: int) -> List[Tuple[int, str, str]]:
             ORDER BY c.name;
         """, (bank_id, bank_id))
         return cur.fetchall()
-    finally:
-        conn.close()
 
 
 # ---------- PARTNERS ----------
-def save_partners(partners: List[Dict[str, Any]], bank_id: int, category_id: int) -> None:
-    conn = _conn()
-    try:
-        ensure_partners_table(conn)
-        cur = conn.cursor()
-        checked_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def save_partners(
+    partners: List[Dict[str, Any]],
+    bank_id: int,
+    category_id: int,
+    bulk: bool = True,
+) -> None:
+    """
+    Сверяет свежий список партнёров категории с историей и проставляет статусы:
+    new — новый партнёр, live — есть и сейчас, ready — промежуточный,
+    new_delete — пропал в этом прогоне, delete — пропал и в следующем.
 
-        cur.execute("""
-            UPDATE partners
-            SET status = 'ready'
-            WHERE bank_id = ? AND category_id = ?
-              AND status IN ('new', 'live')
-        """, (bank_id, category_id))
+    bulk=True — пакетная сверка через временные таблицы (несколько
+    set-based запросов на категорию), bulk=False — прежняя построчная.
+    """
+    with _write() as conn:
+        _save_partners(conn.cursor(), partners, bank_id, category_id, bulk)
 
-        # проверка - партнер точно ли удален партнер status -> delete
-        cur.execute("""
-            UPDATE partners
-            SET status = 'delete'
-            WHERE bank_id = ? AND category_id = ?
-              AND status = 'new_delete'
-        """, (bank_id, category_id))
 
-        current_names: set[str] = set()
+def _save_partners(
+    cur: sqlite3.Cursor,
+    partners: List[Dict[str, Any]],
+    bank_id: int,
+    category_id: int,
+    bulk: bool = True,
+) -> None:
+    checked_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        for p in partners:
-            
-            bank = p.get("bank_id")
-            category = p.get("category_id")
-            
+    cur.execute("""
+        UPDATE partners
+        SET status = 'ready'
+        WHERE bank_id = ? AND category_id = ?
+          AND status IN ('new', 'live')
+    """, (bank_id, category_id))
 
-            bonus = p.get("partner_bonus")
-            link = p.get("partner_link")
-            name = p["partner_name"]
-            current_names.add(name)
-            # 🚫 Пропускаем, если бонус пустой
-            #if not bonus or str(bonus).strip() == "":
-            #    continue
+    # проверка - партнер точно ли удален партнер status -> delete
+    cur.execute("""
+        UPDATE partners
+        SET status = 'delete'
+        WHERE bank_id = ? AND category_id = ?
+          AND status = 'new_delete'
+    """, (bank_id, category_id))
+
+    if bulk:
+        _reconcile_partners_bulk(cur, partners, bank_id, category_id, checked_at)
+    else:
+        _reconcile_partners_rowwise(cur, partners, bank_id, category_id, checked_at)
 
-            # 🚫 Пропускаем, если ссылки нет или она пустая
-            #if not link or str(link).strip() == "":
-            #    continue
+    # проверка на удаление партнера status -> new_delete
+    cur.execute("""
+        UPDATE partners
+        SET status = 'new_delete'
+        WHERE bank_id = ? AND category_id = ?
+        AND status = 'ready'
+    """, (bank_id, category_id))
 
-            # link иногда = None → подстрахуемся
-            link = link.strip() if isinstance(link, str) else ""
+    cur.execute("""
+        UPDATE partners SET last_confirmed_at = ?
+        WHERE bank_id = ? AND category_id = ? AND status IN ('new', 'live')
+    """, (checked_at, bank_id, category_id))
 
-            # Проверяем последнюю запись
-            cur.execute("""
-                SELECT partner_bonus, partner_link, bank_id, category_id, partner_name, id
-                FROM partners
-                WHERE bank_id=? AND category_id=? AND partner_name=? 
-                        AND COALESCE(NULLIF(TRIM(partner_bonus),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
-                        AND COALESCE(NULLIF(TRIM(partner_link),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
-                        AND status = 'ready'
-                ORDER BY checked_at DESC
-                LIMIT 1
-            """, (bank_id, category_id, name, bonus, link))
-
-            last = cur.fetchone()
-
-            # Изменилось? → сохраняем
-            
-
-            
-            if last is None:# or last[0] != bonus or last[1] != link:
-                status = "new" #новая
-                cur.execute("""
-                    INSERT INTO partners (bank_id, category_id, partner_name, partner_bonus, partner_link, checked_at, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (bank_id, category_id, name, bonus, link, checked_at, status))
-
-            else:
-                # есть ли партнер по такой же ссылке?
-                cur.execute("""
-                SELECT partner_bonus, partner_link, bank_id, category_id, partner_name, id
-                FROM partners
-                WHERE bank_id=? AND category_id=? AND partner_name=? 
-                        AND COALESCE(NULLIF(TRIM(partner_link),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
-                        AND status = 'ready'
-                ORDER BY checked_at DESC
-                LIMIT 1
-                """, (bank_id, category_id, name, link))
+    _refresh_partners_current(cur, bank_id, category_id)
 
-                previous  = cur.fetchone()
 
-                # если бонус другой
-                if previous[0] != bonus:# другой бонус # неправильная проверка
-                    cur.execute(
-                        """
-                        UPDATE partners
-                        SET partner_bonus = ?,
-                            checked_at = ?, status = 'live'
-                        WHERE id = ?
-                        """,
-                        (bonus, checked_at, previous[5])
-                    )
-                else: # та же запись
-                    cur.execute(#ready
-                        """
-                        UPDATE partners
-                        SET status = 'live'
-                        WHERE id = ?
-                        """,
-                        (last[5],)
-                    )
+def _clean_link(link: Any) -> str:
+    # link иногда = None → подстрахуемся
+    return link.strip() if isinstance(link, str) else ""
 
 
+def _reconcile_partner_row(
+    cur: sqlite3.Cursor,
+    bank_id: int,
+    category_id: int,
+    name: str,
+    bonus: Any,
+    link: str,
+    checked_at: str,
+) -> bool:
+    """
+    Сверяет одного партнёра с последними 'ready'-записями.
+    Возвращает True, если нужна новая запись со статусом new.
+    """
+    # Проверяем последнюю запись
+    cur.execute("""
+        SELECT partner_bonus, partner_link, bank_id, category_id, partner_name, id
+        FROM partners
+        WHERE bank_id=? AND category_id=? AND partner_name=? 
+                AND COALESCE(NULLIF(TRIM(partner_bonus),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
+                AND COALESCE(NULLIF(TRIM(partner_link),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
+                AND status = 'ready'
+        ORDER BY checked_at DESC, id DESC
+        LIMIT 1
+    """, (bank_id, category_id, name, bonus, link))
 
+    last = cur.fetchone()
 
+    if last is None:
+        return True
 
-        placeholders = ",".join("?" for _ in current_names)
-        base_params = [checked_at, bank_id, category_id, *current_names]
+    # есть ли партнер по такой же ссылке?
+    cur.execute("""
+    SELECT partner_bonus, partner_link, bank_id, category_id, partner_name, id
+    FROM partners
+    WHERE bank_id=? AND category_id=? AND partner_name=? 
+            AND COALESCE(NULLIF(TRIM(partner_link),''),'') = COALESCE(NULLIF(TRIM(?),''),'')
+            AND status = 'ready'
+    ORDER BY checked_at DESC, id DESC
+    LIMIT 1
+    """, (bank_id, category_id, name, link))
 
-        # проверка на удаление партнера status -> new_delete
+    previous  = cur.fetchone()
 
-        # убрать массив
+    # если бонус другой
+    if previous[0] != bonus:# другой бонус
+        cur.execute(
+            """
+            UPDATE partners
+            SET partner_bonus = ?,
+                checked_at = ?, status = 'live'
+            WHERE id = ?
+            """,
+            (bonus, checked_at, previous[5])
+        )
+    else: # та же запись
+        cur.execute(
+            """
+            UPDATE partners
+            SET status = 'live'
+            WHERE id = ?
+            """,
+            (last[5],)
+        )
+    return False
+
+
+_INSERT_NEW_PARTNER = """
+    INSERT INTO partners (bank_id, category_id, partner_name, partner_bonus, partner_link, checked_at, status, name_norm)
+    VALUES (?, ?, ?, ?, ?, ?, 'new', ?)
+"""
+
+
+def _reconcile_partners_rowwise(
+    cur: sqlite3.Cursor,
+    partners: List[Dict[str, Any]],
+    bank_id: int,
+    category_id: int,
+    checked_at: str,
+) -> None:
+    """Построчная сверка: до двух SELECT и один INSERT/UPDATE на партнёра."""
+    for p in partners:
+        name = p["partner_name"]
+        bonus = p.get("partner_bonus")
+        link = _clean_link(p.get("partner_link"))
+
+        if _reconcile_partner_row(cur, bank_id, category_id, name, bonus, link, checked_at):
+            cur.execute(
+                _INSERT_NEW_PARTNER,
+                (bank_id, category_id, name, bonus, link, checked_at, normalize(name)),
+            )
 
-        #cur.execute(f"""
-        #    UPDATE partners
-        #    SET status = 'new_delete', checked_at = ?
-        #    WHERE bank_id = ? AND category_id = ?
-        #    AND status = 'ready'
-        #""", (checked_at, bank_id, category_id))
 
-        cur.execute(f"""
-            UPDATE partners
-            SET status = 'new_delete'
+def _reconcile_partners_bulk(
+    cur: sqlite3.Cursor,
+    partners: List[Dict[str, Any]],
+    bank_id: int,
+    category_id: int,
+    checked_at: str,
+) -> None:
+    """
+    Пакетная сверка с теми же правилами, что и построчная.
+
+    Партнёры с одинаковыми (имя, ссылка) влияют только на 'ready'-записи
+    с этими же (имя, ссылка), поэтому уникальные пары сверяются
+    несколькими set-based запросами. Повторы пары внутри одного списка
+    зависят от порядка — их (обычно единицы) прогоняем построчно.
+    Новые строки вставляются в конце в исходном порядке списка.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_partners (
+            pos INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            name_norm TEXT,
+            bonus,
+            link TEXT,
+            nb TEXT,
+            nl TEXT,
+            prev_id INTEGER,
+            action TEXT
+        );
+    """)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS ready_partners (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            bonus,
+            checked_at,
+            nb TEXT,
+            nl TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS temp.idx_ready_partners_name ON ready_partners(name, nl, nb);")
+    cur.execute("DELETE FROM temp.incoming_partners;")
+    cur.execute("DELETE FROM temp.ready_partners;")
+
+    rows = []
+    for pos, p in enumerate(partners):
+        bonus = p.get("partner_bonus")
+        link = _clean_link(p.get("partner_link"))
+        name = p["partner_name"]
+        rows.append((pos, name, normalize(name), bonus, link, bonus, link))
+    cur.executemany("""
+        INSERT INTO temp.incoming_partners (pos, name, name_norm, bonus, link, nb, nl)
+        VALUES (?, ?, ?, ?, ?,
+                COALESCE(NULLIF(TRIM(?),''),''),
+                COALESCE(NULLIF(TRIM(?),''),''))
+    """, rows)
+
+    cur.execute("""
+        INSERT INTO temp.ready_partners (id, name, bonus, checked_at, nb, nl)
+        SELECT id, partner_name, partner_bonus, checked_at,
+               COALESCE(NULLIF(TRIM(partner_bonus),''),''),
+               COALESCE(NULLIF(TRIM(partner_link),''),'')
+        FROM partners
+        WHERE bank_id = ? AND category_id = ? AND status = 'ready'
+    """, (bank_id, category_id))
+
+    # повторяющиеся (имя, ссылка) — отдельно
+    cur.execute("""
+        UPDATE temp.incoming_partners SET action = 'dup'
+        WHERE (name, nl) IN (
+            SELECT name, nl FROM temp.incoming_partners
+            GROUP BY name, nl HAVING COUNT(*) > 1
+        )
+    """)
+
+    # нет 'ready'-записи с тем же бонусом и ссылкой → новый партнёр
+    cur.execute("""
+        UPDATE temp.incoming_partners SET action = 'insert'
+        WHERE action IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM temp.ready_partners r
+              WHERE r.name = incoming_partners.name
+                AND r.nl = incoming_partners.nl
+                AND r.nb = incoming_partners.nb
+          )
+    """)
+
+    # иначе — последняя 'ready'-запись с той же ссылкой
+    cur.execute("""
+        UPDATE temp.incoming_partners
+        SET action = 'match',
+            prev_id = (
+                SELECT r.id FROM temp.ready_partners r
+                WHERE r.name = incoming_partners.name
+                  AND r.nl = incoming_partners.nl
+                ORDER BY r.checked_at DESC, r.id DESC
+                LIMIT 1
+            )
+        WHERE action IS NULL
+    """)
+
+    # бонус изменился → обновляем бонус и дату
+    cur.execute("""
+        UPDATE partners
+        SET partner_bonus = (
+                SELECT i.bonus FROM temp.incoming_partners i
+                WHERE i.action = 'match' AND i.prev_id = partners.id
+            ),
+            checked_at = ?
+        WHERE id IN (
+            SELECT i.prev_id
+            FROM temp.incoming_partners i
+            JOIN temp.ready_partners r ON r.id = i.prev_id
+            WHERE i.action = 'match' AND r.bonus IS NOT i.bonus
+        )
+    """, (checked_at,))
+    cur.execute("""
+        UPDATE partners SET status = 'live'
+        WHERE id IN (SELECT prev_id FROM temp.incoming_partners WHERE action = 'match')
+    """)
+
+    cur.execute("SELECT pos, name, bonus, link FROM temp.incoming_partners WHERE action = 'dup' ORDER BY pos")
+    dup_inserts = [
+        (pos,)
+        for pos, name, bonus, link in cur.fetchall()
+        if _reconcile_partner_row(cur, bank_id, category_id, name, bonus, link, checked_at)
+    ]
+    cur.executemany("UPDATE temp.incoming_partners SET action = 'insert' WHERE pos = ?", dup_inserts)
+
+    cur.execute("""
+        INSERT INTO partners (bank_id, category_id, partner_name, partner_bonus, partner_link, checked_at, status, name_norm)
+        SELECT ?, ?, name, bonus, link, ?, 'new', name_norm
+        FROM temp.incoming_partners
+        WHERE action = 'insert'
+        ORDER BY pos
+    """, (bank_id, category_id, checked_at))
+
+
+def _refresh_partners_current(cur: sqlite3.Cursor, bank_id: int, category_id: int) -> None:
+    """Переносит в partners_current последние версии партнёров одной категории."""
+    cur.execute("""
+        DELETE FROM partners_fts
+        WHERE rowid IN (
+            SELECT partner_id FROM partners_current
             WHERE bank_id = ? AND category_id = ?
-            AND status = 'ready'
-        """, (bank_id, category_id))
+        );
+    """, (bank_id, category_id))
+    cur.execute(
+        "DELETE FROM partners_current WHERE bank_id = ? AND category_id = ?;",
+        (bank_id, category_id),
+    )
+    cur.execute("""
+        INSERT INTO partners_current (
+            partner_id, bank_id, category_id, partner_name,
+            partner_bonus, partner_link, checked_at, status, name_norm
+        )
+        SELECT id, bank_id, category_id, partner_name,
+               partner_bonus, partner_link, checked_at, status, name_norm
+        FROM (
+            SELECT p.*,
+                   MAX(checked_at) OVER (PARTITION BY partner_name) AS max_checked
+            FROM partners p
+            WHERE bank_id = ? AND category_id = ?
+        )
+        WHERE checked_at = max_checked;
+    """, (bank_id, category_id))
+    cur.execute("""
+        INSERT INTO partners_fts(rowid, name_norm)
+        SELECT partner_id, name_norm FROM partners_current
+        WHERE bank_id = ? AND category_id = ?;
+    """, (bank_id, category_id))
 
 
-        conn.commit()
-    finally:
-        conn.close()
+def rebuild_partners_current() -> int:
+    """
+    Полностью пересобирает partners_current (и partners_fts) из истории partners.
+    Разовая команда после обновления: python back_db.py backfill-current
+    (сама применяет миграции, если БД ещё не обновлена).
+    """
+    with _write() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM partners_current;")
+        cur.execute("""
+            INSERT INTO partners_current (
+                partner_id, bank_id, category_id, partner_name,
+                partner_bonus, partner_link, checked_at, status, name_norm
+            )
+            SELECT id, bank_id, category_id, partner_name,
+                   partner_bonus, partner_link, checked_at, status, name_norm
+            FROM (
+                SELECT p.*,
+                       MAX(checked_at) OVER (
+                           PARTITION BY bank_id, category_id, partner_name
+                       ) AS max_checked
+                FROM partners p
+            )
+            WHERE checked_at = max_checked;
+        """)
+        n = cur.rowcount
+        cur.execute("DELETE FROM partners_fts;")
+        cur.execute("""
+            INSERT INTO partners_fts(rowid, name_norm)
+            SELECT partner_id, name_norm FROM partners_current;
+        """)
+        return n
+
+
+# ---------- SHARED PARTNERS ----------
+# Банки, у которых один партнёр встречается в нескольких категориях (Кактус):
+# партнёр хранится и сверяется один раз с category_id = 0, а категории,
+# в которых он есть, — в partner_categories (bank_id, category_id, name_norm).
+SHARED_CATEGORY_ID = 0
+
+# Имя категории записи partners_current {t}: своя категория или, для
+# общих партнёров, категории из partner_categories через запятую.
+_CATEGORY_NAME_SQL = """COALESCE(c.name, (
+    SELECT group_concat(mc.name, ', ')
+    FROM partner_categories m
+    JOIN categories mc ON mc.id = m.category_id
+    WHERE m.bank_id = {t}.bank_id AND m.name_norm = {t}.name_norm
+))"""
+
+
+def save_shared_partners(
+    partners: List[Dict[str, Any]],
+    bank_id: int,
+    memberships: List[Tuple[int, str]],
+) -> None:
+    """
+    Сохраняет уникальных партнёров банка одной сверкой (category_id = 0)
+    и целиком заменяет их принадлежность к категориям.
+
+    partners — уже без повторов по имени; memberships — [(category_id, partner_name), ...].
+    Записи, сохранённые раньше по отдельным категориям, уходят в 'delete' —
+    теперь их заменяет общий список. При первом переходе общий список
+    засевается из них (status 'live', прежний checked_at), чтобы в дайджест
+    не попали как «новые» давно известные партнёры.
+    """
+    with _write() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO partners (bank_id, category_id, partner_name, partner_bonus,
+                                  partner_link, checked_at, status, name_norm)
+            SELECT bank_id, ?, partner_name, partner_bonus,
+                   partner_link, MAX(checked_at), 'live', name_norm
+            FROM partners_current
+            WHERE bank_id = ? AND category_id != ? AND status IN ('new','live')
+              AND NOT EXISTS (SELECT 1 FROM partners WHERE bank_id = ? AND category_id = ?)
+            GROUP BY partner_name;
+        """, (SHARED_CATEGORY_ID, bank_id, SHARED_CATEGORY_ID, bank_id, SHARED_CATEGORY_ID))
+        _save_partners(cur, partners, bank_id, SHARED_CATEGORY_ID)
+
+        cur.execute("DELETE FROM partner_categories WHERE bank_id = ?;", (bank_id,))
+        cur.executemany(
+            "INSERT OR IGNORE INTO partner_categories (bank_id, category_id, name_norm) VALUES (?, ?, ?);",
+            [(bank_id, category_id, normalize(name)) for category_id, name in memberships],
+        )
+
+        cur.execute("""
+            SELECT DISTINCT category_id FROM partners
+            WHERE bank_id = ? AND category_id != ? AND status != 'delete';
+        """, (bank_id, SHARED_CATEGORY_ID))
+        legacy = [row[0] for row in cur.fetchall()]
+        if legacy:
+            cur.execute("""
+                UPDATE partners SET status = 'delete'
+                WHERE bank_id = ? AND category_id != ? AND status != 'delete';
+            """, (bank_id, SHARED_CATEGORY_ID))
+            for category_id in legacy:
+                _refresh_partners_current(cur, bank_id, category_id)
+
+
+def get_shared_category_partners(bank_id: int, category_name: str) -> List[Dict[str, Any]]:
+    """
+    Актуальные общие партнёры, которые в прошлый раз были в категории
+    category_name, — чтобы не потерять их, если категорию не удалось прочитать.
+    """
+    with _read() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT p.partner_name, p.partner_bonus, p.partner_link
+            FROM partner_categories m
+            JOIN categories c ON c.id = m.category_id
+            JOIN partners_current p
+              ON p.bank_id = m.bank_id AND p.category_id = ? AND p.name_norm = m.name_norm
+            WHERE m.bank_id = ? AND c.name = ?
+              AND p.status IN ('new','live')
+            ORDER BY p.partner_name;
+        """, (SHARED_CATEGORY_ID, bank_id, category_name))
+        return [
+            {"partner_name": name, "partner_bonus": bonus, "partner_link": link}
+            for name, bonus, link in cur.fetchall()
+        ]
 
 
 def get_partners_latest_by_bank_category(bank_id: int, category_id: int) -> List[Tuple[str, Optional[str], Optional[str]]]:
-    conn = _conn()
-    try:
+    """Партнёры категории — свои и общие (category_id = 0), отмеченные в partner_categories."""
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT partner_name, partner_bonus, partner_link
-            FROM partners p
-            WHERE bank_id = ? AND category_id = ?
-            AND checked_at = (
-                SELECT MAX(p2.checked_at)
-                FROM partners p2
-                WHERE p2.bank_id = p.bank_id
-                    AND p2.category_id = p.category_id
-                    AND p2.partner_name = p.partner_name
+            FROM partners_current
+            WHERE bank_id = ?
+            AND (
+                category_id = ?
+                OR (category_id = 0 AND name_norm IN (
+                    SELECT name_norm FROM partner_categories
+                    WHERE bank_id = ? AND category_id = ?
+                ))
             )
             AND status IN ('new','live')
             ORDER BY partner_name;
-        """, (bank_id, category_id))
+        """, (bank_id, category_id, bank_id, category_id))
         return cur.fetchall()
-    finally:
-        conn.close()
 
 def debug_show_akv():
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, partner_name, status, checked_at
-        FROM partners
-        WHERE LOWER(partner_name) LIKE '%акв%'
-        ORDER BY partner_name
-        LIMIT 10;
-    """)
-    print("DEBUG LIKE akv:", cur.fetchall())
-    conn.close()
+    with _read() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, partner_name, status, checked_at
+            FROM partners
+            WHERE LOWER(partner_name) LIKE '%акв%'
+            ORDER BY partner_name
+            LIMIT 10;
+        """)
+        print("DEBUG LIKE akv:", cur.fetchall())
 
 
 def normalize(text: str) -> str:
@@ -480,41 +779,106 @@ def normalize(text: str) -> str:
     )
 
 
-def search_partners(query: str):
-    conn = _conn()
-    try:
-        cur = conn.cursor()
+SEARCH_LIMIT = 50
 
-        q = normalize(query)
-        if not q:
-            return []
 
-        cur.execute("""
+def search_partners(query: str, limit: int = SEARCH_LIMIT):
+    """
+    Поиск партнёра по подстроке имени через partners_fts.
+    Сначала точные совпадения, затем по началу имени, затем по рангу bm25.
+    Запросы короче триграммы индекс не берёт — для них та же подстрока
+    через instr() по именам из partners_fts (таблица небольшая, полный проход).
+    [(bank_name, category_name, partner_name, partner_bonus, bonus_unit, partner_link), ...]
+    """
+    q = normalize(query)
+    if not q:
+        return []
+
+    if len(q) < 3:
+        where = "instr(f.name_norm, ?) > 0"
+        order = "length(f.name_norm), b.name"
+        match = q
+    else:
+        where = "partners_fts MATCH ?"
+        order = "f.rank"
+        match = '"' + q.replace('"', '""') + '"'
+
+    with _read() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
             SELECT 
                 b.name,
-                COALESCE(c.name, 'Без категории'),
+                COALESCE({_CATEGORY_NAME_SQL.format(t="p")}, 'Без категории'),
                 p.partner_name,
                 p.partner_bonus,
                 b.bonus_unit,
                 p.partner_link
-            FROM partners p
+            FROM partners_fts f
+            JOIN partners_current p ON p.partner_id = f.rowid
             JOIN banks b ON b.id = p.bank_id
             LEFT JOIN categories c ON c.id = p.category_id
-            WHERE p.status NOT IN ('delete', 'new_delete')
-        """)
+            WHERE {where}
+              AND p.status NOT IN ('delete', 'new_delete')
+            ORDER BY f.name_norm = ? DESC,
+                     instr(f.name_norm, ?) = 1 DESC,
+                     {order}
+            LIMIT ?
+        """, (match, q, q, limit))
+        return cur.fetchall()
 
-        results = []
 
-        for row in cur.fetchall():
-            partner_name = normalize(row[2])
+def search_partners_prefix(query: str, limit: int = SEARCH_LIMIT):
+    """
+    Точный поиск и поиск по началу имени — seek по индексу partners(name_norm, bank_id).
+    Формат строк как у search_partners.
+    """
+    q = normalize(query)
+    if not q:
+        return []
 
-            if q in partner_name:
-                results.append(row)
+    with _read() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT 
+                b.name,
+                COALESCE({_CATEGORY_NAME_SQL.format(t="pc")}, 'Без категории'),
+                pc.partner_name,
+                pc.partner_bonus,
+                b.bonus_unit,
+                pc.partner_link
+            FROM partners p
+            JOIN partners_current pc ON pc.partner_id = p.id
+            JOIN banks b ON b.id = pc.bank_id
+            LEFT JOIN categories c ON c.id = pc.category_id
+            WHERE p.name_norm >= ? AND p.name_norm < ?
+              AND pc.status NOT IN ('delete', 'new_delete')
+            ORDER BY p.name_norm = ? DESC, length(p.name_norm), b.name
+            LIMIT ?
+        """, (q, q + "\U0010ffff", q, limit))
+        return cur.fetchall()
 
-        return results
 
-    finally:
-        conn.close()
+def find_same_merchant(partner_name: str) -> List[Tuple[str, str, Optional[str], Optional[str], Optional[str]]]:
+    """
+    Тот же продавец в других банках: актуальные записи с тем же name_norm.
+    [(bank_name, partner_name, partner_bonus, bonus_unit, partner_link), ...]
+    """
+    q = normalize(partner_name)
+    if not q:
+        return []
+
+    with _read() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT b.name, pc.partner_name, pc.partner_bonus, b.bonus_unit, pc.partner_link
+            FROM partners p
+            JOIN partners_current pc ON pc.partner_id = p.id
+            JOIN banks b ON b.id = pc.bank_id
+            WHERE p.name_norm = ?
+              AND pc.status IN ('new', 'live')
+            ORDER BY b.name;
+        """, (q,))
+        return cur.fetchall()
 
 
 
@@ -522,10 +886,9 @@ def search_partners_latest(query: str) -> List[Tuple[str, str, str, Optional[str
     """
     Возвращает:
     (bank_name, category_name, partner_name, partner_bonus, bonus_unit, partner_link)
-    только с последней версией по каждой паре (bank_id, category_id).
+    только с последней версией по каждой паре (bank_id, category_id) — из partners_current.
     """
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT b.name as bank_name,
@@ -534,89 +897,52 @@ def search_partners_latest(query: str) -> List[Tuple[str, str, str, Optional[str
                 p.partner_bonus,
                 b.bonus_unit,
                 p.partner_link
-            FROM partners p
+            FROM partners_current p
             JOIN banks b ON p.bank_id = b.id
             JOIN categories c ON p.category_id = c.id
             WHERE p.partner_name LIKE ?
-            AND p.checked_at = (
-                SELECT MAX(p2.checked_at)
-                FROM partners p2
-                WHERE p2.bank_id = p.bank_id
-                    AND p2.category_id = p.category_id
-                    AND p2.partner_name = p.partner_name
-            )
             AND p.status IN ('new','live')
             ORDER BY b.name, c.name, p.partner_name;
         """, (f"%{query}%",))
         return cur.fetchall()
-    finally:
-        conn.close()
 
 
 def get_partner_counts_by_bank(bank_id: int) -> list[tuple]:
-    conn = _conn()
-    cur = conn.cursor()
-
-    if bank_id == 13:
-        # Кактус: уникальные партнёры по имени
-        cur.execute("""
-            SELECT c.name AS category_name,
-                   COUNT(DISTINCT p.partner_name) AS partners_unique
-            FROM partners p
-            JOIN categories c ON c.id = p.category_id
-            WHERE p.bank_id = 13
-              AND p.status IN ('new','live')
-            GROUP BY c.name
-            ORDER BY partners_unique DESC;
-        """)
-        rows = cur.fetchall()
-        return [(row[0], row[1]) for row in rows]
-
-    elif bank_id in (1, 2):  # Белкарт и БНБ – без категорий
-        cur.execute("""
-            SELECT 'Все партнёры' AS category_name,
-                   COUNT(DISTINCT p.partner_name) AS partners_count
-            FROM partners p
-            WHERE p.bank_id = ?
-              AND p.status IN ('new','live');
-        """, (bank_id,))
-        rows = cur.fetchall()
-        return [(row[0], row[1]) for row in rows if row[1] > 0]
-
-    else:
-        # остальные банки с реальными категориями
+    """
+    [(category_name, partners_count), ...] — уникальные партнёры по категориям.
+    Общие партнёры (category_id = 0) считаются в категориях из partner_categories,
+    а без них (банки без категорий) — в «Все партнёры».
+    """
+    with _read() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            SELECT c.name AS category_name,
+            SELECT COALESCE(c.name, 'Все партнёры') AS category_name,
                    COUNT(DISTINCT p.partner_name) AS partners_count
             FROM partners p
-            JOIN categories c ON c.id = p.category_id
+            LEFT JOIN partner_categories m
+              ON p.category_id = 0 AND m.bank_id = p.bank_id AND m.name_norm = p.name_norm
+            LEFT JOIN categories c ON c.id = COALESCE(m.category_id, p.category_id)
             WHERE p.bank_id = ?
               AND p.status IN ('new','live')
-            GROUP BY c.name
+            GROUP BY category_name
             ORDER BY partners_count DESC;
         """, (bank_id,))
-        rows = cur.fetchall()
-        return [(row[0], row[1]) for row in rows]
-
+        return [(row[0], row[1]) for row in cur.fetchall()]
 
 
 def get_bank_name(bank_id: int) -> str:
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT name FROM banks WHERE id=?;", (bank_id,))
         row = cur.fetchone()
         return row[0] if row else f"bank_id={bank_id}"
-    finally:
-        conn.close()
 
 
 def get_partner_counts()-> List[Tuple[str, int]]:
     """
     [(bank_name, partners_count), ...] — подсчёт партнёров по банкам для графика (DESC).
     """
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT b.name, COUNT(p.partner_name) AS partner_cnt
@@ -626,8 +952,6 @@ def get_partner_counts()-> List[Tuple[str, int]]:
             ORDER BY partner_cnt DESC, b.name ASC;
         """)
         return cur.fetchall()
-    finally:
-        conn.close()
 
 
 def backup_database(dest_dir: str = ".", filename: str | None = None) -> str:
@@ -662,8 +986,7 @@ def backup_database(dest_dir: str = ".", filename: str | None = None) -> str:
 
 def get_test_digest_data():
     """Возвращает тестовые данные для статичного дайджеста"""
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         
         # Берем последние 50 партнеров из БД как статичные данные
@@ -702,47 +1025,326 @@ def get_test_digest_data():
             })
         
         return changes
-        
-    finally:
-        conn.close()
 
-# ---------- TELEGRAM USERS ----------
+# ---------- HTTP CACHE ----------
+def get_http_cache(url: str) -> Optional[Dict[str, Any]]:
+    with _read() as conn:
+        row = conn.execute("""
+            SELECT etag, last_modified, content_hash, body, size, parse_ms, meta
+            FROM http_cache WHERE url = ?;
+        """, (url,)).fetchone()
+    if not row:
+        return None
+    return {
+        "etag": row[0],
+        "last_modified": row[1],
+        "content_hash": row[2],
+        "body": row[3],
+        "size": row[4] or 0,
+        "parse_ms": row[5] or 0.0,
+        "meta": json.loads(row[6]) if row[6] else {},
+    }
+
+
+def put_http_cache(rows: List[Dict[str, Any]]) -> None:
+    """rows: [{url, etag, last_modified, content_hash, body, size, parse_ms, meta}]."""
+    with _write() as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO http_cache
+                (url, etag, last_modified, content_hash, body, size, parse_ms, meta, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, [
+            (
+                r["url"], r.get("etag"), r.get("last_modified"), r.get("content_hash"),
+                r.get("body"), r.get("size") or 0, r.get("parse_ms") or 0.0,
+                json.dumps(r["meta"], ensure_ascii=False) if r.get("meta") else None,
+            )
+            for r in rows
+        ])
+
 
-def ensure_tg_users_table() -> None:
+def confirm_partners(bank_id: int, category_id: int) -> int:
     """
-    Гарантируем, что таблица tg_users существует.
-    Хранит chat_id всех, кому потом можно отправлять утренний дайджест.
+    Страница не изменилась — партнёры категории по-прежнему на месте:
+    обновляем только last_confirmed_at, status и checked_at не трогаем.
     """
-    conn = _conn()
-    try:
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _write() as conn:
+        cur = conn.execute("""
+            UPDATE partners SET last_confirmed_at = ?
+            WHERE bank_id = ? AND category_id = ? AND status IN ('new', 'live')
+        """, (now, bank_id, category_id))
+        return cur.rowcount
+
+
+# ---------- LLM CACHE ----------
+def get_llm_cache(keys: List[str], ttl_days: int) -> Dict[str, Dict[str, Any]]:
+    """{key: {"company", "bonus"}} для найденных ключей не старше ttl_days."""
+    found: Dict[str, Dict[str, Any]] = {}
+    with _read() as conn:
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"""
+                SELECT key, company, bonus FROM llm_cache
+                WHERE key IN ({",".join("?" * len(chunk))})
+                  AND created_at >= datetime('now', ?)
+                """,
+                (*chunk, f"-{int(ttl_days)} days"),
+            ).fetchall()
+            for key, company, bonus in rows:
+                found[key] = {"company": company, "bonus": bonus}
+    return found
+
+
+def put_llm_cache(prompt_version: str, rows: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+    """rows: [(key, raw_text, {"company", "bonus"})] — перезаписывает с новой датой."""
+    with _write() as conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO llm_cache (key, prompt_version, raw_text, company, bonus, created_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            [(key, prompt_version, text, data.get("company"), data.get("bonus")) for key, text, data in rows],
+        )
+
+
+# ---------- SCRAPE SCHEDULE ----------
+_SCHEDULE_COLUMNS = (
+    "bank_id", "change_rate", "interval_hours", "next_run_at", "last_started_at",
+    "last_finished_at", "last_status", "last_changes", "runs",
+)
+
+
+def get_scrape_schedule() -> Dict[int, Dict[str, Any]]:
+    """{bank_id: {change_rate, interval_hours, next_run_at, ...}} — состояние планировщика."""
+    with _read() as conn:
+        rows = conn.execute(f"SELECT {', '.join(_SCHEDULE_COLUMNS)} FROM scrape_schedule;").fetchall()
+    return {row[0]: dict(zip(_SCHEDULE_COLUMNS, row)) for row in rows}
+
+
+def save_scrape_schedule(entry: Dict[str, Any]) -> None:
+    with _write() as conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO scrape_schedule ({', '.join(_SCHEDULE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in _SCHEDULE_COLUMNS)});",
+            tuple(entry.get(col) for col in _SCHEDULE_COLUMNS),
+        )
+
+
+def get_bank_change_days(window_days: int) -> Dict[int, int]:
+    """
+    {bank_id: число дней за последние window_days, в которые у банка были
+    изменения} — новые партнёры и смена бонуса (обе пишут checked_at).
+    """
+    with _read() as conn:
+        rows = conn.execute("""
+            SELECT bank_id, COUNT(DISTINCT date(checked_at))
+            FROM partners
+            WHERE checked_at >= datetime('now', 'localtime', ?)
+            GROUP BY bank_id;
+        """, (f"-{int(window_days)} days",)).fetchall()
+    return {bank_id: days for bank_id, days in rows}
+
+
+def count_partner_changes(bank_id: int, since: str) -> int:
+    """Сколько записей партнёров банка появилось или изменилось начиная с since."""
+    with _read() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM partners WHERE bank_id = ? AND checked_at >= ?;",
+            (bank_id, since),
+        ).fetchone()
+    return row[0] if row else 0
+
+
+# ---------- SCRAPE RUNS ----------
+# Задачи прогона: банк (category_name = '') и категории банка.
+# state: pending → running → done | failed; running в незавершённом
+# прогоне после рестарта значит «оборвалось» и выполняется заново.
+_TASK_COLUMNS = (
+    "bank_id", "category_name", "state", "attempts",
+    "started_at", "finished_at", "duration_s", "error",
+)
+
+
+def create_scrape_run(kind: str, bank_ids: List[int]) -> int:
+    with _write() as conn:
+        cur = conn.cursor()
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cur.execute(
+            "INSERT INTO scrape_runs (kind, status, started_at, tasks_total) VALUES (?, 'running', ?, ?);",
+            (kind, now, len(bank_ids)),
+        )
+        run_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO scrape_tasks (run_id, bank_id, category_name, state) VALUES (?, ?, '', 'pending');",
+            [(run_id, bank_id) for bank_id in bank_ids],
+        )
+        return run_id
+
+
+def get_scrape_run(run_id: Optional[int] = None, kind: Optional[str] = None,
+                   unfinished: bool = False) -> Optional[Dict[str, Any]]:
+    """Прогон по id или последний прогон вида kind (unfinished=True — только незавершённый)."""
+    cols = ("id", "kind", "status", "started_at", "finished_at", "tasks_total", "tasks_done", "tasks_failed")
+    where, params = [], []
+    if run_id is not None:
+        where.append("id = ?")
+        params.append(run_id)
+    if kind is not None:
+        where.append("kind = ?")
+        params.append(kind)
+    if unfinished:
+        where.append("status = 'running'")
+    with _read() as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(cols)} FROM scrape_runs "
+            f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id DESC LIMIT 1;",
+            params,
+        ).fetchone()
+    return dict(zip(cols, row)) if row else None
+
+
+def get_scrape_tasks(run_id: int) -> List[Dict[str, Any]]:
+    with _read() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(_TASK_COLUMNS)} FROM scrape_tasks WHERE run_id = ? ORDER BY id;",
+            (run_id,),
+        ).fetchall()
+    return [dict(zip(_TASK_COLUMNS, row)) for row in rows]
+
+
+def set_scrape_task(
+    run_id: int,
+    bank_id: int,
+    state: str,
+    category_name: str = "",
+    duration_s: Optional[float] = None,
+    error: Optional[str] = None,
+) -> None:
+    """Записывает состояние задачи; running — новая попытка (attempts + 1)."""
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    running = state == "running"
+    with _write() as conn:
+        conn.execute("""
+            INSERT INTO scrape_tasks (run_id, bank_id, category_name, state, attempts,
+                                      started_at, finished_at, duration_s, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id, bank_id, category_name) DO UPDATE SET
+                state = excluded.state,
+                attempts = attempts + ?,
+                started_at = COALESCE(excluded.started_at, started_at),
+                finished_at = excluded.finished_at,
+                duration_s = excluded.duration_s,
+                error = excluded.error;
+        """, (
+            run_id, bank_id, category_name, state, 1 if running else 0,
+            now if running else None, None if running else now, duration_s, error,
+            1 if running else 0,
+        ))
+
+
+def finish_scrape_run(run_id: int) -> Dict[str, Any]:
+    """Пересчитывает итоги по задачам-банкам и закрывает прогон (done или failed)."""
+    with _write() as conn:
         cur = conn.cursor()
+        total, done, failed = cur.execute("""
+            SELECT COUNT(*), COALESCE(SUM(state = 'done'), 0), COALESCE(SUM(state = 'failed'), 0)
+            FROM scrape_tasks WHERE run_id = ? AND category_name = '';
+        """, (run_id,)).fetchone()
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS tg_users (
-                chat_id INTEGER PRIMARY KEY,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        conn.commit()
-    finally:
-        conn.close()
+            UPDATE scrape_runs
+            SET status = ?, finished_at = ?, tasks_total = ?, tasks_done = ?, tasks_failed = ?
+            WHERE id = ?;
+        """, (
+            "failed" if failed else "done",
+            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            total, done, failed, run_id,
+        ))
+    return get_scrape_run(run_id)
+
+
+def reopen_failed_scrape_tasks(run_id: int) -> int:
+    """Возвращает упавшие задачи-банки прогона в pending и снова открывает прогон."""
+    with _write() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE scrape_tasks SET state = 'pending'
+            WHERE run_id = ? AND category_name = '' AND state = 'failed';
+        """, (run_id,))
+        n = cur.rowcount
+        if n:
+            cur.execute(
+                "UPDATE scrape_runs SET status = 'running', finished_at = NULL WHERE id = ?;",
+                (run_id,),
+            )
+        return n
+
+
+# ---------- SCRAPE METRICS ----------
+_METRIC_COLUMNS = (
+    "run_id", "bank_id", "category_name", "started_at", "duration_s",
+    "cards", "saved", "round_trips", "phases",
+)
+
+
+def save_scrape_metrics(rows: List[Dict[str, Any]]) -> None:
+    """rows: [{run_id, bank_id, category_name, started_at, duration_s, cards, saved, round_trips, phases}]."""
+    with _write() as conn:
+        conn.executemany(
+            f"INSERT INTO scrape_metrics ({', '.join(_METRIC_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in _METRIC_COLUMNS)});",
+            [
+                tuple(
+                    json.dumps(r["phases"], ensure_ascii=False) if col == "phases" else r.get(col)
+                    for col in _METRIC_COLUMNS
+                )
+                for r in rows
+            ],
+        )
+
+
+def get_scrape_metrics_history(depth: int = 6) -> List[Dict[str, Any]]:
+    """
+    Последние depth замеров по каждой паре (банк, категория), новые первыми;
+    rank = 1 — последний прогон. Строки с category_name = '' — итог по банку.
+    """
+    cols = ("bank_id", "bank_name", "category_name", "rank") + _METRIC_COLUMNS[3:]
+    with _read() as conn:
+        rows = conn.execute("""
+            SELECT m.bank_id, COALESCE(b.name, 'bank ' || m.bank_id), m.category_name, m.rnk,
+                   m.started_at, m.duration_s, m.cards, m.saved, m.round_trips, m.phases
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY bank_id, category_name ORDER BY id DESC
+                ) AS rnk
+                FROM scrape_metrics
+            ) m
+            LEFT JOIN banks b ON b.id = m.bank_id
+            WHERE m.rnk <= ?
+            ORDER BY m.bank_id, m.category_name, m.rnk;
+        """, (depth,)).fetchall()
+    result = []
+    for row in rows:
+        item = dict(zip(cols, row))
+        item["phases"] = json.loads(item["phases"]) if item["phases"] else {}
+        result.append(item)
+    return result
 
 
+# ---------- TELEGRAM USERS ----------
+
 def remember_user(chat_id: int) -> None:
     """
     Сохраняем chat_id пользователя, если ещё не сохранён.
     Вызываем, например, в /start и/или в других хендлерах бота.
     """
-    ensure_tg_users_table()
-    conn = _conn()
-    try:
+    with _write() as conn:
         cur = conn.cursor()
         cur.execute(
             "INSERT OR IGNORE INTO tg_users(chat_id) VALUES (?);",
             (chat_id,)
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def get_all_chat_ids() -> List[int]:
@@ -750,85 +1352,63 @@ def get_all_chat_ids() -> List[int]:
     Возвращает список chat_id всех пользователей,
     которым можно отправлять утренний дайджест.
     """
-    ensure_tg_users_table()
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT chat_id FROM tg_users;")
         return [row[0] for row in cur.fetchall()]
-    finally:
-        conn.close()
 
 # логтрование входа пользователя для отслеживания активных
-def ensure_log_table() -> None:
-    conn = _conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                entered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                action TEXT
-            );
-        """)
-        conn.commit()
-    finally:
-        conn.close()
-
-
 def log_user_start(user_id: int) -> None:
     """
     Записывает факт нажатия /start пользователем: его user_id и текущее время.
     Каждый вызов добавляет новую строку (история всех входов сохраняется).
     """
-    ensure_log_table()
-    conn = _conn()
-    try:
+    with _write() as conn:
         cur = conn.cursor()
         entered_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         cur.execute(
             "INSERT INTO log (user_id, entered_at) VALUES (?, ?);",
             (user_id, entered_at)
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 def log_user_action(user_id: int, action: str) -> None:
     """
     Записывает действие пользователя в таблицу log.
     action — название действия (например, 'выбрать_банк', 'построить_график', 'найти_партнера')
     """
-    ensure_log_table()
-    conn = _conn()
-    try:
+    with _write() as conn:
         cur = conn.cursor()
-        # Добавляем колонку action, если её ещё нет (миграция)
-        try:
-            cur.execute("ALTER TABLE log ADD COLUMN action TEXT;")
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass  # колонка уже существует
         entered_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         cur.execute(
             "INSERT INTO log (user_id, entered_at, action) VALUES (?, ?, ?);",
             (user_id, entered_at, action)
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 def get_start_log() -> List[Tuple[int, int, str]]:
     """
     Возвращает все записи из таблицы log:
     [(id, user_id, entered_at), ...]
     """
-    ensure_log_table()
-    conn = _conn()
-    try:
+    with _read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT id, user_id, entered_at FROM log ORDER BY entered_at DESC;")
         return cur.fetchall()
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Служебные команды БД")
+    ap.add_argument("command", choices=["migrate", "backfill-current"])
+    ap.add_argument("--db", default=DB_PATH, help="путь к БД (по умолчанию DB_PATH)")
+    args = ap.parse_args()
+    DB_PATH = args.db
+
+    if args.command == "migrate":
+        if not init_db():
+            print(f"✅ Схема БД актуальна ({DB_PATH})")
+    elif args.command == "backfill-current":
+        # на необновлённой БД таблиц partners_current / partners_fts ещё нет
+        init_db()
+        n = rebuild_partners_current()
+        print(f"✅ partners_current пересобрана: {n} строк ({DB_PATH})")
@@ -3,54 +3,123 @@ import os
 import time
 import json
 import re
+import asyncio
+import hashlib
 from collections import defaultdict
 from typing import List, Dict, Any, Optional, Callable, Tuple
 
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
-from dotenv import load_dotenv
-from back_db import save_partners
-
-from gigachat import GigaChat
+from back_db import save_partners, normalize, get_llm_cache, put_llm_cache, confirm_partners
+from http_client import USER_AGENT
+import http_cache
+import html_parse
+from html_parse import Document
+import scrape_metrics
+from llm_backends import get_backend
 
 ProgressFn = Optional[Callable[[int, int, str], None]]
 
 BASE_URL = "https://belkart.by/BELKART/reklamnye-aktsii/"
 
-load_dotenv()
-GIGACHAT_TOKEN = os.getenv("GIGACHAT_TOKEN")
-
-gc = GigaChat(
-    credentials=GIGACHAT_TOKEN,
-    scope="GIGACHAT_API_B2B",
-    verify_ssl_certs=False,
-    model="GigaChat-2-Max",
-)
-print("GIGACHAT_TOKEN =", GIGACHAT_TOKEN)
+# async — страницы 2..N качаются параллельно (aiohttp), sequential — по одной
+BELKART_FETCH = os.getenv("BELKART_FETCH", "async")
+BELKART_CONCURRENCY = int(os.getenv("BELKART_CONCURRENCY", "4"))
 
 # кэш для результатов GigaChat: "raw_title raw_status" -> {"company": ..., "bonus": ...}
+# (в памяти процесса; между запусками — таблица llm_cache, см. extract_many)
 _GIGA_CACHE: Dict[str, Dict[str, Any]] = {}
 
+# менять при правке промптов — старые ответы в llm_cache перестанут совпадать по ключу
+PROMPT_VERSION = "v1"
+LLM_CACHE_TTL_DAYS = int(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "20"))
+# тексты, разобранные правилами с уверенностью не ниже порога, в GigaChat не идут
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.8"))
+
+# счётчики текущего прогона (сбрасываются в fetch_promotions)
+LLM_STATS: Dict[str, float] = {}
+
+
+def reset_llm_stats() -> None:
+    LLM_STATS.clear()
+    LLM_STATS.update({
+        "rules": 0, "hits_memory": 0, "hits_db": 0, "misses": 0,
+        "llm_calls": 0, "llm_seconds": 0.0, "fallbacks": 0,
+    })
+
+
+reset_llm_stats()
+
 
 # ---------- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ----------
 
 def nlp_company_bonus(raw_text: str) -> Dict[str, Any]:
     """
-    Обёртка над extract_company_and_bonus с простым in‑memory кэшем.
+    Компания и бонус для одного текста (через кэши и GigaChat, см. extract_many).
     Один и тот же текст не отправляем в GigaChat повторно.
     """
     raw_text = raw_text.strip()
     if not raw_text:
         return {"company": None, "bonus": None}
+    return extract_many([raw_text])[raw_text]
+
 
-    if raw_text in _GIGA_CACHE:
-        return _GIGA_CACHE[raw_text]
+def _cache_key(raw_text: str) -> str:
+    return hashlib.sha256(f"{PROMPT_VERSION}\n{raw_text}".encode("utf-8")).hexdigest()
 
-    data = extract_company_and_bonus(raw_text)
-    _GIGA_CACHE[raw_text] = data
-    return data
+
+def extract_many(texts: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    {текст: {"company", "bonus"}} для списка текстов карточек:
+    1) кэш процесса, 2) правила (rules_extract, уверенность ≥ RULES_MIN_CONFIDENCE),
+    3) llm_cache в БД (не старше LLM_CACHE_TTL_DAYS),
+    4) остальное — пачками по LLM_BATCH_SIZE в одном запросе к LLM
+       (бэкенд — BELKART_EXTRACTOR, см. llm_backends.py).
+    Удачные ответы LLM сохраняются в llm_cache. С BELKART_EXTRACTOR=rules
+    LLM не вызывается: берётся ответ правил при любой уверенности.
+    """
+    llm = get_backend()
+    min_confidence = RULES_MIN_CONFIDENCE if llm is not None else 0.0
+    result: Dict[str, Dict[str, Any]] = {}
+    pending: List[str] = []
+    for text in dict.fromkeys(t.strip() for t in texts if t and t.strip()):
+        if text in _GIGA_CACHE:
+            result[text] = _GIGA_CACHE[text]
+            LLM_STATS["hits_memory"] += 1
+            continue
+        rule = rules_extract(text)
+        if rule["confidence"] >= min_confidence:
+            _GIGA_CACHE[text] = result[text] = {"company": rule["company"], "bonus": rule["bonus"]}
+            LLM_STATS["rules"] += 1
+        else:
+            pending.append(text)
+
+    if pending:
+        keys = {_cache_key(t): t for t in pending}
+        cached = get_llm_cache(list(keys), LLM_CACHE_TTL_DAYS)
+        for key, data in cached.items():
+            text = keys[key]
+            _GIGA_CACHE[text] = result[text] = data
+            LLM_STATS["hits_db"] += 1
+        pending = [t for t in pending if t not in result]
+
+    LLM_STATS["misses"] += len(pending)
+    fresh: List[Tuple[str, str, Dict[str, Any]]] = []
+    for start in range(0, len(pending), LLM_BATCH_SIZE):
+        batch = pending[start:start + LLM_BATCH_SIZE]
+        for text, data in _extract_batch(batch).items():
+            if data is None:
+                data = {"company": None, "bonus": None}
+            else:
+                fresh.append((_cache_key(text), text, data))
+            _GIGA_CACHE[text] = result[text] = data
+
+    if fresh:
+        put_llm_cache(PROMPT_VERSION, fresh)
+    return result
 
 
 def normalize_bonus(bonus) -> Optional[str]:
@@ -89,14 +158,148 @@ def extract_bonus_number(bonus_str: Optional[str]) -> float:
         return -1.0
 
 
+# ---------- ПРАВИЛА (до GigaChat) ----------
+
+_NUM = r"\d+(?:[.,]\d+)?"
+_DISCOUNT = r"(?:скидк[а-яё]*|кешб[эе]к[а-яё]*|кэшб[эе]к[а-яё]*|cashback)"
+
+# (шаблон бонуса, уверенность); «скидка/кешбэк N%» и «N книги в подарок»
+_BONUS_RULES = [
+    (re.compile(rf"{_DISCOUNT}\s+(до\s+)?-?\s*({_NUM})\s*%", re.I), 0.95),
+    (re.compile(rf"(до\s+)?-?({_NUM})\s*%\s+{_DISCOUNT}", re.I), 0.9),
+    (re.compile(rf"({_NUM})\s+[а-яё]+\s+в\s+подарок", re.I), 0.85),
+]
+# голые «-15%» / «15%» без слова — бонус угадан, но не наверняка
+_BARE_PERCENT = re.compile(rf"(до\s+)?-?({_NUM})\s*%", re.I)
+
+_QUOTED = re.compile(r"[«\"“]([^»\"”]{2,60})[»\"”]")
+_COMPANY_AFTER = re.compile(r"(?:^|\s)(?:в|во|от|у|через|с)\s+(.+)$", re.I)
+_CITY_SUFFIX = re.compile(r"[\s,(]*(?:г\.|город)\s*[А-ЯЁ][а-яё-]+\)?\s*$")
+_CARD_BRAND = re.compile(r"\b(?:картой|картами|карты)?\s*Белкарт\b\s*(?:и\s+)?", re.I)
+
+
+def _bonus_label(match: re.Match) -> str:
+    # как в тексте карточки, без приведения к «Скидка N%»: save_partners сравнивает
+    # текст бонуса, и иная запись того же бонуса попала бы в дайджест как изменение
+    return " ".join(match.group(0).split())
+
+
+def rules_extract(text: str) -> Dict[str, Any]:
+    """
+    Компания и бонус по типовым шаблонам карточек Белкарта
+    («Скидка 15% в …», «кешбэк 20% …», «2 книги в подарок») без сети.
+    confidence — меньшая из уверенностей по бонусу и по компании (0..1).
+    """
+    text = " ".join((text or "").split())
+    bonuses: List[str] = []
+    bonus_conf = 0.0
+    rest = text
+    for pattern, conf in _BONUS_RULES:
+        for match in pattern.finditer(rest):
+            label = _bonus_label(match)
+            if extract_bonus_number(label) > 0 and label not in bonuses:
+                bonuses.append(label)
+                bonus_conf = max(bonus_conf, conf)
+        rest = pattern.sub(" ", rest)
+    if not bonuses:
+        match = _BARE_PERCENT.search(rest)
+        if match and extract_bonus_number(match.group(2)) > 0:
+            bonuses.append(_bonus_label(match))
+            bonus_conf = 0.6
+            rest = _BARE_PERCENT.sub(" ", rest, count=1)
+
+    company, company_conf = None, 0.0
+    quoted = _QUOTED.search(text)
+    if quoted:
+        company, company_conf = quoted.group(1).strip(), 0.95
+    else:
+        tail = _COMPANY_AFTER.search(" ".join(rest.split()))
+        if tail:
+            words = _CITY_SUFFIX.sub("", _CARD_BRAND.sub(" ", tail.group(1))).split()
+            start = next(
+                (i for i, w in enumerate(words) if w[0].isupper() or w[0].isdigit() or "a" <= w[0].lower() <= "z"),
+                None,
+            )
+            if start is not None:
+                company = " ".join(words[start:]).strip(" .,!;:")
+                # «в сети оптик Funtastik» — латиница почти всегда бренд и не склоняется;
+                # кириллический хвост после предлога — это и «в Витебской области»,
+                # и «в Белкниге» в падеже: без кавычек его разбирает GigaChat
+                if re.search(r"[a-z]", company, re.I):
+                    company_conf = 0.85
+                else:
+                    company_conf = 0.6
+
+    return {
+        "company": company or None,
+        "bonus": " ".join(bonuses) or None,
+        "confidence": min(bonus_conf, company_conf),
+    }
+
+
 # ---------- GIGACHAT ----------
 
-def extract_company_and_bonus(text: str) -> dict:
-    """Извлекает компанию и бонус через GigaChat."""
-    text = text.strip()
-    if not text:
-        return {"company": None, "bonus": None}
+def _chat(prompt: str) -> str:
+    started = time.perf_counter()
+    try:
+        raw = get_backend().chat(prompt)
+    finally:
+        LLM_STATS["llm_calls"] += 1
+        LLM_STATS["llm_seconds"] += time.perf_counter() - started
+    return raw.strip().replace("```json", "").replace("```", "").strip()
+
+
+def _extract_batch(texts: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Один запрос к GigaChat на пачку карточек; ответ — строго JSON-массив
+    [{"id", "company", "bonus"}]. Карточки, которых нет в ответе (или весь
+    ответ не разобрался), уходят поштучно. None — LLM так и не ответил.
+    """
+    if len(texts) == 1:
+        return {texts[0]: _extract_one(texts[0])}
+
+    items = "\n".join(f'{i}. """{t}"""' for i, t in enumerate(texts, start=1))
+    prompt = f"""
+Для каждого текста ниже извлеки название компании и размер бонуса.
+Если бонус указан в разных форматах (скидка 15%, 15%, -15%, кешбэк 20%, 2 книги в подарок), верни его как есть.
+
+Тексты:
+{items}
+
+Верни СТРОГО JSON-массив без пояснений, по одному объекту на каждый текст:
+[
+  {{"id": 1, "company": "...", "bonus": "..."}}
+]
+
+Если данных нет – используй null.
+"""
+
+    parsed: Dict[str, Optional[Dict[str, Any]]] = {}
+    try:
+        data = json.loads(_chat(prompt))
+        if not isinstance(data, list):
+            raise ValueError("ответ не JSON-массив")
+        for obj in data:
+            if not isinstance(obj, dict):
+                continue
+            idx = obj.get("id")
+            if isinstance(idx, int) and 1 <= idx <= len(texts):
+                parsed[texts[idx - 1]] = {
+                    "company": obj.get("company"),
+                    "bonus": normalize_bonus(obj.get("bonus")),
+                }
+    except Exception as e:
+        print(f"⚠️ GigaChat batch error ({len(texts)} карточек): {e}")
+
+    for text in texts:
+        if text not in parsed:
+            LLM_STATS["fallbacks"] += 1
+            parsed[text] = _extract_one(text)
+    return parsed
+
 
+def _extract_one(text: str) -> Optional[Dict[str, Any]]:
+    """Один текст — один запрос; None при ошибке (такой ответ не кэшируем)."""
     prompt = f"""
 Извлеки из текста название компании и размер бонуса.
 Если бонус указан в разных форматах (скидка 15%, 15%, -15%, кешбэк 20%, 2 книги в подарок), верни его как есть.
@@ -114,10 +317,7 @@ def extract_company_and_bonus(text: str) -> dict:
 """
 
     try:
-        resp = gc.chat(prompt)
-        raw = resp.choices[0].message.content.strip()
-        raw = raw.replace("```json", "").replace("```", "").strip()
-        data = json.loads(raw)
+        data = json.loads(_chat(prompt))
 
         company = data.get("company")
         bonus = normalize_bonus(data.get("bonus"))
@@ -125,62 +325,81 @@ def extract_company_and_bonus(text: str) -> dict:
         return {"company": company, "bonus": bonus}
     except Exception as e:
         print(f"⚠️ GigaChat error: {e}")
+        return None
+
+
+def extract_company_and_bonus(text: str) -> dict:
+    """Извлекает компанию и бонус через LLM (без LLM — правилами)."""
+    text = text.strip()
+    if not text:
         return {"company": None, "bonus": None}
+    if get_backend() is None:
+        rule = rules_extract(text)
+        return {"company": rule["company"], "bonus": rule["bonus"]}
+    return _extract_one(text) or {"company": None, "bonus": None}
 
 
 # ---------- ПАРСИНГ СТРАНИЦ ----------
 
-def _parse_page(url: str, retry_count: int = 3) -> Tuple[List[Dict[str, Any]], BeautifulSoup]:
+def _parse_html(page_html: str) -> Tuple[List[Dict[str, Any]], Document]:
     """
-    Парсит одну страницу с повторными попытками при сетевых ошибках.
-    Возвращает список партнёров и объект BeautifulSoup.
+    Карточки одной страницы каталога. Компания и бонус заполняются позже,
+    одним проходом по всем страницам (enrich_items) — см. extract_many.
     """
-    last_error: Optional[str] = None
-
-    for attempt in range(1, retry_count + 1):
-        try:
-            print(f"  📡 Попытка загрузки {attempt}/{retry_count}: {url}")
-            resp = requests.get(url, timeout=20)
-            resp.raise_for_status()
-
-            soup = BeautifulSoup(resp.text, "lxml")
-            cards = soup.select("ul.card-list li.card-list__item")
-            print(f"    🔍 Найдено карточек: {len(cards)}")
-
-            results: List[Dict[str, Any]] = []
-
-            for i, card in enumerate(cards, start=1):
-                try:
-                    link_tag = card.select_one("a.card-list__link")
-                    title_tag = card.select_one(".card-list__title")
-                    status_tag = card.select_one(".card-list__label")
+    soup = html_parse.parse(page_html)
+    cards = soup.select("ul.card-list li.card-list__item")
+    print(f"    🔍 Найдено карточек: {len(cards)}")
 
-                    raw_title = (title_tag.text or "").strip() if title_tag else ""
-                    raw_status = (status_tag.text or "").strip() if status_tag else ""
-                    raw_link = urljoin(BASE_URL, link_tag["href"]) if link_tag and link_tag.get("href") else ""
+    results: List[Dict[str, Any]] = []
 
-                    if not raw_title:
-                        continue
+    for i, card in enumerate(cards, start=1):
+        try:
+            link_tag = card.select_one("a.card-list__link")
+            title_tag = card.select_one(".card-list__title")
+            status_tag = card.select_one(".card-list__label")
+
+            raw_title = title_tag.text().strip() if title_tag else ""
+            raw_status = status_tag.text().strip() if status_tag else ""
+            raw_link = urljoin(BASE_URL, link_tag["href"]) if link_tag and link_tag.get("href") else ""
+
+            if not raw_title:
+                continue
+
+            results.append(
+                {
+                    "title": raw_title,
+                    "link": raw_link,
+                    "status": raw_status,
+                    "raw_text": f"{raw_title} {raw_status}".strip(),
+                    "company": raw_title,
+                    "bonus": None,
+                }
+            )
+        except Exception as e:
+            print(f"    ⚠️ Ошибка парсинга карточки #{i}: {e}")
 
-                    raw_text = f"{raw_title} {raw_status}".strip()
-                    nlp = nlp_company_bonus(raw_text)
+    return results, soup
 
-                    company = (nlp.get("company") or raw_title).strip()
-                    bonus = nlp.get("bonus")
 
-                    results.append(
-                        {
-                            "title": raw_title,
-                            "link": raw_link,
-                            "status": raw_status,
-                            "company": company,
-                            "bonus": bonus,
-                        }
-                    )
-                except Exception as e:
-                    print(f"    ⚠️ Ошибка парсинга карточки #{i}: {e}")
+def _parse_page(
+    url: str,
+    retry_count: int = 3,
+    pages: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[List[Dict[str, Any]], Document]:
+    """
+    Парсит одну страницу с повторными попытками при сетевых ошибках.
+    Возвращает список партнёров и разобранный документ (html_parse); загруженная
+    страница (для http_cache) дописывается в pages.
+    """
+    last_error: Optional[str] = None
 
-            return results, soup
+    for attempt in range(1, retry_count + 1):
+        try:
+            print(f"  📡 Попытка загрузки {attempt}/{retry_count}: {url}")
+            page = http_cache.fetch(url, timeout=20)
+            if pages is not None:
+                pages.append(page)
+            return http_cache.timed_parse(page, _parse_html)
 
         except requests.exceptions.RequestException as e:
             last_error = f"Ошибка сети/таймаут на попытке {attempt}: {e}"
@@ -192,10 +411,12 @@ def _parse_page(url: str, retry_count: int = 3) -> Tuple[List[Dict[str, Any]], B
             break
 
     print(f"  ❌ Не удалось загрузить страницу после {retry_count} попыток: {last_error}")
-    return [], BeautifulSoup("", "lxml")
+    if pages is not None:
+        pages.append(None)  # обход неполный — кэш по нему не записываем
+    return [], html_parse.parse("")
 
 
-def _get_next_page_url(soup: BeautifulSoup) -> Optional[str]:
+def _get_next_page_url(soup: Document) -> Optional[str]:
     """
     Находит URL следующей страницы из пагинации Белкарта.
     Опирается на активный элемент и номер следующей страницы.
@@ -206,7 +427,7 @@ def _get_next_page_url(soup: BeautifulSoup) -> Optional[str]:
         return None
 
     try:
-        current_num = int(active_page.text.strip())
+        current_num = int(active_page.text().strip())
     except (ValueError, AttributeError):
         print("    ⚠️ Не удалось определить номер текущей страницы")
         return None
@@ -231,6 +452,76 @@ def _get_next_page_url(soup: BeautifulSoup) -> Optional[str]:
     return None
 
 
+def _page_numbers(soup: Document) -> List[int]:
+    """Номера страниц, на которые есть ссылки в блоке пагинации."""
+    numbers = set()
+    for link in soup.select("a.pagination-link, a.pagination-button"):
+        text = link.text().strip()
+        if text.isdigit():
+            numbers.add(int(text))
+        match = re.search(r"PAGEN_1=(\d+)", link.get("href") or "")
+        if match:
+            numbers.add(int(match.group(1)))
+    return sorted(numbers)
+
+
+def _page_url(soup: Document, page_num: int) -> str:
+    """URL страницы N по образцу ссылки из пагинации (PAGEN_1=...)."""
+    sample = soup.select_one("a.pagination-link[href*='PAGEN_1=']")
+    if sample and sample.get("href"):
+        href = re.sub(r"PAGEN_1=\d+", f"PAGEN_1={page_num}", sample["href"])
+        return urljoin(BASE_URL, href)
+    return f"{BASE_URL}?PAGEN_1={page_num}"
+
+
+async def _fetch_pages_async(
+    urls: List[str],
+    concurrency: int = BELKART_CONCURRENCY,
+    retry_count: int = 3,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Качает страницы параллельно (не больше concurrency одновременно) через
+    общий пул соединений aiohttp, условными GET (http_cache). Для каждой —
+    страница http_cache.make_page или None.
+    """
+    entries = {url: http_cache.lookup(url) for url in urls}
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=20)
+    sem = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}
+    ) as session:
+
+        async def fetch(url: str) -> Optional[Dict[str, Any]]:
+            entry = entries[url]
+            async with sem:
+                for attempt in range(1, retry_count + 1):
+                    try:
+                        print(f"  📡 Попытка загрузки {attempt}/{retry_count}: {url}")
+                        async with session.get(url, headers=http_cache.conditional_headers(entry)) as resp:
+                            if resp.status == 304:
+                                return http_cache.make_page(url, 304, None, resp.headers, entry, str(resp.url))
+                            resp.raise_for_status()
+                            text = await resp.text()
+                            return http_cache.make_page(url, resp.status, text, resp.headers, entry, str(resp.url))
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        print(f"  ⚠️ Ошибка сети/таймаут на попытке {attempt}: {e}")
+                        await asyncio.sleep(2)
+            return None
+
+        return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+def enrich_items(items: List[Dict[str, Any]]) -> None:
+    """Проставляет company/bonus карточкам по raw_text (кэш + пачки GigaChat)."""
+    extracted = extract_many([it["raw_text"] for it in items if it.get("raw_text")])
+    for item in items:
+        nlp = extracted.get((item.get("raw_text") or "").strip()) or {}
+        item["company"] = (nlp.get("company") or item["title"]).strip()
+        item["bonus"] = nlp.get("bonus")
+
+
 # ---------- ДЕДУПЛИКАЦИЯ И СОХРАНЕНИЕ ----------
 
 def save_belkart_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
@@ -246,22 +537,27 @@ def save_belkart_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
         return
 
     grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    # нормализованное имя → название, как оно встретилось первым
+    display_names: Dict[str, str] = {}
 
-    # Группировка по компании
+    # Группировка по компании (тот же normalize, что и name_norm в БД)
     for item in items:
         company = (item.get("company") or item.get("title") or "").strip()
-        if not company:
+        key = normalize(company)
+        if not key:
             print(f"⚠️ Пропускаем партнёра без названия: {item}")
             continue
 
         bonus = normalize_bonus(item.get("bonus"))
         link = item.get("link") or ""
 
-        grouped[company].append({"bonus": bonus, "link": link})
+        display_names.setdefault(key, company)
+        grouped[key].append({"bonus": bonus, "link": link})
 
     partners_data: List[Dict[str, Any]] = []
 
-    for company, records in grouped.items():
+    for key, records in grouped.items():
+        company = display_names[key]
         if not records:
             print(f"⚠️ Нет записей для {company}")
             continue
@@ -306,37 +602,31 @@ def save_belkart_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
         print(f"  ✅ {company} → бонус: {final_bonus or 'нет'}, ссылка: {'да' if final_link else 'нет'}")
 
     print(f"\n📝 Сохраняю {len(partners_data)} уникальных партнёров...")
-    save_partners(
-        partners=partners_data,
-        bank_id=bank_id,
-        category_id=0,
-    )
+    with scrape_metrics.phase("db_save"):
+        save_partners(
+            partners=partners_data,
+            bank_id=bank_id,
+            category_id=0,
+        )
+    scrape_metrics.add(saved=len(partners_data))
     print(f"✅ Сохранено {len(partners_data)} уникальных партнёров Белкарта")
 
 
 # ---------- ГЛАВНАЯ ФУНКЦИЯ ----------
 
-def fetch_promotions(
+def _walk_sequential(
     bank_id: int,
+    current_url: str,
+    page_num: int,
+    max_pages: int,
+    visited_urls: set,
+    all_items: List[Dict[str, Any]],
     progress: ProgressFn = None,
     banks_done: int = 0,
     banks_total: int = 0,
-) -> List[Dict[str, Any]]:
-    """
-    Загружает ВСЕ страницы Белкарта и сохраняет партнёров.
-    Делает:
-    1. Правильную пагинацию.
-    2. Повторные попытки при ошибках.
-    3. Извлечение названий и бонусов через GigaChat.
-    4. Дедупликацию по компании.
-    5. Защиту от циклов по URL.
-    """
-    all_items: List[Dict[str, Any]] = []
-    current_url = BASE_URL
-    page_num = 1
-    max_pages = 100
-    visited_urls: set[str] = set()
-
+    pages: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """Обход по ссылке «следующая страница» начиная с current_url. Возвращает номер последней страницы."""
     while page_num <= max_pages:
         note = f"[bank {bank_id}] 📄 Белкарт – страница {page_num}"
         print(note)
@@ -348,7 +638,7 @@ def fetch_promotions(
             break
         visited_urls.add(current_url)
 
-        items, soup = _parse_page(current_url)
+        items, soup = _parse_page(current_url, pages=pages)
         if not items:
             print(f"[bank {bank_id}] ℹ️ Страница {page_num} пуста - конец каталога")
             break
@@ -364,10 +654,167 @@ def fetch_promotions(
         current_url = next_url
         page_num += 1
         time.sleep(1)
+    return page_num
+
+
+def _walk_async(
+    bank_id: int,
+    max_pages: int,
+    visited_urls: set,
+    all_items: List[Dict[str, Any]],
+    progress: ProgressFn = None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+    pages: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """
+    Первая страница — обычным запросом, из её пагинации берётся число страниц;
+    остальные качаются параллельно и разбираются строго по порядку. Если
+    последняя скачанная страница ссылается дальше (пагинация показала не все
+    номера), обход продолжается последовательно — результат как у _walk_sequential.
+    """
+    visited_urls.add(BASE_URL)
+    items, soup = _parse_page(BASE_URL, pages=pages)
+    if not items:
+        print(f"[bank {bank_id}] ℹ️ Страница 1 пуста - конец каталога")
+        return 1
+    all_items.extend(items)
+    print(f"[bank {bank_id}] ✅ Стр. 1: +{len(items)} партнёров (всего: {len(all_items)})")
+
+    last_page = min(max(_page_numbers(soup), default=1), max_pages)
+    urls = [_page_url(soup, n) for n in range(2, last_page + 1)]
+    note = f"[bank {bank_id}] 📄 Белкарт – страниц {last_page}, загружаем параллельно"
+    print(note)
+    if progress:
+        progress(banks_done, banks_total, note)
+
+    fetched_pages = asyncio.run(_fetch_pages_async(urls)) if urls else []
+
+    page_num = 1
+    last_soup = soup
+    for url, page in zip(urls, fetched_pages):
+        page_num += 1
+        if page is None:
+            print(f"  ❌ Не удалось загрузить страницу {url}")
+            if pages is not None:
+                pages.append(None)
+            return page_num
+        final_url = page["final_url"]
+        if url in visited_urls or final_url in visited_urls:
+            print(f"[bank {bank_id}] ⚠️ Цикл! Страница уже была посещена: {final_url}")
+            return page_num
+        visited_urls.update({url, final_url})
+        if pages is not None:
+            pages.append(page)
+
+        items, last_soup = http_cache.timed_parse(page, _parse_html)
+        if not items:
+            print(f"[bank {bank_id}] ℹ️ Страница {page_num} пуста - конец каталога")
+            return page_num
+        all_items.extend(items)
+        print(f"[bank {bank_id}] ✅ Стр. {page_num}: +{len(items)} партнёров (всего: {len(all_items)})")
+
+    next_url = _get_next_page_url(last_soup)
+    if not next_url:
+        print(f"[bank {bank_id}] ✅ Достигнута последняя страница ({page_num})")
+        return page_num
+    return _walk_sequential(
+        bank_id, next_url, page_num + 1, max_pages, visited_urls, all_items,
+        progress, banks_done, banks_total, pages,
+    )
+
+
+def _catalog_unchanged(concurrency: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Страницы прошлого прогона (список — в meta первой страницы в http_cache),
+    если ни одна не изменилась; иначе None. Сначала только первая страница:
+    при изменениях остальные не качаем дважды.
+    """
+    first = http_cache.lookup(BASE_URL)
+    urls = (first or {}).get("meta", {}).get("pages")
+    if not urls:
+        return None
+    pages = asyncio.run(_fetch_pages_async(urls[:1], concurrency))
+    if None in pages or not http_cache.all_unchanged(pages):
+        return None
+    if len(urls) > 1:
+        pages += asyncio.run(_fetch_pages_async(urls[1:], concurrency))
+    if None in pages or not http_cache.all_unchanged(pages):
+        return None
+    return pages
+
+
+def fetch_promotions(
+    bank_id: int,
+    progress: ProgressFn = None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+    mode: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Загружает ВСЕ страницы Белкарта и сохраняет партнёров.
+    Делает:
+    1. Правильную пагинацию (mode/BELKART_FETCH: async — параллельно, sequential — по одной).
+    2. Повторные попытки при ошибках.
+    3. Извлечение названий и бонусов через GigaChat (кэш llm_cache, пачки запросов).
+    4. Дедупликацию по компании.
+    5. Защиту от циклов по URL.
+    """
+    all_items: List[Dict[str, Any]] = []
+    max_pages = 100
+    visited_urls: set[str] = set()
+    pages: List[Optional[Dict[str, Any]]] = []
+    reset_llm_stats()
+    is_async = (mode or BELKART_FETCH) == "async"
+
+    if http_cache.HTTP_CACHE_ENABLED:
+        unchanged = _catalog_unchanged(BELKART_CONCURRENCY if is_async else 1)
+        if unchanged:
+            confirmed = confirm_partners(bank_id, 0)
+            saved_ms = http_cache.note_skipped(unchanged, unchanged[0]["meta"].get("save_ms", 0.0))
+            done_msg = (
+                f"[bank {bank_id}] ♻️ Белкарт: {len(unchanged)} стр. не изменились — подтверждено "
+                f"{confirmed} партнёров без разбора (сэкономлено {saved_ms:.0f} мс CPU)"
+            )
+            print(done_msg)
+            if progress:
+                progress(banks_done, banks_total, done_msg)
+            return []
+
+    # загрузка и разбор страниц идут вперемешку (async) — одна фаза
+    with scrape_metrics.phase("page_load"):
+        if is_async:
+            page_num = _walk_async(
+                bank_id, max_pages, visited_urls, all_items, progress, banks_done, banks_total, pages,
+            )
+        else:
+            page_num = _walk_sequential(
+                bank_id, BASE_URL, 1, max_pages, visited_urls, all_items, progress, banks_done, banks_total,
+                pages,
+            )
+    scrape_metrics.add(cards=len(all_items))
 
     if all_items:
         print(f"\n[bank {bank_id}] 📊 Всего загружено: {len(all_items)} партнёров со страниц 1-{page_num}")
+        with scrape_metrics.phase("llm"):
+            enrich_items(all_items)
+        llm = get_backend()
+        print(
+            f"[bank {bank_id}] 🤖 Правила: {LLM_STATS['rules']}, "
+            f"LLM ({llm.name if llm else 'выкл.'}): кэш память/БД "
+            f"{LLM_STATS['hits_memory']}/{LLM_STATS['hits_db']}, "
+            f"промахов {LLM_STATS['misses']}, запросов {LLM_STATS['llm_calls']} "
+            f"({LLM_STATS['llm_seconds']:.1f} с), поштучно {LLM_STATS['fallbacks']}"
+        )
+        # CPU только на сохранение, как в bnb.py: разбор страниц уже в parse_ms
+        started = time.process_time()
         save_belkart_items(bank_id, all_items)
+        if pages and None not in pages and pages[0]["url"] == BASE_URL:
+            pages[0]["meta"] = {
+                "pages": [p["url"] for p in pages],
+                "save_ms": (time.process_time() - started) * 1000,
+            }
+            http_cache.commit(pages)
     else:
         print(f"[bank {bank_id}] ⚠️ Партнёры не загружены")
 
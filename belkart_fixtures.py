@@ -0,0 +1,191 @@
+# belkart_fixtures.py
+"""
+Размеченный набор карточек Белкарта для офлайн-проверки rules_extract
+(belkart.py): какая доля текстов разбирается правилами без GigaChat
+(покрытие) и насколько совпадают компания и бонус (точность).
+
+Тексты — только настоящие тексты карточек («заголовок статус», как их
+собирает belkart._parse_html); разметка — сохранённые партнёры банка 2
+(partners): компания — partner_name, бонус — partner_bonus. Источники:
+    card      — карточка, снятая с сайта командой capture (belkart_cards.json),
+                размечена партнёром с той же ссылкой;
+    llm_cache — исходный текст из llm_cache (совпал с партнёром по компании);
+    title     — в partner_name сохранился сам заголовок (GigaChat не нашёл
+                компанию), компания не оценивается;
+    manual    — размечено вручную: заголовки восстановлены по адресам карточек
+                (link) и дополнены типовыми трудными случаями — название в
+                падеже («в Белкниге» → «Белкнига») и место вместо компании
+                («в Витебской области», company = "" — правила не должны
+                называть компанию). build эти строки не трогает.
+Партнёры без настоящего текста в набор не попадают.
+
+Запуск:
+    python belkart_fixtures.py capture [--out belkart_cards.json]
+    python belkart_fixtures.py build [--db banks.db] [--cards belkart_cards.json] [--out belkart_fixtures.json]
+    python belkart_fixtures.py eval [--fixtures belkart_fixtures.json] [--min-confidence 0.8] [-v]
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sqlite3
+from typing import Any, Dict, List
+
+import back_db
+
+BELKART_BANK_ID = 2
+DEFAULT_FIXTURES = "belkart_fixtures.json"
+DEFAULT_CARDS = "belkart_cards.json"
+
+_LOOKS_LIKE_TITLE = re.compile(r"скидк|кешб|кэшб|подар|\d\s*%", re.I)
+
+
+# ---------- СНЯТИЕ КАРТОЧЕК ----------
+def capture(out_path: str, max_pages: int = 50) -> None:
+    """Обходит каталог Белкарта и сохраняет тексты карточек (без LLM и без записи в БД)."""
+    import http_client
+    from belkart import BASE_URL, _get_next_page_url, _parse_html
+
+    captured_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cards: List[Dict[str, Any]] = []
+    url, seen = BASE_URL, set()
+    while url and url not in seen and len(seen) < max_pages:
+        seen.add(url)
+        items, doc = _parse_html(http_client.fetch_html(url, timeout=20))
+        cards.extend(
+            {"title": it["title"], "status": it["status"], "link": it["link"], "captured_at": captured_at}
+            for it in items
+        )
+        url = _get_next_page_url(doc)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(cards, f, ensure_ascii=False, indent=1)
+    print(f"💾 {out_path}: {len(cards)} карточек с {len(seen)} стр.")
+
+
+# ---------- СБОРКА ----------
+def build(db_path: str, out_path: str, cards_path: str = DEFAULT_CARDS) -> None:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""
+            SELECT partner_name, partner_bonus, partner_link FROM partners
+            WHERE id IN (
+                SELECT MAX(id) FROM partners WHERE bank_id = ?
+                GROUP BY COALESCE(NULLIF(partner_link, ''), partner_name)
+            )
+            ORDER BY partner_name;
+        """, (BELKART_BANK_ID,)).fetchall()
+        has_cache = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='llm_cache';"
+        ).fetchone()
+        cached = conn.execute("SELECT raw_text, company FROM llm_cache;").fetchall() if has_cache else []
+    finally:
+        conn.close()
+
+    texts_by_company: Dict[str, str] = {}
+    for raw_text, company in cached:
+        if company:
+            texts_by_company.setdefault(back_db.normalize(company), raw_text)
+
+    texts_by_link: Dict[str, str] = {}
+    if os.path.exists(cards_path):
+        with open(cards_path, encoding="utf-8") as f:
+            for card in json.load(f):
+                text = f"{card['title']} {card.get('status') or ''}".strip()
+                texts_by_link.setdefault(card.get("link") or "", text)
+
+    fixtures: List[Dict[str, Any]] = []
+    if os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            fixtures = [item for item in json.load(f) if item["source"] == "manual"]
+    skipped = 0
+    for name, bonus, link in rows:
+        if link and link in texts_by_link:
+            company = None if _LOOKS_LIKE_TITLE.search(name) else name
+            item = {"text": texts_by_link[link], "company": company, "source": "card"}
+        elif _LOOKS_LIKE_TITLE.search(name):
+            item = {"text": name, "company": None, "source": "title"}
+        elif back_db.normalize(name) in texts_by_company:
+            item = {"text": texts_by_company[back_db.normalize(name)], "company": name, "source": "llm_cache"}
+        else:
+            skipped += 1
+            continue
+        item.update({"bonus": bonus, "link": link or ""})
+        fixtures.append(item)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, ensure_ascii=False, indent=1)
+    by_source: Dict[str, int] = {}
+    for item in fixtures:
+        by_source[item["source"]] = by_source.get(item["source"], 0) + 1
+    print(f"💾 {out_path}: {len(fixtures)} карточек {by_source}, без настоящего текста пропущено {skipped}")
+
+
+# ---------- ОЦЕНКА ----------
+def evaluate(fixtures_path: str, min_confidence: float, verbose: bool = False) -> None:
+    from belkart import rules_extract, extract_bonus_number
+
+    with open(fixtures_path, encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    stats: Dict[str, Dict[str, int]] = {}
+    for item in fixtures:
+        got = rules_extract(item["text"])
+        st = stats.setdefault(
+            item["source"],
+            {"n": 0, "covered": 0, "bonus_ok": 0, "bonus_same": 0, "company_n": 0, "company_ok": 0},
+        )
+        st["n"] += 1
+        if got["confidence"] < min_confidence:
+            if verbose:
+                print(f"  · {got['confidence']:.2f} → GigaChat: {item['text']}")
+            continue
+        st["covered"] += 1
+
+        bonus_ok = extract_bonus_number(got["bonus"]) == extract_bonus_number(item["bonus"])
+        st["bonus_ok"] += bonus_ok
+        # save_partners сравнивает текст бонуса: расхождение — «изменение» в дайджесте
+        st["bonus_same"] += (got["bonus"] or "") == (item["bonus"] or "")
+        company_ok = True
+        if item["company"] is not None:
+            st["company_n"] += 1
+            company_ok = back_db.normalize(got["company"] or "") == back_db.normalize(item["company"])
+            st["company_ok"] += company_ok
+        if verbose and not (bonus_ok and company_ok):
+            print(f"  ✗ {item['text']}\n      ожидалось: {item['company']} / {item['bonus']}"
+                  f"\n      правила:   {got['company']} / {got['bonus']}")
+
+    print(f"{'источник':<11}{'карточек':>9}{'покрытие':>10}{'бонус':>8}{'текст':>8}{'компания':>10}")
+    for source, st in sorted(stats.items()):
+        cov = st["covered"] / st["n"] if st["n"] else 0
+        bonus_acc = st["bonus_ok"] / st["covered"] if st["covered"] else 0
+        same = st["bonus_same"] / st["covered"] if st["covered"] else 0
+        comp_acc = f"{st['company_ok'] / st['company_n']:.0%}" if st["company_n"] else "—"
+        print(f"{source:<11}{st['n']:>9}{cov:>10.0%}{bonus_acc:>8.0%}{same:>8.0%}{comp_acc:>10}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("capture")
+    c.add_argument("--out", default=DEFAULT_CARDS)
+    b = sub.add_parser("build")
+    b.add_argument("--db", default=back_db.DB_PATH)
+    b.add_argument("--cards", default=DEFAULT_CARDS)
+    b.add_argument("--out", default=DEFAULT_FIXTURES)
+    e = sub.add_parser("eval")
+    e.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    e.add_argument("--min-confidence", type=float, default=None)
+    e.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+
+    if args.cmd == "capture":
+        capture(args.out)
+    elif args.cmd == "build":
+        build(args.db, args.out, args.cards)
+    else:
+        if args.min_confidence is None:
+            from belkart import RULES_MIN_CONFIDENCE
+            args.min_confidence = RULES_MIN_CONFIDENCE
+        evaluate(args.fixtures, args.min_confidence, args.verbose)
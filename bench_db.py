@@ -0,0 +1,98 @@
+# bench_db.py
+"""
+Микро-бенчмарк чтения из БД: старый путь (новое соединение + PRAGMA на каждый
+вызов) против пула соединений из db_pool.
+
+Запуск:
+    python bench_db.py [--db banks.db] [--bank 3] [--category 0] [-n 2000]
+
+Работает на временной копии БД (миграции применяются к копии), исходный
+файл не трогает.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import back_db
+
+
+@contextmanager
+def _connect_per_call():
+    """Так работал back_db до пула: connect + WAL на каждый запрос."""
+    conn = back_db._conn()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _measure(fn: Callable[[], object], n: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "mean": statistics.fmean(samples),
+    }
+
+
+def _pick_target(bank_id: int | None, category_id: int | None) -> tuple[int, int]:
+    if bank_id is not None and category_id is not None:
+        return bank_id, category_id
+    with back_db._read() as conn:
+        row = conn.execute("""
+            SELECT bank_id, category_id FROM partners
+            GROUP BY bank_id, category_id
+            ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+    return row if row else (bank_id or 0, category_id or 0)
+
+
+def run(db_path: str, bank_id: int | None, category_id: int | None, n: int) -> None:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+    tmp_db = os.path.join(tmp_dir, "bench.db")
+    shutil.copyfile(db_path, tmp_db)
+    back_db.DB_PATH = tmp_db
+    back_db._pool = None
+
+    try:
+        # копия может быть старой схемы: чтение идёт из partners_current
+        back_db.init_db()
+        bank_id, category_id = _pick_target(bank_id, category_id)
+        call = lambda: back_db.get_partners_latest_by_bank_category(bank_id, category_id)
+        rows = len(call())
+        print(f"get_partners_latest_by_bank_category({bank_id}, {category_id}) → {rows} строк, n={n}")
+
+        pooled_read = back_db._read
+        back_db._read = _connect_per_call
+        try:
+            old = _measure(call, n)
+        finally:
+            back_db._read = pooled_read
+        new = _measure(call, n)
+
+        print(f"{'путь':<18}{'p50, мс':>10}{'p99, мс':>10}{'mean, мс':>10}")
+        for name, res in (("connect-per-call", old), ("pool", new)):
+            print(f"{name:<18}{res['p50']:>10.3f}{res['p99']:>10.3f}{res['mean']:>10.3f}")
+    finally:
+        back_db.get_pool().close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=back_db.DB_PATH)
+    ap.add_argument("--bank", type=int, default=None)
+    ap.add_argument("--category", type=int, default=None)
+    ap.add_argument("-n", type=int, default=2000)
+    args = ap.parse_args()
+    run(args.db, args.bank, args.category, args.n)
@@ -0,0 +1,109 @@
+# bench_html.py
+"""
+Бенчмарк бэкендов html_parse (selectolax / lxml / bs4) на сохранённых
+страницах: разбор документа + извлечение карточек тем же кодом, что в
+bnb.py / belkart.py (select + select_one + text/get на каждую карточку).
+
+Запуск:
+    python bench_html.py [debug_page.html h.html ...] [--profile auto|bnb|belkart] [-n 20]
+
+Профиль auto — тот, по селекторам которого на странице больше карточек;
+если карточек нет ни в одном (например, h.html), извлекаются ссылки a[href],
+как при разборе пагинации.
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Dict, List
+
+import html_parse
+
+PROFILES: Dict[str, Dict[str, str]] = {
+    "bnb": {
+        "list": "a.partner.popup-modal.js-var_seall.js-var_se",
+        "name": ".partner__title",
+        "bonus": ".label_manyback",
+        "link": "",
+    },
+    "belkart": {
+        "list": "ul.card-list li.card-list__item",
+        "name": ".card-list__title",
+        "bonus": ".card-list__label",
+        "link": "a.card-list__link",
+    },
+    "links": {"list": "a[href]", "name": "", "bonus": "", "link": ""},
+}
+
+
+def _text(node) -> str:
+    return " ".join(node.text().split()) if node is not None else ""
+
+
+def extract(doc, profile: Dict[str, str]) -> List[Dict[str, Any]]:
+    cards = []
+    for card in doc.select(profile["list"]):
+        link_node = card.select_one(profile["link"]) if profile["link"] else card
+        cards.append({
+            "name": _text(card.select_one(profile["name"])) if profile["name"] else _text(card),
+            "bonus": _text(card.select_one(profile["bonus"])) if profile["bonus"] else "",
+            "href": (link_node.get("href") if link_node is not None else None) or "",
+        })
+    return cards
+
+
+def _pick_profile(page_html: str) -> str:
+    doc = html_parse.parse(page_html)
+    counts = {name: len(doc.select(p["list"])) for name, p in PROFILES.items() if name != "links"}
+    best = max(counts, key=counts.get)
+    return best if counts[best] else "links"
+
+
+def run(pages: List[str], profile_name: str, n: int) -> None:
+    backends = html_parse.available_backends()
+    print(f"Бэкенды: {', '.join(backends)}")
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            page_html = f.read()
+        name = _pick_profile(page_html) if profile_name == "auto" else profile_name
+        profile = PROFILES[name]
+
+        results: Dict[str, Dict[str, float]] = {}
+        reference = None
+        same = True
+        for backend in backends:
+            parse_ms: List[float] = []
+            total_ms: List[float] = []
+            cards: List[Dict[str, Any]] = []
+            for _ in range(n):
+                t0 = time.perf_counter()
+                doc = html_parse.parse(page_html, backend)
+                t1 = time.perf_counter()
+                cards = extract(doc, profile)
+                t2 = time.perf_counter()
+                parse_ms.append((t1 - t0) * 1000)
+                total_ms.append((t2 - t0) * 1000)
+            if reference is None:
+                reference = cards
+            elif cards != reference:
+                same = False
+            results[backend] = {
+                "parse": statistics.median(parse_ms),
+                "total": statistics.median(total_ms),
+                "cards": len(cards),
+            }
+
+        print(f"\n{path} ({len(page_html) // 1024} КБ), профиль {name}, результаты совпадают: {same}")
+        print(f"{'бэкенд':<12}{'разбор, мс':>12}{'всего, мс':>12}{'карточек':>10}{'x bs4':>8}")
+        base = results.get("bs4", {}).get("total")
+        for backend, res in results.items():
+            speedup = f"{base / res['total']:.1f}" if base and res["total"] else "—"
+            print(f"{backend:<12}{res['parse']:>12.2f}{res['total']:>12.2f}{res['cards']:>10}{speedup:>8}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("pages", nargs="*", default=["debug_page.html", "h.html"])
+    ap.add_argument("--profile", choices=("auto", *PROFILES), default="auto")
+    ap.add_argument("-n", type=int, default=20)
+    args = ap.parse_args()
+    run(args.pages, args.profile, args.n)
@@ -0,0 +1,79 @@
+# bench_parse.py
+"""
+Бенчмарк извлечения карточек партнёров из DOM: один execute_script на
+страницу (js) против поэлементного обхода find_element/get_attribute
+(elements). Считает время и число запросов к chromedriver.
+
+Запуск (на сохранённой странице, по умолчанию debug_page.html — БНБ):
+    python bench_parse.py [--page debug_page.html] [--list a.partner]
+                          [--name .partner__title] [--bonus .label_manyback] [-n 5]
+
+Селекторы можно взять из banks: partners_list / partner_name / partner_bonus.
+"""
+import argparse
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from driver_pool import DRIVERS
+from update_nw import extract_cards
+
+
+def _count_round_trips(driver) -> Dict[str, int]:
+    """Оборачивает driver.execute — через него идёт каждый запрос к chromedriver."""
+    counter = {"calls": 0}
+    orig_execute = driver.execute
+
+    def counted(driver_command, params=None):
+        counter["calls"] += 1
+        return orig_execute(driver_command, params)
+
+    driver.execute = counted
+    return counter
+
+
+def _measure(fn: Callable[[], List[Dict[str, Any]]], counter: Dict[str, int], n: int) -> Dict[str, float]:
+    samples: List[float] = []
+    calls = 0
+    cards = 0
+    for _ in range(n):
+        counter["calls"] = 0
+        t0 = time.perf_counter()
+        cards = len(fn())
+        samples.append((time.perf_counter() - t0) * 1000)
+        calls = counter["calls"]
+    return {"median_ms": statistics.median(samples), "calls": calls, "cards": cards}
+
+
+def run(page: str, pcfg: Dict[str, Any], n: int) -> None:
+    driver = DRIVERS.acquire()
+    try:
+        driver.get("file://" + os.path.abspath(page))
+        counter = _count_round_trips(driver)
+        js = _measure(lambda: extract_cards(driver, pcfg, mode="js"), counter, n)
+        el = _measure(lambda: extract_cards(driver, pcfg, mode="elements"), counter, n)
+        same = extract_cards(driver, pcfg, mode="js") == extract_cards(driver, pcfg, mode="elements")
+    finally:
+        DRIVERS.release(driver)
+        DRIVERS.close_all()
+
+    print(f"{page}: карточек {js['cards']}, результаты совпадают: {same}")
+    print(f"{'режим':<10}{'медиана, мс':>14}{'запросов':>10}")
+    for name, res in (("js", js), ("elements", el)):
+        print(f"{name:<10}{res['median_ms']:>14.1f}{res['calls']:>10}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--page", default="debug_page.html")
+    ap.add_argument("--list", default="a.partner")
+    ap.add_argument("--name", default=".partner__title")
+    ap.add_argument("--bonus", default=".label_manyback")
+    ap.add_argument("-n", type=int, default=5)
+    args = ap.parse_args()
+    run(args.page, {
+        "partners_list": args.list,
+        "partner_name": args.name,
+        "partner_bonus": args.bonus,
+    }, args.n)
@@ -5,64 +5,68 @@ from urllib.parse import urljoin
 from collections import defaultdict
 
 import requests
-from bs4 import BeautifulSoup
 
-from back_db import save_partners
+from back_db import save_partners, normalize, confirm_partners
+import http_cache
+import html_parse
+import scrape_metrics
 
 ProgressFn = Optional[Callable[[int, int, str], None]]
 
 BASE_URL = "https://bnb.by/bonus/"
 
 
-def _parse_page(url: str, retry_count: int = 3) -> List[Dict[str, Any]]:
-    """
-    Парсит главную страницу БНБ с повторными попытками при ошибках.
-    Извлекает все карточки партнёров: название, ссылку и бонус.
-    """
-    last_error = None
-
-    for attempt in range(1, retry_count + 1):
-        try:
-            print(f"  📡 Попытка загрузки {attempt}/{retry_count}: {url}")
+def _parse_html(page_html: str) -> List[Dict[str, Any]]:
+    """Все карточки партнёров главной страницы: название, ссылка и бонус."""
+    soup = html_parse.parse(page_html)
 
-            resp = requests.get(url, timeout=20)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, "lxml")
+    cards = soup.select("a.partner.popup-modal.js-var_seall.js-var_se")
+    results: List[Dict[str, Any]] = []
 
-            cards = soup.select("a.partner.popup-modal.js-var_seall.js-var_se")
-            results: List[Dict[str, Any]] = []
+    print(f"    🔍 Найдено карточек: {len(cards)}")
 
-            print(f"    🔍 Найдено карточек: {len(cards)}")
-
-            for i, card in enumerate(cards, start=1):
-                try:
-                    link = card.get("href") or ""
-                    if link:
-                        link = urljoin(BASE_URL, link)
-
-                    bonus_tag = card.select_one(".label_manyback")
-                    bonus = (bonus_tag.text or "").strip() if bonus_tag else ""
+    for i, card in enumerate(cards, start=1):
+        try:
+            link = card.get("href") or ""
+            if link:
+                link = urljoin(BASE_URL, link)
+
+            bonus_tag = card.select_one(".label_manyback")
+            bonus = bonus_tag.text().strip() if bonus_tag else ""
+
+            title_tag = card.select_one(".partner__title")
+            title = title_tag.text().strip() if title_tag else ""
+            title = " ".join(title.split())
+
+            if not title:
+                print(f"    ⚠️ Карточка #{i}: пропускаем (нет названия)")
+                continue
+
+            results.append(
+                {
+                    "title": title,
+                    "link": link,
+                    "bonus": bonus,
+                }
+            )
+            print(f"    ✓ {title[:40]} → {bonus}")
+        except Exception as e:
+            print(f"    ⚠️ Ошибка парсинга карточки #{i}: {e}")
 
-                    title_tag = card.select_one(".partner__title")
-                    title = (title_tag.text or "").strip() if title_tag else ""
-                    title = " ".join(title.split())
+    return results
 
-                    if not title:
-                        print(f"    ⚠️ Карточка #{i}: пропускаем (нет названия)")
-                        continue
 
-                    results.append(
-                        {
-                            "title": title,
-                            "link": link,
-                            "bonus": bonus,
-                        }
-                    )
-                    print(f"    ✓ {title[:40]} → {bonus}")
-                except Exception as e:
-                    print(f"    ⚠️ Ошибка парсинга карточки #{i}: {e}")
+def _fetch_page(url: str, retry_count: int = 3) -> Optional[Dict[str, Any]]:
+    """
+    Загружает страницу (условный GET через http_cache) с повторными
+    попытками при ошибках сети. None — не удалось.
+    """
+    last_error = None
 
-            return results
+    for attempt in range(1, retry_count + 1):
+        try:
+            print(f"  📡 Попытка загрузки {attempt}/{retry_count}: {url}")
+            return http_cache.fetch(url, timeout=20)
 
         except requests.exceptions.Timeout:
             last_error = f"Таймаут на попытке {attempt}"
@@ -72,13 +76,24 @@ def _parse_page(url: str, retry_count: int = 3) -> List[Dict[str, Any]]:
             last_error = f"Ошибка сети: {e}"
             print(f"  ⚠️ {last_error}, повторяем...")
             time.sleep(2)
-        except Exception as e:
-            last_error = f"Ошибка парсинга: {e}"
-            print(f"  ❌ {last_error}")
-            return []
 
     print(f"  ❌ Не удалось загрузить страницу после {retry_count} попыток: {last_error}")
-    return []
+    return None
+
+
+def _parse_page(url: str, retry_count: int = 3) -> List[Dict[str, Any]]:
+    """
+    Парсит главную страницу БНБ с повторными попытками при ошибках.
+    Извлекает все карточки партнёров: название, ссылку и бонус.
+    """
+    page = _fetch_page(url, retry_count)
+    if page is None:
+        return []
+    try:
+        return _parse_html(page["text"])
+    except Exception as e:
+        print(f"  ❌ Ошибка парсинга: {e}")
+        return []
 
 
 def save_bnb_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
@@ -94,10 +109,13 @@ def save_bnb_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
         return
 
     grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    # нормализованное имя → название, как оно встретилось первым
+    display_names: Dict[str, str] = {}
 
     for item in items:
         title = (item.get("title") or "").strip()
-        if not title:
+        key = normalize(title)
+        if not key:
             print("⚠️ Пропускаем партнёра без названия")
             continue
 
@@ -105,11 +123,13 @@ def save_bnb_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
         bonus = " ".join(bonus.split())
         link = item.get("link") or ""
 
-        grouped[title].append({"bonus": bonus, "link": link})
+        display_names.setdefault(key, title)
+        grouped[key].append({"bonus": bonus, "link": link})
 
     partners_data: List[Dict[str, Any]] = []
 
-    for company, records in grouped.items():
+    for key, records in grouped.items():
+        company = display_names[key]
         best_record = None
         for rec in records:
             if rec.get("bonus"):
@@ -141,7 +161,9 @@ def save_bnb_items(bank_id: int, items: List[Dict[str, Any]]) -> None:
         )
 
     print(f"\n📝 Сохраняю {len(partners_data)} уникальных партнёров...")
-    save_partners(partners=partners_data, bank_id=bank_id, category_id=0)
+    with scrape_metrics.phase("db_save"):
+        save_partners(partners=partners_data, bank_id=bank_id, category_id=0)
+    scrape_metrics.add(saved=len(partners_data))
     print(f"✅ Сохранено {len(partners_data)} уникальных партнёров БНБ")
 
 
@@ -160,7 +182,24 @@ def fetch_promotions_bnb(
         progress(banks_done, banks_total, note)
 
     try:
-        all_items = _parse_page(BASE_URL)
+        with scrape_metrics.phase("page_load"):
+            page = _fetch_page(BASE_URL)
+
+        if page is not None and http_cache.all_unchanged([page]):
+            confirmed = confirm_partners(bank_id, 0)
+            saved_ms = http_cache.note_skipped([page], page["meta"].get("save_ms", 0.0))
+            done = (
+                f"[bank {bank_id}] ♻️ БНБ: страница не изменилась — подтверждено "
+                f"{confirmed} партнёров без разбора (сэкономлено {saved_ms:.0f} мс CPU)"
+            )
+            print(done)
+            if progress:
+                progress(banks_done, banks_total, done)
+            return []
+
+        with scrape_metrics.phase("extract"):
+            all_items = http_cache.timed_parse(page, _parse_html) if page is not None else []
+        scrape_metrics.add(cards=len(all_items))
 
         if not all_items:
             print(f"[bank {bank_id}] ⚠️ Не удалось загрузить партнёров")
@@ -172,7 +211,10 @@ def fetch_promotions_bnb(
 
         print(f"\n[bank {bank_id}] ✅ Загружено: {len(all_items)} партнёров")
 
+        started = time.process_time()
         save_bnb_items(bank_id, all_items)
+        page["meta"] = {"save_ms": (time.process_time() - started) * 1000}
+        http_cache.commit([page])
 
         done = f"[bank {bank_id}] ✅ БНБ завершён: {len(all_items)} партнёров загружено"
         print(done)
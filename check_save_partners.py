@@ -0,0 +1,164 @@
+# check_save_partners.py
+"""
+Регрессионная проверка save_partners: пакетная сверка (bulk=True) против
+прежней построчной (bulk=False).
+
+На двух временных копиях БД прогоняются одни и те же «сканы» категории,
+собранные из её текущих партнёров: без изменений, с пропавшими, новыми,
+сменившими бонус и повторяющимися партнёрами, затем повтор — чтобы прошли
+все переходы статусов (new → live → ready → new_delete → delete).
+После каждого скана строки partners обеих копий должны совпасть целиком,
+partners_current — без учёта checked_at.
+
+Запуск:
+    python check_save_partners.py [--db banks.db] [--bank 3] [--category 5]
+
+Исходный файл не трогает; код выхода 1 — если есть расхождения.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import types
+from typing import Any, Dict, List, Tuple
+
+import back_db
+
+
+def _pick_target(bank_id: int | None, category_id: int | None) -> Tuple[int, int]:
+    if bank_id is not None and category_id is not None:
+        return bank_id, category_id
+    with back_db._read() as conn:
+        row = conn.execute("""
+            SELECT bank_id, category_id FROM partners_current
+            WHERE status IN ('new', 'live')
+            GROUP BY bank_id, category_id
+            ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+    return row if row else (bank_id or 0, category_id or 0)
+
+
+def _current_partners(bank_id: int, category_id: int) -> List[Dict[str, Any]]:
+    with back_db._read() as conn:
+        rows = conn.execute("""
+            SELECT partner_name, partner_bonus, partner_link FROM partners_current
+            WHERE bank_id = ? AND category_id = ? AND status IN ('new', 'live')
+            ORDER BY partner_name
+        """, (bank_id, category_id)).fetchall()
+    return [{"partner_name": n, "partner_bonus": b, "partner_link": l} for n, b, l in rows]
+
+
+def build_scans(base: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Последовательность сканов одной категории."""
+    changed = [dict(p) for p in base]
+    for p in changed[::5]:
+        p["partner_bonus"] = f"{p['partner_bonus'] or ''} +1"
+    for p in changed[1::7]:
+        p["partner_link"] = f"  {p['partner_link'] or ''}  "   # пробелы вокруг ссылки
+    changed = [p for i, p in enumerate(changed) if i % 6 != 3]  # часть пропала
+    changed += [
+        {"partner_name": "Проверка: новый партнёр", "partner_bonus": "5", "partner_link": None},
+        {"partner_name": "Проверка: новый партнёр", "partner_bonus": "7", "partner_link": ""},
+    ]
+    if changed:
+        changed.append(dict(changed[0]))                       # повтор внутри скана
+    return [
+        ("без изменений", [dict(p) for p in base]),
+        ("изменения", changed),
+        ("повтор изменений", [dict(p) for p in changed]),
+        ("возврат к исходному", [dict(p) for p in base]),
+        ("пустой бонус", [dict(p, partner_bonus=" ") for p in base[:3]] + base[3:]),
+    ]
+
+
+class _FrozenDatetime(datetime.datetime):
+    """datetime.now() с фиксированным временем скана — checked_at совпадают в обеих копиях."""
+    frozen = datetime.datetime(2000, 1, 1)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+
+def _use_db(path: str) -> None:
+    if back_db._pool is not None:
+        back_db.get_pool().close()
+    back_db.DB_PATH = path
+    back_db._pool = None
+
+
+def _snapshot(bank_id: int, category_id: int) -> Tuple[List[tuple], List[tuple]]:
+    with back_db._read() as conn:
+        partners = conn.execute(
+            "SELECT * FROM partners WHERE bank_id = ? AND category_id = ? ORDER BY id",
+            (bank_id, category_id),
+        ).fetchall()
+        cur = conn.execute(
+            "SELECT * FROM partners_current WHERE bank_id = ? AND category_id = ?",
+            (bank_id, category_id),
+        )
+        cols = [d[0] for d in cur.description]
+        current = sorted(
+            tuple(v for c, v in zip(cols, row) if c != "checked_at")
+            for row in cur.fetchall()
+        )
+    return partners, current
+
+
+def _diff(name: str, a: List[tuple], b: List[tuple]) -> List[str]:
+    if a == b:
+        return []
+    only_a = [r for r in a if r not in b][:5]
+    only_b = [r for r in b if r not in a][:5]
+    return [f"  {name}: bulk {len(a)} строк, построчно {len(b)}",
+            *(f"    bulk:       {r}" for r in only_a),
+            *(f"    построчно:  {r}" for r in only_b)]
+
+
+def run(db_path: str, bank_id: int | None, category_id: int | None) -> bool:
+    tmp_dir = tempfile.mkdtemp(prefix="check_save_partners_")
+    paths = {bulk: os.path.join(tmp_dir, f"{'bulk' if bulk else 'rowwise'}.db") for bulk in (True, False)}
+    for path in paths.values():
+        shutil.copyfile(db_path, path)
+
+    real_datetime = back_db.datetime
+    back_db.datetime = types.SimpleNamespace(**{**vars(datetime), "datetime": _FrozenDatetime})
+    ok = True
+    try:
+        for path in paths.values():
+            _use_db(path)
+            back_db.init_db()
+        bank_id, category_id = _pick_target(bank_id, category_id)
+        scans = build_scans(_current_partners(bank_id, category_id))
+        print(f"bank {bank_id}, category {category_id}: партнёров {len(scans[0][1])}, сканов {len(scans)}")
+
+        for step, (title, partners) in enumerate(scans, 1):
+            _FrozenDatetime.frozen = datetime.datetime(2000, 1, step)
+            snapshots = {}
+            for bulk, path in paths.items():
+                _use_db(path)
+                back_db.save_partners([dict(p) for p in partners], bank_id, category_id, bulk=bulk)
+                snapshots[bulk] = _snapshot(bank_id, category_id)
+            problems = (_diff("partners", snapshots[True][0], snapshots[False][0])
+                        + _diff("partners_current", snapshots[True][1], snapshots[False][1]))
+            print(f"{step}. {title}: {len(partners)} → {'совпадает' if not problems else 'РАСХОЖДЕНИЕ'}")
+            for line in problems:
+                print(line)
+            ok = ok and not problems
+    finally:
+        back_db.datetime = real_datetime
+        if back_db._pool is not None:
+            back_db.get_pool().close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=back_db.DB_PATH)
+    ap.add_argument("--bank", type=int, default=None)
+    ap.add_argument("--category", type=int, default=None)
+    args = ap.parse_args()
+    sys.exit(0 if run(args.db, args.bank, args.category) else 1)
@@ -0,0 +1,393 @@
+# db_migrations.py
+"""
+Версионированные миграции схемы БД.
+
+Текущая версия хранится в таблице schema_version. При старте
+migrate(conn) применяет по порядку шаги с версией больше текущей,
+каждый — в своей транзакции. Если версия БД больше известной коду
+(БД от более новой версии бота) — падаем сразу.
+
+Шаги, которым нужна нормализация имён, вызывают SQL-функцию
+normalize_name(text) — её регистрирует вызывающий код (back_db.init_db).
+"""
+import datetime
+import sqlite3
+from typing import Callable, List, Tuple
+
+
+class SchemaVersionError(RuntimeError):
+    """Версия схемы в БД неизвестна этой версии кода."""
+
+
+def _has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table});"))
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    if not _has_column(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
+
+# ---------- ШАГИ ----------
+
+def _m001_base_tables(conn: sqlite3.Connection) -> None:
+    """Базовые таблицы (для существующих БД — только недостающее)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS banks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            loyalty_url TEXT NOT NULL,
+            cookie TEXT,
+            container TEXT,
+            element TEXT,
+            button_more TEXT,
+            partners_list TEXT,
+            partner_name TEXT,
+            partner_bonus TEXT,
+            bonus_unit TEXT,
+            parser_type TEXT DEFAULT 'default'
+        );
+    """)
+    _add_column(conn, "banks", "parser_type", "TEXT DEFAULT 'default'")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bank_id INTEGER NOT NULL,
+            partners_count INTEGER,
+            checked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            FOREIGN KEY(bank_id) REFERENCES banks(id)
+        );
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS partners (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bank_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            partner_name TEXT NOT NULL,
+            partner_bonus TEXT,
+            partner_link TEXT,
+            checked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'live',
+            FOREIGN KEY(bank_id) REFERENCES banks(id),
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        );
+    """)
+    _add_column(conn, "partners", "status", "TEXT DEFAULT 'live'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_partners_bank_cat_name ON partners(bank_id, category_id, partner_name);")
+
+    # история смены статусов (на неё смотрят /check_db и /init_status)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS status_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            partner_name TEXT NOT NULL,
+            bank_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            old_status TEXT,
+            new_status TEXT,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tg_users (
+            chat_id INTEGER PRIMARY KEY,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            entered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            action TEXT
+        );
+    """)
+    _add_column(conn, "log", "action", "TEXT")
+
+
+def _m002_name_norm(conn: sqlite3.Connection) -> None:
+    """partners.name_norm + индекс (name_norm, bank_id), дозаполнение старых строк."""
+    _add_column(conn, "partners", "name_norm", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_partners_name_norm ON partners(name_norm, bank_id);")
+    conn.execute("UPDATE partners SET name_norm = normalize_name(partner_name) WHERE name_norm IS NULL;")
+
+
+def _m003_partners_current(conn: sqlite3.Connection) -> None:
+    """Снимок актуальных партнёров partners_current и поисковый индекс partners_fts."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS partners_current (
+            partner_id INTEGER PRIMARY KEY,
+            bank_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            partner_name TEXT NOT NULL,
+            partner_bonus TEXT,
+            partner_link TEXT,
+            checked_at DATETIME,
+            status TEXT,
+            name_norm TEXT
+        );
+    """)
+    _add_column(conn, "partners_current", "name_norm", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_partners_current_bank_cat_name ON partners_current(bank_id, category_id, partner_name);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_partners_current_checked ON partners_current(checked_at);")
+    # trigram — чтобы работал поиск по подстроке и для кириллицы
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS partners_fts
+        USING fts5(name_norm, tokenize='trigram');
+    """)
+
+    # строки с MAX(checked_at) по (bank_id, category_id, partner_name)
+    conn.execute("DELETE FROM partners_current;")
+    conn.execute("""
+        INSERT INTO partners_current (
+            partner_id, bank_id, category_id, partner_name,
+            partner_bonus, partner_link, checked_at, status, name_norm
+        )
+        SELECT id, bank_id, category_id, partner_name,
+               partner_bonus, partner_link, checked_at, status, name_norm
+        FROM (
+            SELECT p.*,
+                   MAX(checked_at) OVER (
+                       PARTITION BY bank_id, category_id, partner_name
+                   ) AS max_checked
+            FROM partners p
+        )
+        WHERE checked_at = max_checked;
+    """)
+    conn.execute("DELETE FROM partners_fts;")
+    conn.execute("""
+        INSERT INTO partners_fts(rowid, name_norm)
+        SELECT partner_id, name_norm FROM partners_current;
+    """)
+
+
+def _m004_wait_strategy(conn: sqlite3.Connection) -> None:
+    """banks.wait_strategy — как парсер ждёт загрузку страницы (см. waits.py)."""
+    _add_column(conn, "banks", "wait_strategy", "TEXT DEFAULT 'cards'")
+
+
+def _m005_lean_browsing(conn: sqlite3.Connection) -> None:
+    """banks.lean_browsing — 0, если банку нужен браузер без блокировки ресурсов."""
+    _add_column(conn, "banks", "lean_browsing", "INTEGER DEFAULT 1")
+
+
+def _m006_scrape_engine(conn: sqlite3.Connection) -> None:
+    """banks.scrape_engine — чем банк парсился успешно в прошлый раз (http / selenium)."""
+    _add_column(conn, "banks", "scrape_engine", "TEXT")
+
+
+def _m007_api_config(conn: sqlite3.Connection) -> None:
+    """banks.api_config — JSON-эндпоинт каталога для parser_type='api_json'."""
+    _add_column(conn, "banks", "api_config", "TEXT")
+
+
+def _m008_llm_cache(conn: sqlite3.Connection) -> None:
+    """llm_cache — ответы GigaChat по тексту карточки (ключ — sha256 версии промпта и текста)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            raw_text TEXT NOT NULL,
+            company TEXT,
+            bonus TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def _m009_http_cache(conn: sqlite3.Connection) -> None:
+    """
+    http_cache — ETag/Last-Modified/хэш содержимого по URL для условных GET;
+    partners.last_confirmed_at — когда партнёр последний раз подтверждён
+    (в том числе прогоном, пропущенным из-за неизменной страницы).
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS http_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            body BLOB,
+            size INTEGER,
+            parse_ms REAL,
+            meta TEXT,
+            fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    _add_column(conn, "partners", "last_confirmed_at", "DATETIME")
+
+
+def _m010_partner_categories(conn: sqlite3.Connection) -> None:
+    """
+    partner_categories — в каких категориях банка встречается партнёр.
+    Для банков с пересекающимися категориями (Кактус) сам партнёр хранится
+    один раз в partners с category_id = 0, а принадлежность к категориям —
+    здесь, по name_norm.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS partner_categories (
+            bank_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            name_norm TEXT NOT NULL,
+            PRIMARY KEY (bank_id, name_norm, category_id)
+        );
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_partner_categories_category
+        ON partner_categories(bank_id, category_id);
+    """)
+
+
+def _m011_scrape_schedule(conn: sqlite3.Connection) -> None:
+    """
+    scrape_schedule — состояние планировщика (scheduler.py) по банкам:
+    оценка частоты изменений, интервал, время следующего запуска и итог
+    последнего, чтобы после рестарта бота расписание продолжилось.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_schedule (
+            bank_id INTEGER PRIMARY KEY,
+            change_rate REAL,
+            interval_hours REAL,
+            next_run_at DATETIME,
+            last_started_at DATETIME,
+            last_finished_at DATETIME,
+            last_status TEXT,
+            last_changes INTEGER,
+            runs INTEGER DEFAULT 0
+        );
+    """)
+
+
+def _m012_scrape_runs(conn: sqlite3.Connection) -> None:
+    """
+    scrape_runs / scrape_tasks — журнал прогонов парсинга с чекпоинтами.
+    Задача — банк (category_name = '') или категория банка; по state
+    прогон после падения продолжается с первой незавершённой задачи.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at DATETIME,
+            finished_at DATETIME,
+            tasks_total INTEGER DEFAULT 0,
+            tasks_done INTEGER DEFAULT 0,
+            tasks_failed INTEGER DEFAULT 0
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            bank_id INTEGER NOT NULL,
+            category_name TEXT NOT NULL DEFAULT '',
+            state TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            started_at DATETIME,
+            finished_at DATETIME,
+            duration_s REAL,
+            error TEXT,
+            UNIQUE (run_id, bank_id, category_name)
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_runs_kind ON scrape_runs(kind, status);")
+
+
+def _m013_scrape_metrics(conn: sqlite3.Connection) -> None:
+    """
+    scrape_metrics — метрики парсинга (scrape_metrics.py): строка на банк
+    (category_name = '') и на категорию в каждом прогоне — длительность,
+    время по фазам (JSON), число карточек и сохранённых партнёров,
+    запросы к chromedriver.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER,
+            bank_id INTEGER NOT NULL,
+            category_name TEXT NOT NULL DEFAULT '',
+            started_at DATETIME,
+            duration_s REAL,
+            cards INTEGER,
+            saved INTEGER,
+            round_trips INTEGER,
+            phases TEXT
+        );
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_scrape_metrics_key
+        ON scrape_metrics(bank_id, category_name, id);
+    """)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "базовые таблицы, status_log, log.action", _m001_base_tables),
+    (2, "partners.name_norm", _m002_name_norm),
+    (3, "partners_current + partners_fts", _m003_partners_current),
+    (4, "banks.wait_strategy", _m004_wait_strategy),
+    (5, "banks.lean_browsing", _m005_lean_browsing),
+    (6, "banks.scrape_engine", _m006_scrape_engine),
+    (7, "banks.api_config", _m007_api_config),
+    (8, "llm_cache", _m008_llm_cache),
+    (9, "http_cache, partners.last_confirmed_at", _m009_http_cache),
+    (10, "partner_categories", _m010_partner_categories),
+    (11, "scrape_schedule", _m011_scrape_schedule),
+    (12, "scrape_runs, scrape_tasks", _m012_scrape_runs),
+    (13, "scrape_metrics", _m013_scrape_metrics),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ---------- RUNNER ----------
+
+def get_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER NOT NULL,
+            description TEXT,
+            applied_at DATETIME
+        );
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version;").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """
+    Доводит схему до LATEST_VERSION. Возвращает список применённых версий.
+    SchemaVersionError — если БД новее, чем знает код.
+    """
+    current = get_version(conn)
+    conn.commit()
+    if current > LATEST_VERSION:
+        raise SchemaVersionError(
+            f"Версия схемы БД {current} неизвестна (код знает до {LATEST_VERSION}). "
+            f"Обновите бота или используйте подходящую БД."
+        )
+
+    applied: List[int] = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"🔧 Миграция {version}: {description}")
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?);",
+                (version, description, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
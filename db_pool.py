@@ -0,0 +1,79 @@
+# db_pool.py
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений SQLite.
+
+    - чтение: одно соединение на поток (threading.local), переиспользуется
+      между вызовами — поток бота, ночной парсер и дайджест больше не
+      открывают новое соединение на каждый запрос;
+    - запись: одно общее соединение, доступ сериализован блокировкой,
+      поэтому писатели не конкурируют за lock файла БД.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._wal_checked = False
+
+    def _open(self) -> sqlite3.Connection:
+        # check_same_thread=False: читатель всё равно используется одним потоком,
+        # но закрыть его при остановке нужно из другого
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        # journal_mode хранится в самом файле БД — достаточно выставить один раз
+        if not self._wal_checked:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            self._wal_checked = True
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Соединение для чтения, закреплённое за текущим потоком."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            conn.execute("PRAGMA query_only=ON;")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        yield conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Единственное соединение для записи.
+        commit при успешном выходе, rollback при исключении.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def close(self) -> None:
+        """Закрывает все соединения пула (при остановке процесса)."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
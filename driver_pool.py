@@ -0,0 +1,253 @@
+# driver_pool.py
+"""
+Общий пул headless Chrome для парсеров (update_nw, сaсtus).
+
+- acquire()/release() — взять драйвер и вернуть; свободный драйвер
+  переиспользуется, перед выдачей проверяется дешёвым
+  execute_script("return 1") (мёртвый — закрываем и запускаем новый);
+- драйвер пересоздаётся, если открыл больше DRIVER_MAX_PAGES страниц
+  или его процессы Chrome заняли больше DRIVER_MAX_RSS_MB памяти;
+- одновременно живёт не больше DRIVER_POOL_SIZE браузеров;
+- close_idle() — закрыть свободные (в конце прогона), при выходе из
+  процесса закрываются все (atexit).
+
+Профиль «lean» (по умолчанию): без картинок, page_load_strategy=eager,
+через CDP Network.setBlockedURLs отбрасываются картинки, шрифты, видео и
+счётчики аналитики — парсерам нужен только текст DOM. Банкам, которым это
+мешает, ставится banks.lean_browsing = 0 (получат обычный браузер).
+"""
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "4"))
+DRIVER_MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "200"))
+DRIVER_MAX_RSS_MB = int(os.getenv("DRIVER_MAX_RSS_MB", "1200"))
+# таймаут загрузки страницы по умолчанию у Selenium — 300 с
+DEFAULT_PAGE_LOAD_TIMEOUT = 300
+LEAN_BROWSING = os.getenv("LEAN_BROWSING", "1") != "0"
+
+BLOCKED_URL_PATTERNS = [
+    # картинки, шрифты, медиа
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.avif",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg",
+    # аналитика и трекеры
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*mc.yandex.ru*", "*yandex.ru/metrika*", "*top-fwz1.mail.ru*",
+    "*connect.facebook.net*", "*vk.com/rtrg*", "*hotjar.com*", "*clarity.ms*",
+    "*jivosite.com*", "*jivo.ru*",
+]
+
+
+def chrome_options(lean: bool = False) -> Options:
+    opts = Options()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--window-size=1920,1080")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--disable-extensions")
+    opts.add_argument("--disable-plugins")
+    if lean:
+        opts.page_load_strategy = "eager"
+        opts.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    return opts
+
+
+def _process_tree_rss_mb(root_pid: int) -> Optional[float]:
+    """Суммарный RSS процесса и всех его потомков по /proc (Linux)."""
+    try:
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # comm в скобках может содержать пробелы — берём всё после ')'
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        total_kb = 0
+        stack = [root_pid]
+        while stack:
+            pid = stack.pop()
+            stack.extend(children.get(pid, []))
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total_kb += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return total_kb / 1024
+    except OSError:
+        return None
+
+
+class DriverPool:
+    def __init__(self, size: int = DRIVER_POOL_SIZE,
+                 max_pages: int = DRIVER_MAX_PAGES,
+                 max_rss_mb: int = DRIVER_MAX_RSS_MB) -> None:
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # свободные драйверы по профилю: "lean" / "full"
+        self._idle: Dict[str, List[webdriver.Chrome]] = {"lean": [], "full": []}
+        self._busy: List[webdriver.Chrome] = []
+        self._pages: Dict[int, int] = {}
+        self._profile: Dict[int, str] = {}
+        self.stats = {"launches": 0, "reuses": 0, "recycles": 0, "unhealthy": 0, "quits": 0}
+
+    # ---------- API ----------
+    def acquire(self, page_load_timeout: Optional[float] = None,
+                lean: bool = True) -> webdriver.Chrome:
+        """Свободный живой драйвер или новый. Блокирует, если все слоты заняты."""
+        profile = "lean" if lean and LEAN_BROWSING else "full"
+        self._slots.acquire()
+        try:
+            driver = self._take_idle(profile)
+            if driver is None:
+                driver = self._launch(profile)
+            with self._lock:
+                self._busy.append(driver)
+            if page_load_timeout:
+                driver.set_page_load_timeout(page_load_timeout)
+            return driver
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, driver: Optional[webdriver.Chrome]) -> None:
+        """Вернуть драйвер в пул (или закрыть, если он исчерпал ресурс)."""
+        if driver is None:
+            return
+        with self._lock:
+            if driver not in self._busy:
+                return
+            self._busy.remove(driver)
+        try:
+            reason = self._recycle_reason(driver)
+            if reason:
+                print(f"♻️ Драйвер пересоздаётся: {reason}")
+                self._count("recycles")
+                self._quit(driver)
+                return
+            try:
+                driver.set_page_load_timeout(DEFAULT_PAGE_LOAD_TIMEOUT)
+                driver.get("about:blank")
+            except Exception:
+                self._quit(driver)
+                return
+            with self._lock:
+                self._idle[self._profile.get(id(driver), "full")].append(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def checkout(self, page_load_timeout: Optional[float] = None,
+                 lean: bool = True) -> Iterator[webdriver.Chrome]:
+        driver = self.acquire(page_load_timeout, lean)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close_idle(self) -> None:
+        """Закрывает свободные драйверы (между ночными прогонами они не нужны)."""
+        with self._lock:
+            idle = self._idle["lean"] + self._idle["full"]
+            self._idle = {"lean": [], "full": []}
+        for driver in idle:
+            self._quit(driver)
+
+    def close_all(self) -> None:
+        with self._lock:
+            drivers = self._idle["lean"] + self._idle["full"] + self._busy
+            self._idle, self._busy = {"lean": [], "full": []}, []
+        for driver in drivers:
+            self._quit(driver)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            idle = len(self._idle["lean"]) + len(self._idle["full"])
+            return {**self.stats, "idle": idle, "busy": len(self._busy)}
+
+    # ---------- internals ----------
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _take_idle(self, profile: str) -> Optional[webdriver.Chrome]:
+        while True:
+            with self._lock:
+                if not self._idle[profile]:
+                    return None
+                driver = self._idle[profile].pop()
+            try:
+                driver.execute_script("return 1")
+            except Exception:
+                self._count("unhealthy")
+                self._quit(driver)
+                continue
+            self._count("reuses")
+            return driver
+
+    def _launch(self, profile: str) -> webdriver.Chrome:
+        driver = webdriver.Chrome(options=chrome_options(lean=profile == "lean"))
+        self._count("launches")
+        self._pages[id(driver)] = 0
+        self._profile[id(driver)] = profile
+        if profile == "lean":
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+            except Exception as e:
+                print(f"⚠️ CDP-блокировка ресурсов недоступна: {e}")
+
+        # считаем загрузки страниц для лимита DRIVER_MAX_PAGES
+        orig_get = driver.get
+
+        def counted_get(url: str) -> None:
+            if url != "about:blank":
+                self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+            return orig_get(url)
+
+        driver.get = counted_get
+        return driver
+
+    def _recycle_reason(self, driver: webdriver.Chrome) -> Optional[str]:
+        pages = self._pages.get(id(driver), 0)
+        if pages >= self.max_pages:
+            return f"открыто страниц {pages} ≥ {self.max_pages}"
+        try:
+            rss = _process_tree_rss_mb(driver.service.process.pid)
+        except AttributeError:
+            rss = None
+        if rss is not None and rss > self.max_rss_mb:
+            return f"RSS {rss:.0f} МБ > {self.max_rss_mb} МБ"
+        return None
+
+    def _quit(self, driver: webdriver.Chrome) -> None:
+        self._pages.pop(id(driver), None)
+        self._profile.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        self._count("quits")
+
+
+DRIVERS = DriverPool()
+atexit.register(DRIVERS.close_all)
@@ -0,0 +1,137 @@
+# html_parse.py
+"""
+Разбор HTML для HTTP-парсеров (bnb.py, belkart.py) с выбором бэкенда.
+
+BeautifulSoup строит дерево объектов Python и ходит по нему на Python —
+на больших страницах каталога это дороже самой загрузки. Здесь один и
+тот же маленький интерфейс (parse → Document.select/select_one →
+Node.text/get) поверх трёх бэкендов:
+    selectolax — если установлен (быстрее всех);
+    lxml       — lxml.html + скомпилированные CSSSelector (кэш по строке);
+    bs4        — BeautifulSoup, запасной вариант.
+
+HTML_PARSER=auto|selectolax|lxml|bs4 (по умолчанию auto — первый доступный).
+"""
+import os
+from functools import lru_cache
+from typing import List, Optional
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+try:
+    from lxml import html as _lxml_html
+    from lxml.cssselect import CSSSelector as _CSSSelector
+except ImportError:
+    _lxml_html = None
+    _CSSSelector = None
+
+from bs4 import BeautifulSoup
+
+BACKENDS = ("selectolax", "lxml", "bs4")
+
+
+def available_backends() -> List[str]:
+    found = []
+    if _SelectolaxParser is not None:
+        found.append("selectolax")
+    if _lxml_html is not None and _CSSSelector is not None:
+        found.append("lxml")
+    found.append("bs4")
+    return found
+
+
+def pick_backend(name: Optional[str] = None) -> str:
+    name = (name or os.getenv("HTML_PARSER") or "auto").strip().lower()
+    available = available_backends()
+    if name in available:
+        return name
+    if name not in ("auto", "") and name in BACKENDS:
+        print(f"⚠️ HTML_PARSER={name} недоступен, используем {available[0]}")
+    return available[0]
+
+
+# ---------- УЗЛЫ ----------
+class Node:
+    """Элемент документа: текст, атрибуты и поиск внутри."""
+
+    __slots__ = ("_el", "_backend")
+
+    def __init__(self, el, backend: str):
+        self._el = el
+        self._backend = backend
+
+    def text(self) -> str:
+        if self._backend == "selectolax":
+            return self._el.text(deep=True) or ""
+        if self._backend == "lxml":
+            return self._el.text_content() or ""
+        return self._el.get_text() or ""
+
+    def get(self, attr: str, default: Optional[str] = None) -> Optional[str]:
+        if self._backend == "selectolax":
+            value = self._el.attributes.get(attr)
+            return default if value is None else value
+        return self._el.get(attr, default)
+
+    def __getitem__(self, attr: str) -> str:
+        value = self.get(attr)
+        if value is None:
+            raise KeyError(attr)
+        return value
+
+    def select(self, css: str) -> List["Node"]:
+        return _select(self._el, css, self._backend)
+
+    def select_one(self, css: str) -> Optional["Node"]:
+        return _select_one(self._el, css, self._backend)
+
+
+class Document(Node):
+    """Корень разобранной страницы; backend — каким парсером разобрана."""
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+
+@lru_cache(maxsize=256)
+def _compiled(css: str):
+    return _CSSSelector(css)
+
+
+def _select(el, css: str, backend: str) -> List[Node]:
+    if backend == "selectolax":
+        found = el.css(css)
+    elif backend == "lxml":
+        found = _compiled(css)(el)
+    else:
+        found = el.select(css)
+    return [Node(x, backend) for x in found]
+
+
+def _select_one(el, css: str, backend: str) -> Optional[Node]:
+    if backend == "selectolax":
+        found = el.css_first(css)
+    elif backend == "lxml":
+        matches = _compiled(css)(el)
+        found = matches[0] if matches else None
+    else:
+        found = el.select_one(css)
+    return Node(found, backend) if found is not None else None
+
+
+# ---------- РАЗБОР ----------
+def parse(page_html: str, backend: Optional[str] = None) -> Document:
+    backend = pick_backend(backend)
+    page_html = page_html or "<html></html>"
+    if backend == "selectolax":
+        return Document(_SelectolaxParser(page_html), backend)
+    if backend == "lxml":
+        return Document(_lxml_html.document_fromstring(page_html), backend)
+    return Document(BeautifulSoup(page_html, "lxml" if _lxml_html is not None else "html.parser"), backend)
@@ -0,0 +1,171 @@
+# http_cache.py
+"""
+Условные GET для HTTP-парсеров (bnb.py, belkart.py).
+
+Для каждого URL в таблице http_cache лежат ETag, Last-Modified, хэш
+нормализованного содержимого (без <script>/<style>, комментариев, токенов
+сессии и лишних пробелов) и сам HTML. Следующий запрос идёт с
+If-None-Match / If-Modified-Since; страница считается неизменной при 304
+или при совпадении хэша. Если неизменны все страницы банка, парсер не
+разбирает их и не сверяет партнёров, а только подтверждает их
+(back_db.confirm_partners).
+
+Кэш записывается (commit) только после успешного сохранения партнёров —
+иначе упавший прогон навсегда «застыл» бы на непрочитанной странице.
+HTTP_CACHE=0 — отключить: всегда полная загрузка и разбор.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from back_db import get_http_cache, put_http_cache
+import http_client
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE", "1") != "0"
+
+_VOLATILE = [
+    re.compile(r"<script\b.*?</script>", re.S | re.I),
+    re.compile(r"<style\b.*?</style>", re.S | re.I),
+    re.compile(r"<!--.*?-->", re.S),
+    re.compile(r"""(sessid|nonce|csrf[_-]?token)(["']?\s*[:=]\s*)["'][^"']*["']""", re.I),
+]
+
+_stats_lock = threading.Lock()
+STATS: Dict[str, float] = {}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        STATS.clear()
+        STATS.update({
+            "requests": 0, "not_modified": 0, "same_hash": 0,
+            "bytes_downloaded": 0, "bytes_saved": 0,
+            "cpu_ms_saved": 0.0, "skipped": 0,
+        })
+
+
+reset_stats()
+
+
+def _count(**deltas: float) -> None:
+    with _stats_lock:
+        for key, value in deltas.items():
+            STATS[key] += value
+
+
+def get_stats() -> Dict[str, float]:
+    with _stats_lock:
+        return dict(STATS)
+
+
+def content_hash(page_html: str) -> str:
+    text = page_html
+    for pattern in _VOLATILE:
+        text = pattern.sub(lambda m: m.group(1) + m.group(2) if m.lastindex else " ", text)
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def lookup(url: str) -> Optional[Dict[str, Any]]:
+    return get_http_cache(url) if HTTP_CACHE_ENABLED else None
+
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if entry and entry.get("body"):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def make_page(
+    url: str,
+    status: int,
+    text: Optional[str],
+    headers: Any,
+    entry: Optional[Dict[str, Any]],
+    final_url: str = "",
+) -> Dict[str, Any]:
+    """
+    Страница в виде словаря {url, final_url, text, unchanged, etag,
+    last_modified, content_hash, size, parse_ms, meta}. При 304 текст
+    берётся из кэша.
+    """
+    _count(requests=1)
+    if status == 304 and entry and entry.get("body"):
+        _count(not_modified=1, bytes_saved=entry["size"])
+        return {
+            "url": url, "final_url": final_url or url,
+            "text": zlib.decompress(entry["body"]).decode("utf-8"),
+            "unchanged": True,
+            "etag": entry.get("etag"), "last_modified": entry.get("last_modified"),
+            "content_hash": entry["content_hash"], "size": entry["size"],
+            "parse_ms": entry["parse_ms"], "meta": entry["meta"],
+        }
+
+    text = text or ""
+    size = len(text.encode("utf-8"))
+    digest = content_hash(text)
+    unchanged = bool(entry) and entry.get("content_hash") == digest
+    _count(bytes_downloaded=size, same_hash=1 if unchanged else 0)
+    return {
+        "url": url, "final_url": final_url or url,
+        "text": text,
+        "unchanged": unchanged,
+        "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+        "content_hash": digest, "size": size,
+        "parse_ms": entry["parse_ms"] if entry else 0.0,
+        "meta": entry["meta"] if entry else {},
+    }
+
+
+def fetch(url: str, timeout: float = 20) -> Dict[str, Any]:
+    """GET через общий requests.Session; сетевые ошибки пробрасываются (повторы — у вызывающего)."""
+    entry = lookup(url)
+    resp = http_client.get_session().get(url, headers=conditional_headers(entry), timeout=timeout)
+    if resp.status_code != 304:
+        resp.raise_for_status()
+    return make_page(url, resp.status_code, resp.text, resp.headers, entry, final_url=resp.url)
+
+
+def all_unchanged(pages: List[Dict[str, Any]]) -> bool:
+    return HTTP_CACHE_ENABLED and bool(pages) and all(p["unchanged"] for p in pages)
+
+
+def timed_parse(page: Dict[str, Any], parse):
+    """parse(page['text']) с замером процессорного времени в page['parse_ms']."""
+    started = time.process_time()
+    try:
+        return parse(page["text"])
+    finally:
+        page["parse_ms"] = (time.process_time() - started) * 1000
+
+
+def note_skipped(pages: List[Dict[str, Any]], extra_ms: float = 0.0) -> float:
+    """Учитывает пропуск разбора/сверки; возвращает сэкономленное CPU-время (мс)."""
+    saved = sum(p.get("parse_ms") or 0.0 for p in pages) + extra_ms
+    _count(cpu_ms_saved=saved, skipped=1)
+    return saved
+
+
+def commit(pages: List[Dict[str, Any]]) -> None:
+    if not HTTP_CACHE_ENABLED or not pages:
+        return
+    put_http_cache([
+        {**p, "body": zlib.compress(p["text"].encode("utf-8"))}
+        for p in pages
+    ])
+
+
+def summary() -> str:
+    st = get_stats()
+    return (
+        f"запросов {st['requests']}, 304 {st['not_modified']}, тот же хэш {st['same_hash']}, "
+        f"скачано {st['bytes_downloaded'] / 1024:.0f} КБ, сэкономлено {st['bytes_saved'] / 1024:.0f} КБ "
+        f"и {st['cpu_ms_saved'] / 1000:.1f} с CPU, пропущено банков {st['skipped']}"
+    )
@@ -0,0 +1,115 @@
+# http_client.py
+"""
+Общий HTTP-клиент для парсеров без браузера.
+
+Один requests.Session на процесс: keep-alive и пул соединений к сайтам
+банков, повтор при 502/503/504. Плюс разбор карточек/категорий по тем же
+CSS-селекторам из таблицы banks, что использует Selenium-парсер (lxml).
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import html as lxml_html
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers.update({
+                    "User-Agent": USER_AGENT,
+                    "Accept-Language": "ru-RU,ru;q=0.9",
+                })
+                _session = s
+    return _session
+
+
+def fetch_html(url: str, timeout: float = 20) -> str:
+    resp = get_session().get(url, timeout=timeout)
+    resp.raise_for_status()
+    return resp.text
+
+
+def _text(el) -> str:
+    return " ".join(el.text_content().split()) if el is not None else ""
+
+
+def _first(el, selector: str):
+    if not selector:
+        return None
+    found = el.cssselect(selector)
+    return found[0] if found else None
+
+
+def parse_document(page_html: str, base_url: str):
+    doc = lxml_html.fromstring(page_html, base_url=base_url)
+    doc.make_links_absolute(base_url, resolve_base_href=True)
+    return doc
+
+
+def select_cards(doc, pcfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Карточки в том же виде, что extract_cards в update_nw: [{name, bonus, href}]."""
+    cards: List[Dict[str, Any]] = []
+    for card in doc.cssselect(pcfg["partners_list"]):
+        name_el = _first(card, pcfg["partner_name"])
+        bonus_el = _first(card, pcfg["partner_bonus"])
+        cards.append({
+            "name": _text(name_el) if name_el is not None else None,
+            "bonus": _text(bonus_el) if bonus_el is not None else None,
+            "href": card.get("href") or "",
+        })
+    return cards
+
+
+def select_categories(doc, cfg: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    [(название, url)] категорий из container/element. Ссылка берётся у самого
+    элемента, его ближайшего предка-<a> или вложенного <a>; категории без
+    ссылки (фильтры на JS) пропускаются.
+    """
+    containers = doc.cssselect(cfg["container_selector"])
+    if not containers:
+        return []
+    page_url = (doc.base_url or "").split("#")[0]
+    result: List[Tuple[str, str]] = []
+    seen = set()
+    for el in containers[0].cssselect(cfg["element_selector"]):
+        name = (el.text_content() or "").strip().split("\n")[0].strip()
+        if not name or name in ("Все", "Категории"):
+            continue
+        href = el.get("href")
+        if not href:
+            anchor = next((a for a in el.iterancestors("a") if a.get("href")), None)
+            if anchor is None:
+                anchor = _first(el, "a[href]")
+            href = anchor.get("href") if anchor is not None else None
+        # после make_links_absolute якорь «#…» превращается в «<страница>#…»
+        if not href or href.startswith("javascript:") or href.split("#")[0] == page_url or href in seen:
+            continue
+        seen.add(href)
+        result.append((name, href))
+    return result
+
+
+def has_more_button(doc, button_text: str) -> bool:
+    """На странице есть «Показать ещё» — значит, в HTML только первая порция списка."""
+    if not button_text:
+        return False
+    return any(button_text in _text(btn) for btn in doc.cssselect("button, a"))
@@ -0,0 +1,99 @@
+# llm_backends.py
+"""
+Откуда belkart.py берёт ответы LLM на промпты извлечения компании/бонуса.
+
+Бэкенд выбирается переменной BELKART_EXTRACTOR:
+    gigachat — GigaChat (по умолчанию); клиент создаётся при первом запросе,
+               импорт belkart/main не требует токена и сети;
+    replay   — локальный HTTP-сервер llm_replay.py, отдающий записанные ответы
+               (нагрузочные прогоны и бенчмарки на изолированной машине);
+    rules    — без LLM, только правила rules_extract.
+
+LLM_RECORD=<файл.jsonl> — дописывать каждую пару промпт/ответ GigaChat в файл,
+из которого потом читает llm_replay.py.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+EXTRACTORS = ("gigachat", "replay", "rules")
+DEFAULT_EXTRACTOR = "gigachat"
+
+LLM_REPLAY_URL = os.getenv("LLM_REPLAY_URL", "http://127.0.0.1:8089/chat")
+LLM_RECORD = os.getenv("LLM_RECORD", "")
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+
+class GigaChatBackend:
+    name = "gigachat"
+
+    def __init__(self) -> None:
+        self._client = None
+        self._lock = threading.Lock()
+        self._record_lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from dotenv import load_dotenv
+                    from gigachat import GigaChat
+
+                    load_dotenv()
+                    self._client = GigaChat(
+                        credentials=os.getenv("GIGACHAT_TOKEN"),
+                        scope="GIGACHAT_API_B2B",
+                        verify_ssl_certs=False,
+                        model="GigaChat-2-Max",
+                    )
+        return self._client
+
+    def chat(self, prompt: str) -> str:
+        resp = self._get_client().chat(prompt)
+        content = resp.choices[0].message.content
+        if LLM_RECORD:
+            with self._record_lock, open(LLM_RECORD, "a", encoding="utf-8") as f:
+                f.write(json.dumps(
+                    {"key": prompt_key(prompt), "prompt": prompt, "content": content},
+                    ensure_ascii=False,
+                ) + "\n")
+        return content
+
+
+class ReplayBackend:
+    name = "replay"
+
+    def __init__(self, url: str = LLM_REPLAY_URL) -> None:
+        self.url = url
+
+    def chat(self, prompt: str) -> str:
+        import http_client
+
+        resp = http_client.get_session().post(self.url, json={"prompt": prompt}, timeout=60)
+        resp.raise_for_status()
+        return resp.json()["content"]
+
+
+_backends: Dict[str, object] = {}
+_backends_lock = threading.Lock()
+
+
+def normalize_extractor(value: Optional[str]) -> str:
+    value = (value or "").strip().lower()
+    return value if value in EXTRACTORS else DEFAULT_EXTRACTOR
+
+
+def get_backend(name: Optional[str] = None):
+    """Бэкенд с методом chat(prompt) -> str; None для rules (LLM не вызывается)."""
+    name = normalize_extractor(name or os.getenv("BELKART_EXTRACTOR"))
+    if name == "rules":
+        return None
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = GigaChatBackend() if name == "gigachat" else ReplayBackend()
+        return _backends[name]
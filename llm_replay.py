@@ -0,0 +1,138 @@
+# llm_replay.py
+"""
+Локальная замена GigaChat для BELKART_EXTRACTOR=replay: HTTP-сервер,
+который отвечает на промпты записанными ответами (LLM_RECORD, см.
+llm_backends.py). Позволяет гонять весь конвейер Белкарта — загрузку,
+пачки промптов, кэш — без токена и внешней сети.
+
+    POST /chat   {"prompt": "..."} → {"content": "..."}
+    GET  /stats  счётчики попаданий/промахов
+
+Промпт, которого нет в записи: --miss 404 (клиент уйдёт в поштучный
+запрос и ничего не закэширует) или --miss rules — ответ собирается из
+rules_extract по текстам из промпта, в том же JSON-формате, что у GigaChat.
+
+Запуск:
+    python llm_replay.py [--records llm_records.jsonl] [--port 8089]
+                         [--latency-ms 0] [--miss 404|rules]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from llm_backends import prompt_key
+
+_BATCH_ITEM = re.compile(r'^(\d+)\. """(.*?)"""$', re.M)
+_SINGLE_TEXT = re.compile(r'"""(.*?)"""', re.S)
+
+
+def load_records(path: str) -> Dict[str, str]:
+    records: Dict[str, str] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    records[rec["key"]] = rec["content"]
+    except FileNotFoundError:
+        print(f"⚠️ Нет файла записей {path} — все промпты будут промахами")
+    return records
+
+
+def rules_answer(prompt: str) -> Optional[str]:
+    """Ответ в формате промптов belkart.py, посчитанный правилами."""
+    from belkart import rules_extract
+
+    batch = _BATCH_ITEM.findall(prompt)
+    if batch:
+        out = []
+        for idx, text in batch:
+            got = rules_extract(text)
+            out.append({"id": int(idx), "company": got["company"], "bonus": got["bonus"]})
+        return json.dumps(out, ensure_ascii=False)
+    single = _SINGLE_TEXT.search(prompt)
+    if single:
+        got = rules_extract(single.group(1))
+        return json.dumps({"company": got["company"], "bonus": got["bonus"]}, ensure_ascii=False)
+    return None
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, records: Dict[str, str], latency_ms: int, miss: str):
+        super().__init__(addr, ReplayHandler)
+        self.records = records
+        self.latency_ms = latency_ms
+        self.miss = miss
+        self.stats = {"hits": 0, "misses": 0, "rules": 0}
+        self.stats_lock = threading.Lock()
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    def _send(self, code: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.stats_lock:
+                self._send(200, dict(self.server.stats))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/chat":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        prompt = json.loads(self.rfile.read(length) or b"{}").get("prompt", "")
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+
+        content = self.server.records.get(prompt_key(prompt))
+        kind = "hits"
+        if content is None and self.server.miss == "rules":
+            content, kind = rules_answer(prompt), "rules"
+        if content is None:
+            kind = "misses"
+        with self.server.stats_lock:
+            self.server.stats[kind] += 1
+
+        if content is None:
+            self._send(404, {"error": "prompt not recorded"})
+        else:
+            self._send(200, {"content": content})
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--records", default="llm_records.jsonl")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=int, default=0, help="искусственная задержка ответа")
+    ap.add_argument("--miss", choices=("404", "rules"), default="404")
+    args = ap.parse_args()
+
+    records = load_records(args.records)
+    server = ReplayServer((args.host, args.port), records, args.latency_ms, args.miss)
+    print(f"🎞 LLM replay на http://{args.host}:{args.port}/chat — записей: {len(records)}, промах: {args.miss}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
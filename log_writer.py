@@ -0,0 +1,170 @@
+# log_writer.py
+"""
+Фоновая запись журнала действий пользователей (log) и tg_users.
+
+Хендлеры бота только кладут запись в ограниченную очередь в памяти;
+отдельный поток пишет накопленное одной транзакцией — раз в
+LOG_FLUSH_MS миллисекунд или как только набралось LOG_BATCH_SIZE записей.
+Если очередь переполнена, запись отбрасывается и учитывается в счётчике
+dropped_full (клик пользователя важнее строки в журнале).
+Остаток очереди дописывается при остановке процесса: при обычном выходе
+(atexit) и по SIGTERM (рестарт/деплой на Render) — обработчик ставит
+main.py через stop().
+"""
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import back_db
+
+LOG_FLUSH_MS = int(os.getenv("LOG_FLUSH_MS", "500"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# ("log", (user_id, entered_at, action)) | ("user", (chat_id,))
+Record = Tuple[str, Tuple[Any, ...]]
+
+
+class LogWriter:
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE,
+                 flush_ms: int = LOG_FLUSH_MS,
+                 batch_size: int = LOG_BATCH_SIZE) -> None:
+        self._q: "queue.Queue[Record]" = queue.Queue(maxsize)
+        self._flush_s = flush_ms / 1000.0
+        self._batch_size = batch_size
+        self._stop = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"written": 0, "batches": 0, "dropped_full": 0, "dropped_error": 0}
+
+    # ---------- API ----------
+    def put(self, kind: str, row: Tuple[Any, ...]) -> None:
+        self._ensure_started()
+        try:
+            self._q.put_nowait((kind, row))
+        except queue.Full:
+            self._count("dropped_full", 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            res = dict(self._stats)
+        res["queued"] = self._q.qsize()
+        return res
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает поток и дописывает всё, что осталось в очереди (повторный вызов — no-op)."""
+        with self._start_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._stop.set()
+        try:
+            # будит поток, если он ждёт добора пачки: пачка пишется сразу
+            self._q.put_nowait(("stop", ()))
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        batch = self._drain(self._q.qsize())
+        if batch:
+            self._flush(batch)
+        s = self.stats()
+        if s["dropped_full"] or s["dropped_error"]:
+            print(f"⚠️ LogWriter: потеряно записей — очередь полна: {s['dropped_full']}, "
+                  f"ошибка записи: {s['dropped_error']}")
+
+    # ---------- internals ----------
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _count(self, key: str, n: int) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _drain(self, limit: int) -> List[Record]:
+        batch: List[Record] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._q.get(timeout=self._flush_s)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self._flush_s
+            while len(batch) < self._batch_size and not self._stop.is_set():
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+                if batch[-1][0] == "stop":
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[Record]) -> None:
+        logs = [row for kind, row in batch if kind == "log"]
+        users = [row for kind, row in batch if kind == "user"]
+        try:
+            with back_db._write() as conn:
+                if logs:
+                    conn.executemany(
+                        "INSERT INTO log (user_id, entered_at, action) VALUES (?, ?, ?);", logs
+                    )
+                if users:
+                    conn.executemany("INSERT OR IGNORE INTO tg_users(chat_id) VALUES (?);", users)
+        except Exception as e:
+            print(f"❌ LogWriter: не удалось записать {len(batch)} записей: {e}")
+            self._count("dropped_error", len(batch))
+            return
+        self._count("written", len(batch))
+        self._count("batches", 1)
+
+
+_writer = LogWriter()
+atexit.register(_writer.stop)
+
+
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ---------- то же API, что и в back_db, но без ожидания диска ----------
+def remember_user(chat_id: int) -> None:
+    _writer.put("user", (chat_id,))
+
+
+def log_user_start(user_id: int) -> None:
+    _writer.put("log", (user_id, _now(), None))
+
+
+def log_user_action(user_id: int, action: str) -> None:
+    _writer.put("log", (user_id, _now(), action))
+
+
+def get_stats() -> Dict[str, int]:
+    return _writer.stats()
+
+
+def stop() -> None:
+    """Дописать очередь и остановить поток — для обработчика SIGTERM."""
+    _writer.stop()
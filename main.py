@@ -1,6 +1,8 @@
 # main.py
 import os
 import re
+import signal
+import sys
 from dotenv import load_dotenv
 import time
 import threading
@@ -17,7 +19,7 @@ from update_nw import fetch_categories_for_bank
 import back_db
 import telebot
 from telebot import types
-from back_db import DB_PATH
+from back_db import DB_PATH, SEARCH_LIMIT
 from сaсtus import fetch_cactus_partners
 from belkart import fetch_promotions
 from back_db import (
@@ -28,20 +30,23 @@ from back_db import (
     search_partners,
     get_bank_name,  
     backup_database,   
-    remember_user, 
     get_all_chat_ids, 
     get_today_partner_changes,
-    ensure_tg_users_table,
     fetch_partners_scrape_config,
     fetch_categories_scrape_config,
     get_categories,
     get_banks_name,
     debug_show_akv,
-    log_user_start,
-    log_user_action,
+    init_db,
+    get_scrape_metrics_history,
 )
 
-from update_nw import update_all_banks_categories
+from update_nw import update_all_banks_categories, failed_scrape_tasks, bank_slot, resume_unfinished_run
+from scheduler import DIGEST_HOUR, Scheduler
+from driver_pool import DRIVERS
+from log_writer import remember_user, log_user_start, log_user_action, get_stats as get_log_writer_stats
+import log_writer
+import http_cache
 
 # ---------- Load .env ----------
 load_dotenv()
@@ -398,7 +403,8 @@ def parse_banks_command(message):
         bot.send_message(message.chat.id, f"🔹 Парсим банк {bank['name']} ({bank['id']})")
 
         if bank['name'] == "cactus":
-            bank['func'](bank_id=bank['id'])
+            with bank_slot(bank['id']):
+                bank['func'](bank_id=bank['id'])
         else:
             print("НЕ УДАЛОСЬ")
 
@@ -430,7 +436,27 @@ def check_db_command(message):
             response += "\n"
         
         response += f"\n📋 Таблица status_log: {'✅ есть' if has_status_log else '❌ отсутствует'}\n"
-        
+
+        ds = DRIVERS.get_stats()
+        response += (
+            f"🧭 Браузеры: запусков {ds['launches']}, переиспользований {ds['reuses']}, "
+            f"пересозданий {ds['recycles']}, неживых {ds['unhealthy']}\n"
+        )
+        lw = get_log_writer_stats()
+        response += (
+            f"\n📝 Журнал действий: записано {lw['written']} ({lw['batches']} пачек), "
+            f"в очереди {lw['queued']}, потеряно {lw['dropped_full'] + lw['dropped_error']}\n"
+        )
+        response += f"🗄 HTTP-кэш (последний прогон): {http_cache.summary()}\n"
+
+        response += f"\n🗓 Расписание (одновременно до {SCHEDULER.max_concurrent}):\n"
+        for e in SCHEDULER.plan():
+            state = "⏳ идёт" if e["running"] else e.get("next_run_at") or "—"
+            response += (
+                f"• bank {e['bank_id']}: {state}, каждые {e.get('interval_hours') or 0:.0f} ч, "
+                f"частота изменений {e.get('change_rate') or 0:.2f}\n"
+            )
+
         # Проверяем, есть ли данные со статусами
         if 'status' in [col[1] for col in partners_cols]:
             cur.execute("SELECT COUNT(*) FROM partners WHERE status IS NOT NULL AND status != ''")
@@ -541,7 +567,7 @@ def perform_search(message):
         bot.send_message(message.chat.id, "❌ Пустой запрос.")
         return
 
-    results = search_partners(query)
+    results = search_partners(query, limit=SEARCH_LIMIT)
 
     if not results:
         bot.send_message(
@@ -558,6 +584,8 @@ def perform_search(message):
         grouped[bank][category].append((name, bonus, unit, link))
 
     lines = [f"🔎 Найдено: *{len(results)}*"]
+    if len(results) >= SEARCH_LIMIT:
+        lines.append(f"_Показаны первые {SEARCH_LIMIT} — уточните запрос_")
 
     for bank, cats in grouped.items():
         lines.append(f"\n🏦 *{escape_md(bank)}*")
@@ -576,7 +604,7 @@ def perform_search(message):
         disable_web_page_preview=True
     )
 
-# ---------- Nightly Scheduler (01:00) ----------
+# ---------- Nightly Backup (01:00) ----------
 def _seconds_until_next_1am(now: dt.datetime | None = None) -> int:
     now = now or dt.datetime.now()
     target_date = now.date()
@@ -586,32 +614,52 @@ def _seconds_until_next_1am(now: dt.datetime | None = None) -> int:
     return max(1, int((target_dt - now).total_seconds()))
 
 
-def nightly_scrape_loop():
+def nightly_backup_loop():
+    # парсинг банков — в scheduler.py, здесь остаётся только ночной бэкап
     while True:
         wait_s = _seconds_until_next_1am()
         time.sleep(wait_s)
         try:
-            print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] ▶️ Nightly categories update")
+            print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] ▶️ Nightly backup")
             _send_db_backup(1784338004)
-            update_all_banks_categories()
-            print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] ✅ Nightly update done")
-
-            print(dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Nightly cactus update")
-            fetch_cactus_partners(bank_id=13, progress=None, banks_done=0, banks_total=1)
-            print(dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Nightly update done")
         except Exception as e:
-            print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] ❌ Nightly update error: {e}")
+            print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] ❌ Nightly backup error: {e}")
 
 # секрет можно переопределить через переменную окружения UPDATE_SECRET
 UPDATE_SECRET = os.getenv("UPDATE_SECRET", "qwerty11")
 _update_lock = threading.Lock()
 _update_running = False
 
-def _run_manual_update_with_progress(chat_id: int):
+# адаптивное расписание парсинга по банкам; во время ручного /update не запускает новые банки
+SCHEDULER = Scheduler(busy=lambda: _update_running)
+
+def _format_run_report(run: dict) -> str:
+    text = (
+        f"Прогон #{run['id']}: готово {run['tasks_done']}/{run['tasks_total']} банков, "
+        f"с ошибкой {run['tasks_failed']}."
+    )
+    failed = failed_scrape_tasks(run["id"])
+    if failed:
+        names = {bank_id: name for bank_id, name, _ in get_banks()}
+        lines = []
+        for t in failed[:20]:
+            where = names.get(t["bank_id"], f"bank {t['bank_id']}")
+            if t["category_name"]:
+                where += f" / {t['category_name']}"
+            lines.append(f"• {where}: {(t['error'] or '')[:120]}")
+        text += "\n\n❌ Ошибки:\n" + "\n".join(lines)
+        text += "\n\nПовторить только их: /update <secret> failed"
+    return text
+
+
+def _run_manual_update_with_progress(chat_id: int, failed_only: bool = False):
     global _update_running
     try:
         # 1) Отправляем стартовое сообщение
-        msg = bot.send_message(chat_id, "🔄 Запускаю ручное обновление…")
+        msg = bot.send_message(
+            chat_id,
+            "🔄 Повторяю упавшие задачи…" if failed_only else "🔄 Запускаю ручное обновление…",
+        )
 
         # 2) Локальная функция для обновления прогресса
         def tg_progress(done: int, total: int, note: str):
@@ -636,26 +684,21 @@ def _run_manual_update_with_progress(chat_id: int):
                 # редактирование может падать при частых апдейтах — игнорируем
                 pass
 
-        # 3) Запуск обновления с прогрессом
+        # 3) Запуск обновления с прогрессом (Кактус — один из банков прогона);
+        # незавершённый прошлый прогон продолжается с места остановки
         tg_progress(0, 1, "Подготовка…")
-        update_all_banks_categories(progress=tg_progress)
-
-        # 3.1) Кактус отдельно
-        tg_progress(0, 1, "Обновление Кактуса (МТБанк)...")
-        try:
-            fetch_cactus_partners(
-                bank_id=13,
-                progress=tg_progress,
-                banks_done=0,
-                banks_total=1,
+        run = update_all_banks_categories(progress=tg_progress, failed_only=failed_only)
+        if run is None:
+            tg_progress(1, 1, "Нечего обновлять")
+            bot.send_message(
+                chat_id,
+                "ℹ️ В последнем прогоне нет упавших задач." if failed_only else "ℹ️ Банки не найдены.",
             )
-            tg_progress(1, 1, "Кактус обновлён")
-        except Exception as e:
-            tg_progress(1, 1, f"Ошибка Кактуса: {e}")
+            return
 
         # 4) Финальный штрих
         tg_progress(1, 1, "Готово ✅")
-        bot.send_message(chat_id, "✅ Ручное обновление завершено.")
+        bot.send_message(chat_id, "✅ Ручное обновление завершено.\n" + _format_run_report(run))
     except Exception as e:
         bot.send_message(chat_id, f"❌ Ошибка при ручном обновлении: {e}")
     finally:
@@ -665,13 +708,34 @@ def _run_manual_update_with_progress(chat_id: int):
         except RuntimeError:
             pass
 
+def resume_manual_update():
+    """
+    Ручной /update, оборванный рестартом, продолжается при старте с
+    незавершённых задач (прогоны планировщика продолжает сам SCHEDULER).
+    """
+    global _update_running
+    if not _update_lock.acquire(blocking=False):
+        return
+    _update_running = True
+    try:
+        run = resume_unfinished_run("manual")
+        if run:
+            print("✅ Прерванное ручное обновление завершено. " + _format_run_report(run))
+    except Exception as e:
+        print(f"❌ Ошибка при продолжении ручного обновления: {e}")
+    finally:
+        _update_running = False
+        _update_lock.release()
+
+
 @bot.message_handler(commands=['update'])
 def update_command(message):
     global _update_running
-    parts = message.text.strip().split(maxsplit=1)
-    if len(parts) < 2 or parts[1].strip() != UPDATE_SECRET:
-        bot.send_message(message.chat.id, "⛔️ Неверный секрет. Формат: /update <secret>")
+    parts = message.text.strip().split()
+    if len(parts) < 2 or parts[1] != UPDATE_SECRET:
+        bot.send_message(message.chat.id, "⛔️ Неверный секрет. Формат: /update <secret> [failed]")
         return
+    failed_only = len(parts) > 2 and parts[2].lower() == "failed"
 
     if _update_running:
         bot.send_message(message.chat.id, "⏳ Обновление уже выполняется. Ждите завершения.")
@@ -684,11 +748,94 @@ def update_command(message):
     _update_running = True
     threading.Thread(
         target=_run_manual_update_with_progress,
-        args=(message.chat.id,),
+        args=(message.chat.id, failed_only),
         daemon=True
     ).start()
 
 
+#------------- Метрики парсинга --------------
+
+def _trend(latest: float, previous: list, unit: str = "") -> str:
+    """Значение последнего прогона и отклонение от среднего по предыдущим."""
+    value = f"{latest:g}{unit}"
+    if not previous:
+        return value
+    avg = sum(previous) / len(previous)
+    if not avg:
+        return f"{value} (было 0)"
+    return f"{value} ({(latest - avg) * 100 / avg:+.0f}%)"
+
+
+def _format_scrape_stats(history: list[dict]) -> list[str]:
+    """Блок текста на банк: последний прогон против среднего по предыдущим."""
+    by_bank = defaultdict(lambda: {"total": [], "categories": defaultdict(list)})
+    for row in history:
+        bank = by_bank[(row["bank_id"], row["bank_name"])]
+        if row["category_name"]:
+            bank["categories"][row["category_name"]].append(row)
+        else:
+            bank["total"].append(row)
+
+    blocks = []
+    for (bank_id, bank_name), bank in sorted(by_bank.items()):
+        if not bank["total"]:
+            continue
+        last, prev = bank["total"][0], bank["total"][1:]
+        lines = [
+            f"🏦 {bank_name} — {last['started_at']}",
+            f"  ⏱ {_trend(round(last['duration_s'], 1), [round(r['duration_s'], 1) for r in prev], ' с')}"
+            f" | карточек {_trend(last['cards'], [r['cards'] for r in prev])}"
+            f" | сохранено {last['saved']}"
+            f" | запросов {_trend(last['round_trips'], [r['round_trips'] for r in prev])}",
+        ]
+        phases = sorted(last["phases"].items(), key=lambda kv: -kv[1])[:4]
+        if phases:
+            lines.append("  фазы: " + ", ".join(f"{name} {sec:.1f} с" for name, sec in phases))
+
+        # категории, пройденные в последнем прогоне банка
+        current = [
+            rows for rows in bank["categories"].values()
+            if rows[0]["started_at"] >= last["started_at"]
+        ]
+        for rows in current:
+            if rows[0]["cards"] == 0 and any(r["cards"] for r in rows[1:]):
+                was = max(r["cards"] for r in rows[1:])
+                lines.append(f"  ⚠️ {rows[0]['category_name']}: 0 карточек (раньше до {was})")
+        slowest = sorted(current, key=lambda rows: -rows[0]["duration_s"])[:3]
+        if len(current) > 1:
+            lines.append("  медленнее всего: " + ", ".join(
+                f"{rows[0]['category_name']} {rows[0]['duration_s']:.1f} с" for rows in slowest
+            ))
+        blocks.append("\n".join(lines))
+    return blocks
+
+
+@bot.message_handler(commands=['scrape_stats'])
+def scrape_stats_command(message):
+    """
+    Время, карточки и запросы к браузеру по банкам за последние прогоны.
+    Формат: /scrape_stats <secret> (секрет тот же, что и UPDATE_SECRET).
+    """
+    parts = message.text.strip().split()
+    if len(parts) < 2 or parts[1] != UPDATE_SECRET:
+        bot.send_message(message.chat.id, "⛔️ Неверный секрет. Формат: /scrape_stats <secret>")
+        return
+
+    blocks = _format_scrape_stats(get_scrape_metrics_history())
+    if not blocks:
+        bot.send_message(message.chat.id, "ℹ️ Метрик парсинга пока нет — они пишутся с ближайшего прогона.")
+        return
+
+    buf = "📈 Парсинг: последний прогон (отклонение от среднего за предыдущие)"
+    for block in blocks:
+        if len(buf) + len(block) + 2 > 4000:
+            bot.send_message(message.chat.id, buf)
+            buf = block
+        else:
+            buf = f"{buf}\n\n{block}"
+    bot.send_message(message.chat.id, buf)
+
+
 #------------- Скачивание БД --------------
 
 # --- Secure DB download (/db, /dump, /downloaddb) ---
@@ -864,9 +1011,9 @@ def db_digest_command(message):
 def _seconds_until_next_7am(now: dt.datetime | None = None) -> int:
     now = now or dt.datetime.now()
     target_date = now.date()
-    if now.hour >= 7:
+    if now.hour >= DIGEST_HOUR:
         target_date = target_date + dt.timedelta(days=1)
-    target_dt = dt.datetime.combine(target_date, dt.time(7, 0, 0))
+    target_dt = dt.datetime.combine(target_date, dt.time(DIGEST_HOUR, 0, 0))
     return max(1, int((target_dt - now).total_seconds()))
 
 def send_markdown_long(chat_id: int, text: str, chunk_size: int = 3500):
@@ -927,7 +1074,6 @@ def send_markdown_long(chat_id: int, text: str, chunk_size: int = 3500):
 def morning_digest_loop():
     # from db_sql import get_today_partner_changes  # если в отдельном модуле
     from back_db import get_today_partner_changes
-    ensure_tg_users_table()  # на всякий случай
 
     while True:
         wait_s = _seconds_until_next_7am()
@@ -1291,6 +1437,13 @@ def run_flask():
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
 
 
+def _on_sigterm(signum, frame):
+    # по умолчанию SIGTERM завершает процесс без atexit — очередь журнала пропала бы
+    print("🛑 SIGTERM: дописываем журнал и выходим")
+    log_writer.stop()
+    sys.exit(0)
+
+
 def run_bot():
     #bot.polling(none_stop=True)
     while True:
@@ -1302,12 +1455,18 @@ def run_bot():
 
 
 if __name__ == "__main__":
+    # миграции схемы — один раз до запуска потоков; на неизвестной версии БД падаем
+    init_db()
+    signal.signal(signal.SIGTERM, _on_sigterm)
     # Flask
     threading.Thread(target=run_flask, daemon=True).start()
     # KeepAlive
     threading.Thread(target=start_keep_alive, daemon=True).start()
-    # Nightly scraper
-    threading.Thread(target=nightly_scrape_loop, daemon=True).start()
+    # прерванный рестартом /update; планировщик своё продолжит сам
+    threading.Thread(target=resume_manual_update, daemon=True).start()
+    # Scrape scheduler + nightly backup
+    threading.Thread(target=SCHEDULER.run_forever, daemon=True).start()
+    threading.Thread(target=nightly_backup_loop, daemon=True).start()
     # Morning scraper
     threading.Thread(target=morning_digest_loop, daemon=True).start()
     # Bot
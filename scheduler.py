@@ -0,0 +1,248 @@
+# scheduler.py
+"""
+Планировщик парсинга по банкам вместо одного ночного прогона в 01:00.
+
+У каждого банка своя оценка частоты изменений change_rate — доля
+прогонов, после которых у банка появились новые партнёры или сменился
+бонус. Стартовое значение берётся из истории partners (доля дней с
+изменениями за SCHEDULE_WINDOW_DAYS), дальше — скользящее среднее по
+итогам прогонов. Интервал до следующего запуска:
+
+    24 ч * TARGET_RATE / change_rate, в пределах [24 ч, SCHEDULE_MAX_HOURS]
+
+— «живые» банки парсятся каждую ночь, стабильные — раз в несколько дней.
+
+Чаще раза в сутки нельзя: утренний дайджест (DIGEST_HOUR) берёт изменения
+из partners_current по статусам за сегодня, и второй прогон до дайджеста
+превращает new в live, new_delete в delete, а прогон после дайджеста
+завтрашний дайджест уже не увидит. Поэтому банки запускаются только в
+ночном окне [SCHEDULE_NIGHT_HOUR, SCHEDULE_LAST_START_HOUR) — по
+умолчанию 01:00–06:00, с запасом до дайджеста в DIGEST_HOUR — и не
+больше одного раза за окно; то, что не успело стартовать (бюджет,
+прерванный прогон, повтор после сбоя), ждёт следующей ночи.
+
+Состояние хранится в scrape_schedule: после рестарта расписание
+продолжается, а банк, прогон которого оборвался, запускается сразу.
+Одновременно идёт не больше SCHEDULE_MAX_CONCURRENT банков (по умолчанию
+pick_scrape_workers() — по свободной памяти под Chrome).
+"""
+import datetime as dt
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from back_db import (
+    count_partner_changes,
+    get_all_bank_ids,
+    get_bank_change_days,
+    get_scrape_schedule,
+    save_scrape_schedule,
+)
+from driver_pool import DRIVERS
+from update_nw import bank_in_flight, pick_scrape_workers, run_scrape
+import http_cache
+
+SCHEDULE_MAX_HOURS = float(os.getenv("SCHEDULE_MAX_HOURS", "168"))
+SCHEDULE_WINDOW_DAYS = int(os.getenv("SCHEDULE_WINDOW_DAYS", "28"))
+SCHEDULE_NIGHT_HOUR = int(os.getenv("SCHEDULE_NIGHT_HOUR", "1"))
+SCHEDULE_LAST_START_HOUR = int(os.getenv("SCHEDULE_LAST_START_HOUR", "6"))
+# утренний дайджест (main.morning_digest_loop)
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "7"))
+# при какой ожидаемой вероятности изменений банк пора парсить
+TARGET_RATE = 0.5
+# вес последнего прогона в change_rate
+RATE_ALPHA = 0.3
+TICK_SECONDS = 60
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _ts(value: dt.datetime) -> str:
+    return value.strftime(TS_FORMAT)
+
+
+def interval_hours(change_rate: float) -> float:
+    if change_rate <= 0:
+        return SCHEDULE_MAX_HOURS
+    return max(24.0, min(SCHEDULE_MAX_HOURS, 24 * TARGET_RATE / change_rate))
+
+
+def night_slot_after(now: dt.datetime) -> dt.datetime:
+    slot = dt.datetime.combine(now.date(), dt.time(SCHEDULE_NIGHT_HOUR, 0, 0))
+    return slot if slot > now else slot + dt.timedelta(days=1)
+
+
+def in_night_window(now: dt.datetime) -> bool:
+    """Можно ли сейчас запускать банки: прогон должен закончиться до дайджеста."""
+    return SCHEDULE_NIGHT_HOUR <= now.hour < SCHEDULE_LAST_START_HOUR
+
+
+def next_run_after(started: dt.datetime, hours: float, now: dt.datetime) -> dt.datetime:
+    """
+    Ночной слот через round(hours / 24) суток (не меньше одних) после
+    прогона — следующий запуск не раньше следующего окна.
+    """
+    days = max(1, round(hours / 24))
+    nxt = dt.datetime.combine(started.date() + dt.timedelta(days=days), dt.time(SCHEDULE_NIGHT_HOUR, 0, 0))
+    return max(nxt, night_slot_after(now))
+
+
+class Scheduler:
+    """
+    run_forever() — раз в TICK_SECONDS запускает банки, у которых подошло
+    время, в пределах бюджета max_concurrent. busy() → True (например,
+    идёт ручной /update) — новые банки не запускаются.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        busy: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        env = os.getenv("SCHEDULE_MAX_CONCURRENT")
+        self.max_concurrent = max(1, max_concurrent or (int(env) if env else pick_scrape_workers()))
+        self.busy = busy
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._running: Set[int] = set()
+        self._lock = threading.Lock()
+
+    # ---------- СОСТОЯНИЕ ----------
+    def load(self) -> None:
+        """Читает scrape_schedule и заводит записи для новых банков."""
+        now = dt.datetime.now()
+        stored = get_scrape_schedule()
+        bank_ids = get_all_bank_ids()
+        missing = [b for b in bank_ids if b not in stored]
+        change_days = get_bank_change_days(SCHEDULE_WINDOW_DAYS) if missing else {}
+
+        with self._lock:
+            for bank_id in bank_ids:
+                if bank_id in self._entries:
+                    continue
+                entry = stored.get(bank_id)
+                if entry is None:
+                    days = change_days.get(bank_id)
+                    rate = days / SCHEDULE_WINDOW_DAYS if days is not None else TARGET_RATE
+                    entry = {
+                        "bank_id": bank_id,
+                        "change_rate": rate,
+                        "interval_hours": interval_hours(rate),
+                        "next_run_at": _ts(night_slot_after(now)),
+                        "runs": 0,
+                    }
+                    save_scrape_schedule(entry)
+                elif entry.get("last_status") == "running":
+                    # прогон оборвался вместе с процессом — повторяем сразу
+                    print(f"[bank {bank_id}] ↩️ Планировщик: прерванный прогон, запускаем снова")
+                    entry["next_run_at"] = _ts(now)
+                    save_scrape_schedule(entry)
+                self._entries[bank_id] = entry
+
+    def plan(self) -> List[Dict[str, Any]]:
+        """Записи расписания по времени следующего запуска."""
+        with self._lock:
+            entries = [dict(e, running=e["bank_id"] in self._running) for e in self._entries.values()]
+        return sorted(entries, key=lambda e: e.get("next_run_at") or "")
+
+    # ---------- ЗАПУСК ----------
+    def due(self, now: Optional[dt.datetime] = None) -> List[int]:
+        now = now or dt.datetime.now()
+        if not in_night_window(now):
+            return []
+        now_s = _ts(now)
+        with self._lock:
+            ready = [
+                e for bank_id, e in self._entries.items()
+                if bank_id not in self._running and (e.get("next_run_at") or "") <= now_s
+            ]
+        # банк парсит ручной /update — дождёмся следующего тика
+        ready = [e for e in ready if not bank_in_flight(e["bank_id"])]
+        return [e["bank_id"] for e in sorted(ready, key=lambda e: e.get("next_run_at") or "")]
+
+    def tick(self, executor: ThreadPoolExecutor) -> List[int]:
+        """Запускает подошедшие банки в пределах свободных слотов; возвращает запущенные."""
+        if self.busy and self.busy():
+            return []
+        self.load()
+        with self._lock:
+            free = self.max_concurrent - len(self._running)
+            idle = not self._running
+        started = self.due()[:max(0, free)]
+        if started and idle:
+            http_cache.reset_stats()
+        with self._lock:
+            self._running.update(started)
+        for bank_id in started:
+            executor.submit(self._run_bank, bank_id)
+        return started
+
+    def _run_bank(self, bank_id: int) -> None:
+        with self._lock:
+            entry = self._entries[bank_id]
+        started = dt.datetime.now()
+        previous = entry.get("last_status")
+        entry.update(last_started_at=_ts(started), last_status="running")
+        save_scrape_schedule(entry)
+        print(f"[{_ts(started)}] ▶️ Планировщик: банк {bank_id}")
+
+        status = "ok"
+        try:
+            # свой вид прогона на банк: оборванный прогон продолжится с незавершённых категорий
+            run = run_scrape([bank_id], kind=f"schedule:{bank_id}", cleanup=False)
+            if run and run["tasks_failed"]:
+                status = "error"
+        except Exception as e:
+            status = "error"
+            print(f"[bank {bank_id}] ❌ Ошибка банка в планировщике: {e}")
+
+        try:
+            finished = dt.datetime.now()
+            changes = count_partner_changes(bank_id, _ts(started))
+            rate = entry.get("change_rate")
+            rate = TARGET_RATE if rate is None else rate
+            if status == "ok":
+                rate = (1 - RATE_ALPHA) * rate + RATE_ALPHA * (1.0 if changes else 0.0)
+                hours = interval_hours(rate)
+                next_run = next_run_after(started, hours, finished)
+            else:
+                # сбой — пробуем следующей ночью; второй подряд — уже по обычному интервалу
+                hours = interval_hours(rate)
+                if previous != "error":
+                    hours = 24.0
+                next_run = next_run_after(started, hours, finished)
+            entry.update(
+                change_rate=round(rate, 4),
+                interval_hours=round(hours, 2),
+                next_run_at=_ts(next_run),
+                last_finished_at=_ts(finished),
+                last_status=status,
+                last_changes=changes,
+                runs=(entry.get("runs") or 0) + 1,
+            )
+            save_scrape_schedule(entry)
+            print(
+                f"[bank {bank_id}] ⏱ Планировщик: {status}, изменений {changes}, "
+                f"частота {rate:.2f}, следующий запуск {entry['next_run_at']} (через {hours:.0f} ч)"
+            )
+        finally:
+            with self._lock:
+                self._running.discard(bank_id)
+                idle = not self._running
+            if idle:
+                # до следующего запуска браузеры не нужны
+                DRIVERS.close_idle()
+                print("🧭 Драйверы:", DRIVERS.get_stats())
+                print(f"🗄 HTTP-кэш: {http_cache.summary()}")
+
+    def run_forever(self) -> None:
+        self.load()
+        print(f"🗓 Планировщик: банков {len(self._entries)}, одновременно до {self.max_concurrent}")
+        with ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="sched") as ex:
+            while True:
+                try:
+                    self.tick(ex)
+                except Exception as e:
+                    print(f"[{_ts(dt.datetime.now())}] ❌ Ошибка планировщика: {e}")
+                time.sleep(TICK_SECONDS)
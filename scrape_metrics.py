@@ -0,0 +1,186 @@
+# scrape_metrics.py
+"""
+Метрики парсинга по банкам и категориям: время по фазам (загрузка
+страницы, cookie, клик по категории, «Показать ещё», извлечение карточек,
+сохранение в БД), число карточек и сохранённых партнёров, запросы к
+chromedriver. Пишутся в scrape_metrics одной транзакцией на банк.
+
+    with scrape_metrics.bank(bank_id, run_id):     # run_scrape в update_nw
+        scrape_metrics.track_driver(driver)         # считать запросы к браузеру
+        with scrape_metrics.phase("page_load"):
+            driver.get(url)
+        scrape_metrics.begin_category(name)         # закрывает предыдущую
+        scrape_metrics.add(cards=len(cards))
+        scrape_metrics.end_category()
+
+Контекст — поток: вне bank() все вызовы ничего не делают. Парсер, который
+обходит категории в своих потоках (Кактус), передаёт туда запись банка
+через use(current_bank()).
+"""
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from back_db import save_scrape_metrics
+
+_local = threading.local()
+
+
+class _Record:
+    """Замер банка или категории."""
+
+    def __init__(self, bank_id: int, category_name: str, run_id: Optional[int], lock: threading.Lock) -> None:
+        self.bank_id = bank_id
+        self.category_name = category_name
+        self.run_id = run_id
+        self.lock = lock
+        self.started_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.t0 = time.perf_counter()
+        self.duration_s = 0.0
+        self.phases: Dict[str, float] = {}
+        self.cards = 0
+        self.saved = 0
+        self.round_trips = 0
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add(self, cards: int = 0, saved: int = 0, round_trips: int = 0) -> None:
+        with self.lock:
+            self.cards += cards
+            self.saved += saved
+            self.round_trips += round_trips
+
+    def close(self) -> None:
+        self.duration_s = time.perf_counter() - self.t0
+
+    def row(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "bank_id": self.bank_id,
+            "category_name": self.category_name,
+            "started_at": self.started_at,
+            "duration_s": round(self.duration_s, 3),
+            "cards": self.cards,
+            "saved": self.saved,
+            "round_trips": self.round_trips,
+            "phases": {k: round(v, 3) for k, v in self.phases.items()},
+        }
+
+
+class BankMetrics(_Record):
+    """Итог по банку + уже закрытые категории (в любых потоках)."""
+
+    def __init__(self, bank_id: int, run_id: Optional[int]) -> None:
+        super().__init__(bank_id, "", run_id, threading.Lock())
+        self.categories: List[Dict[str, Any]] = []
+
+    def merge(self, category: _Record) -> None:
+        row = category.row()
+        with self.lock:
+            self.categories.append(row)
+            for name, seconds in category.phases.items():
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.cards += category.cards
+            self.saved += category.saved
+            self.round_trips += category.round_trips
+
+
+def current_bank() -> Optional[BankMetrics]:
+    return getattr(_local, "bank", None)
+
+
+def _target() -> Optional[_Record]:
+    return getattr(_local, "category", None) or current_bank()
+
+
+@contextmanager
+def bank(bank_id: int, run_id: Optional[int] = None) -> Iterator[BankMetrics]:
+    rec = BankMetrics(bank_id, run_id)
+    with use(rec):
+        try:
+            yield rec
+        finally:
+            end_category()
+            rec.close()
+            try:
+                save_scrape_metrics(rec.categories + [rec.row()])
+            except Exception as e:
+                print(f"[bank {bank_id}] ⚠️ Не удалось сохранить метрики: {e}")
+
+
+@contextmanager
+def use(rec: Optional[BankMetrics]) -> Iterator[None]:
+    """Делает rec текущим банком потока (для рабочих потоков парсера)."""
+    prev_bank, prev_category = current_bank(), getattr(_local, "category", None)
+    _local.bank, _local.category = rec, None
+    try:
+        yield
+    finally:
+        end_category()
+        _local.bank, _local.category = prev_bank, prev_category
+
+
+def begin_category(category_name: str) -> None:
+    end_category()
+    rec = current_bank()
+    if rec is not None:
+        _local.category = _Record(rec.bank_id, category_name, rec.run_id, threading.Lock())
+
+
+def end_category() -> None:
+    category = getattr(_local, "category", None)
+    rec = current_bank()
+    if category is None or rec is None:
+        return
+    _local.category = None
+    category.close()
+    rec.merge(category)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    target = _target()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if target is not None:
+            target.add_phase(name, time.perf_counter() - started)
+
+
+def add_phase(name: str, seconds: float) -> None:
+    """Время фазы, замеренное вручную (циклы с break, где неудобен phase())."""
+    target = _target()
+    if target is not None:
+        target.add_phase(name, seconds)
+
+
+def add(cards: int = 0, saved: int = 0) -> None:
+    target = _target()
+    if target is not None:
+        target.add(cards=cards, saved=saved)
+
+
+def track_driver(driver):
+    """
+    Оборачивает driver.execute (через него идёт каждый запрос к chromedriver),
+    как bench_parse._count_round_trips; запросы засчитываются текущему замеру
+    потока. Повторный вызов для того же драйвера ничего не делает.
+    """
+    if driver is None or getattr(driver, "_metrics_tracked", False):
+        return driver
+    orig_execute = driver.execute
+
+    def counted(driver_command, params=None):
+        target = _target()
+        if target is not None:
+            target.add(round_trips=1)
+        return orig_execute(driver_command, params)
+
+    driver.execute = counted
+    driver._metrics_tracked = True
+    return driver
@@ -1,13 +1,17 @@
 # update_nw.py
+import os
+import datetime
 import traceback
+import threading
 import time
 import gc
-from typing import Dict, Any, List, Callable, Optional
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Callable, Optional, Set
 from urllib.parse import urljoin
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
@@ -18,59 +22,107 @@ from selenium.common.exceptions import (
 
 from back_db import (
     get_all_bank_ids,
+    create_scrape_run,
+    get_scrape_run,
+    get_scrape_tasks,
+    set_scrape_task,
+    finish_scrape_run,
+    reopen_failed_scrape_tasks,
     fetch_categories_scrape_config,
     fetch_partners_scrape_config,
     save_single_category,
-    save_partners
+    save_partners,
+    set_bank_scrape_engine,
 )
 
+from driver_pool import DRIVERS
+import http_client
+from api_parser import fetch_api_json
+from waits import install_network_tracker, normalize_strategy, settle, wait_count_changed, wait_stale
+
 ProgressFn = Optional[Callable[[int, int, str], None]]
 
 from сaсtus import fetch_cactus_partners
 from bnb import fetch_promotions_bnb
 from belkart import fetch_promotions
+import http_cache
+import scrape_metrics
 
 PARSER_REGISTRY = {
     "default": None,
+    "http": None,                                   # HTTP + lxml, при неудаче — Selenium
+    "api_json": None,                               # JSON-эндпоинт (api_parser), при неудаче — Selenium
     "simple_js_categories": fetch_promotions_bnb,   # Банк 1 (БНБ)
     "belkart": fetch_promotions,                    # Банк 2 (Белкарт)
     "cactus": fetch_cactus_partners,                # Банк 13 (Кактус)
 }
 
-# Глобальный драйвер для переиспользования
-#_global_driver = None
-
-def _get_driver() -> webdriver.Chrome:
-    """Переиспользуем драйвер для снижения утечек памяти"""
-    #global _global_driver
-    
-    #if _global_driver is None:
-    opts = Options()
-    opts.add_argument("--headless=new")
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-dev-shm-usage")
-    opts.add_argument("--window-size=1920,1080")
-        #opts.add_argument("--disable-gpu")
-        #opts.add_argument("--disable-extensions")
-        #opts.add_argument("--disable-plugins")
-        # Ограничиваем использование памяти
-        #opts.add_argument("--memory-pressure-off")
-        
-    _global_driver = webdriver.Chrome(options=opts)
-    
-    return _global_driver
+def _get_driver(lean: bool = True) -> webdriver.Chrome:
+    """Драйвер из общего пула (вернуть через DRIVERS.release)."""
+    return DRIVERS.acquire(lean=lean)
 
 def _cleanup_driver():
-    """Очищаем глобальный драйвер"""
-    a = 1
-    #global _global_driver
-    #try:
-    #    if _global_driver:
-    #        _global_driver.quit()
-    #        _global_driver = None
-    #except:
-    #    pass
-    #gc.collect()
+    """Закрываем свободные драйверы пула (в конце прогона)"""
+    DRIVERS.close_idle()
+    gc.collect()
+
+def _fetch_categories_http(
+    bank_id: int,
+    cfg: Dict[str, Any],
+    progress: ProgressFn = None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Категории и партнёры без браузера: страницы качаются общим HTTP-клиентом,
+    разбираются теми же селекторами из banks (lxml).
+    Всё сначала собирается в память; None (и ничего не записано в БД), если
+    ссылки категорий строятся JS-ом, карточек нет или список догружается
+    кнопкой «Показать ещё» — тогда нужен Selenium. Сетевые ошибки (таймаут,
+    DNS, 5xx) пробрасываются: это не признак того, что сайту нужен браузер.
+    """
+    url = cfg["url"]
+    if not url or not cfg.get("container_selector"):
+        return None
+    pcfg = fetch_partners_scrape_config(bank_id)
+
+    doc = http_client.parse_document(http_client.fetch_html(url), url)
+    category_links = http_client.select_categories(doc, cfg)
+    if not category_links:
+        print(f"[bank {bank_id}] 🌐 В HTML нет ссылок категорий")
+        return None
+
+    scraped = []
+    for idx, (category_name, category_url) in enumerate(category_links, start=1):
+        cat_prefix = f"[bank {bank_id} cat {idx}/{len(category_links)} '{category_name}']"
+        cat_doc = http_client.parse_document(http_client.fetch_html(category_url), category_url)
+        if http_client.has_more_button(cat_doc, pcfg["button_more"]):
+            print(f"{cat_prefix} 🌐 Список догружается кнопкой — в HTML не все партнёры")
+            return None
+        raw_cards = http_client.select_cards(cat_doc, pcfg)
+        if progress:
+            progress(banks_done, banks_total, f"{cat_prefix} 🌐 Найдено партнёров: {len(raw_cards)}")
+        scraped.append((category_name, category_url, raw_cards))
+
+    if not any(raw_cards for _, _, raw_cards in scraped):
+        print(f"[bank {bank_id}] 🌐 В HTML нет карточек партнёров")
+        return None
+
+    categories: List[Dict[str, Any]] = []
+    for category_name, category_url, raw_cards in scraped:
+        category = {
+            "category_name": category_name,
+            "partners_count": None,
+            "category_url": category_url,
+        }
+        categories.append(category)
+        category_id = save_single_category(category, bank_id)
+        result = [_build_partner(raw, pcfg, category_url) for raw in raw_cards]
+        save_partners(result, bank_id, category_id)
+        print(f"[bank {bank_id}] 🌐 {category_name}: сохранено партнёров {len(result)}")
+
+    return categories
+
 
 def _click_cookie(driver: webdriver.Chrome, cookie_text: str) -> None:
     if not cookie_text:
@@ -89,8 +141,13 @@ def fetch_categories_for_bank(
     progress: ProgressFn = None,
     banks_done: int = 0,
     banks_total: int = 0,
+    checkpoint: Optional["CategoryCheckpoint"] = None,
 ) -> List[Dict[str, Any]]:
-    """Router с поддержкой разных парсеров"""
+    """
+    Router с поддержкой разных парсеров.
+    checkpoint — категории прогона (см. run_scrape): default-парсер
+    пропускает уже готовые и записывает итог каждой категории.
+    """
 
 
     cfg = fetch_categories_scrape_config(bank_id)
@@ -99,8 +156,33 @@ def fetch_categories_for_bank(
 
 
 
-    if parser_type != "default":
-        _cleanup_driver() 
+    if parser_type == "http":
+        # банк уже переведён на браузер — не тратим запросы на заведомо пустой HTML
+        if cfg.get("scrape_engine") != "selenium":
+            try:
+                categories = _fetch_categories_http(bank_id, cfg, progress, banks_done, banks_total)
+            except Exception as e:
+                # сеть/сервер — браузер только на этот прогон, сохранённый движок не трогаем
+                print(f"[bank {bank_id}] 🌐 Ошибка HTTP-парсинга: {e}")
+            else:
+                if categories is not None:
+                    set_bank_scrape_engine(bank_id, "http")
+                    return categories
+                # HTML без ссылок/карточек или с «Показать ещё» — сайту нужен браузер
+                set_bank_scrape_engine(bank_id, "selenium")
+        note = f"[bank {bank_id}] 🌐 HTTP-парсинг не дал партнёров — открываем браузер"
+        print(note)
+        if progress:
+            progress(banks_done, banks_total, note)
+    elif parser_type == "api_json":
+        categories = fetch_api_json(bank_id, progress, banks_done, banks_total)
+        if categories is not None:
+            return categories
+        note = f"[bank {bank_id}] 🔌 API не вернул партнёров — открываем браузер"
+        print(note)
+        if progress:
+            progress(banks_done, banks_total, note)
+    elif parser_type != "default":
         parser = PARSER_REGISTRY.get(parser_type)
         if not parser:
             raise ValueError(f"Неизвестный parser_type: {parser_type}")
@@ -125,27 +207,36 @@ def fetch_categories_for_bank(
             progress(banks_done, banks_total, f"[bank {bank_id}] ❌ {msg}")
         raise ValueError(msg)
 
-    driver = _get_driver()
+    strategy = normalize_strategy(cfg.get("wait_strategy"))
+    cards_selector = fetch_partners_scrape_config(bank_id)["partners_list"]
+    cat_selector = f"{cfg['container_selector']} {cfg['element_selector']}"
+
+    driver = scrape_metrics.track_driver(_get_driver(lean=cfg.get("lean_browsing", True)))
     
     try:
+        if strategy == "network":
+            install_network_tracker(driver)
+
         note_start = f"[bank {bank_id}] Открываем {url}"
         print(note_start)
         if progress:
             progress(banks_done, banks_total, note_start)
 
-        driver.get(url)
+        with scrape_metrics.phase("page_load"):
+            driver.get(url)
         
         # Очищаем кеш браузера периодически
         #if banks_done % 5 == 0:
         #    driver.execute_script("window.localStorage.clear();")
         #    driver.execute_script("window.sessionStorage.clear();")
 
-        _click_cookie(driver, cfg.get("cookie_text", ""))
+        with scrape_metrics.phase("cookie"):
+            _click_cookie(driver, cfg.get("cookie_text", ""))
 
         container = WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, cfg["container_selector"]))
         )
-        time.sleep(2)
+        settle(driver, strategy, cat_selector, legacy_sleep=2)
 
         cat_elements = container.find_elements(By.CSS_SELECTOR, cfg["element_selector"])
         category_names = [
@@ -168,6 +259,11 @@ def fetch_categories_for_bank(
 
         for idx, category_name in enumerate(category_names, start=1):
             cat_prefix = f"[bank {bank_id} cat {idx}/{len(category_names)} '{category_name}']"
+            if checkpoint and checkpoint.is_done(category_name):
+                print(f"{cat_prefix} ⏭ Уже готова в этом прогоне")
+                continue
+            cat_started = time.perf_counter()
+            scrape_metrics.begin_category(category_name)
 
             if progress:
                 progress(
@@ -179,41 +275,48 @@ def fetch_categories_for_bank(
             print(f"\n➡️ Обработка категории: {category_name}")
             label_xpath = f"//{el_tag}[normalize-space(text())='{category_name}']"
 
-            try:
-                label = WebDriverWait(driver, 30).until(
-                    EC.element_to_be_clickable((By.XPATH, label_xpath))
-                )
-            except TimeoutException:
-                msg = f"{cat_prefix} ⚠️ Категория не найдена (Timeout)"
-                print(msg)
-                if progress:
-                    progress(banks_done, banks_total, msg)
-                continue
-
-            try:
-                driver.execute_script(
-                    "arguments[0].scrollIntoView({block: 'center'});", label
-                )
-                time.sleep(0.3)
+            with scrape_metrics.phase("category_click"):
                 try:
-                    driver.execute_script("arguments[0].click();", label)
-                except (ElementClickInterceptedException, StaleElementReferenceException):
-                    driver.execute_script("arguments[0].click();", label)
-            except Exception as e:
-                msg = f"[bank {bank_id}] ❌ Ошибка на уровне банка: {e}"
-                print(msg)
-                if progress:
-                    progress(banks_done, banks_total, msg)
-                continue
+                    label = WebDriverWait(driver, 30).until(
+                        EC.element_to_be_clickable((By.XPATH, label_xpath))
+                    )
+                except TimeoutException:
+                    msg = f"{cat_prefix} ⚠️ Категория не найдена (Timeout)"
+                    print(msg)
+                    if progress:
+                        progress(banks_done, banks_total, msg)
+                    if checkpoint:
+                        checkpoint.record(category_name, cat_started, "категория не найдена")
+                    continue
 
-            try:
-                WebDriverWait(driver, 10).until(lambda d: d.current_url != url)
-            except TimeoutException:
-                warn = f"{cat_prefix} ⚠️ URL не изменился"
-                print(warn)
-                continue
+                try:
+                    driver.execute_script(
+                        "arguments[0].scrollIntoView({block: 'center'});", label
+                    )
+                    time.sleep(0.3)
+                    try:
+                        driver.execute_script("arguments[0].click();", label)
+                    except (ElementClickInterceptedException, StaleElementReferenceException):
+                        driver.execute_script("arguments[0].click();", label)
+                except Exception as e:
+                    msg = f"[bank {bank_id}] ❌ Ошибка на уровне банка: {e}"
+                    print(msg)
+                    if progress:
+                        progress(banks_done, banks_total, msg)
+                    if checkpoint:
+                        checkpoint.record(category_name, cat_started, f"клик по категории: {e}")
+                    continue
 
-            time.sleep(3)
+                try:
+                    WebDriverWait(driver, 10).until(lambda d: d.current_url != url)
+                except TimeoutException:
+                    warn = f"{cat_prefix} ⚠️ URL не изменился"
+                    print(warn)
+                    if checkpoint:
+                        checkpoint.record(category_name, cat_started, "URL не изменился")
+                    continue
+
+                settle(driver, strategy, cards_selector, legacy_sleep=3, timeout=5)
             category_url = driver.current_url
             print("🌐 URL категории:", category_url)
 
@@ -231,6 +334,8 @@ def fetch_categories_for_bank(
                 print(msg)
                 if progress:
                     progress(banks_done, banks_total, msg)
+                if checkpoint:
+                    checkpoint.record(category_name, cat_started, f"сохранение категории: {e}")
                 continue
 
             try:
@@ -248,11 +353,15 @@ def fetch_categories_for_bank(
                 print(ok)
                 if progress:
                     progress(banks_done, banks_total, ok)
+                if checkpoint:
+                    checkpoint.record(category_name, cat_started)
             except Exception as e:
                 msg = f"{cat_prefix} ❌ Ошибка при парсинге партнёров: {e}"
                 print(msg)
                 if progress:
                     progress(banks_done, banks_total, msg)
+                if checkpoint:
+                    checkpoint.record(category_name, cat_started, f"парсинг партнёров: {e}")
 
             try:
                 label = WebDriverWait(driver, 10).until(
@@ -280,17 +389,113 @@ def fetch_categories_for_bank(
                         (By.CSS_SELECTOR, cfg["container_selector"])
                     )
                 )
-                time.sleep(2)
+                settle(driver, strategy, cat_selector, legacy_sleep=2)
             except TimeoutException:
                 warn = f"{cat_prefix} ⚠️ После сброса не появился контейнер категорий"
                 print(warn)
                 continue
 
+        scrape_metrics.end_category()
         return categories
 
     finally:
+        # возвращаем браузер в пул: следующий банк переиспользует его
+        DRIVERS.release(driver)
         gc.collect()
 
+# ---------- ИЗВЛЕЧЕНИЕ КАРТОЧЕК ----------
+# js — один execute_script на страницу; elements — прежний обход карточек
+# через find_element/get_attribute (3–4 запроса к chromedriver на карточку)
+DOM_EXTRACT = os.getenv("DOM_EXTRACT", "js")
+
+# [{name, bonus, href}] по селекторам банка; name/bonus = null, если элемента нет
+_EXTRACT_CARDS_JS = """
+const [listSel, nameSel, bonusSel] = arguments;
+// как .text в Selenium — только видимый текст; у названия запасной textContent, как в поэлементном обходе
+const text = (el) => el ? (el.innerText || '').trim() : null;
+const nameText = (el) => el ? (text(el) || (el.textContent || '').trim()) : null;
+return Array.from(document.querySelectorAll(listSel)).map((card) => ({
+  name: nameText(nameSel ? card.querySelector(nameSel) : null),
+  bonus: text(bonusSel ? card.querySelector(bonusSel) : null),
+  href: card.getAttribute('href') ? card.href : ''
+}));
+"""
+
+
+def _extract_cards_js(driver: webdriver.Chrome, pcfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return driver.execute_script(
+        _EXTRACT_CARDS_JS, pcfg["partners_list"], pcfg["partner_name"], pcfg["partner_bonus"]
+    ) or []
+
+
+def _extract_cards_elements(driver: webdriver.Chrome, pcfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    raw_cards: List[Dict[str, Any]] = []
+    for card in driver.find_elements(By.CSS_SELECTOR, pcfg["partners_list"]):
+        name = None
+        try:
+            name_el = card.find_element(By.CSS_SELECTOR, pcfg["partner_name"])
+            name = name_el.text.strip()
+            if not name:
+                name = (name_el.get_attribute("textContent") or "").strip()
+        except Exception:
+            pass
+
+        bonus = None
+        try:
+            bonus = card.find_element(By.CSS_SELECTOR, pcfg["partner_bonus"]).text.strip()
+        except Exception:
+            pass
+
+        try:
+            href = card.get_attribute("href") or ""
+        except Exception:
+            href = ""
+
+        raw_cards.append({"name": name, "bonus": bonus, "href": href})
+    return raw_cards
+
+
+def extract_cards(driver: webdriver.Chrome, pcfg: Dict[str, Any], mode: str = "") -> List[Dict[str, Any]]:
+    """Сырые карточки страницы; при ошибке JS — откат на поэлементный обход."""
+    if (mode or DOM_EXTRACT) == "js":
+        try:
+            return _extract_cards_js(driver, pcfg)
+        except Exception as e:
+            print(f"⚠️ JS-извлечение не удалось ({e}), обходим карточки поэлементно")
+    return _extract_cards_elements(driver, pcfg)
+
+
+def _build_partner(raw: Dict[str, Any], pcfg: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    """Имя/бонус из сырой карточки: «Имя, 5 баллов» → имя и бонус, если нет отдельного поля."""
+    name_t = raw.get("name")
+    rest = None
+    if name_t is None:
+        print(f"⚠️ Не удалось найти имя партнёра")
+        name = "—"
+    elif "," in name_t:
+        name = name_t.split(",", 1)[0].strip()
+        rest = name_t.split(",", 1)[1].strip()
+    else:
+        name = name_t
+    if not name:
+        name = "—"
+
+    bonus = None
+    if raw.get("bonus") is not None:
+        bonus = raw["bonus"].replace(pcfg["bonus_unit"], "").strip() or None
+    elif rest:
+        bonus = rest.replace(pcfg["bonus_unit"], "").strip() or None
+
+    href_raw = raw.get("href") or ""
+    link = urljoin(base_url, href_raw) if href_raw else ""
+
+    return {
+        "partner_name": name,
+        "partner_bonus": bonus,
+        "partner_link": link,
+    }
+
+
 def _parse_partners(
     driver: webdriver.Chrome,
     base_url: str,
@@ -315,13 +520,17 @@ def _parse_partners(
             f"{cat_prefix} ▶️ Раскрываем список партнёров",
         )
 
+    strategy = normalize_strategy(pcfg.get("wait_strategy"))
+    cards_selector = pcfg["partners_list"]
+
     max_clicks = 20
     clicks = 0
 
+    show_more_started = time.perf_counter()
     while clicks < max_clicks:
         try:
-
-            time.sleep(2)
+            if strategy == "sleep":
+                time.sleep(2)
             btn = WebDriverWait(driver, 5).until(
                 EC.element_to_be_clickable(
                     (By.XPATH, f"//button[contains(., '{pcfg['button_more']}')]")
@@ -330,12 +539,21 @@ def _parse_partners(
             print("Нашёл кнопку:", btn.text)
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
 
+            before = driver.execute_script(
+                "return document.querySelectorAll(arguments[0]).length;", cards_selector
+            )
             try:
                 btn.click()
                 clicks += 1
             except (ElementClickInterceptedException, StaleElementReferenceException):
                 driver.execute_script("arguments[0].click();", btn)
-            time.sleep(2)
+            if strategy == "sleep":
+                time.sleep(2)
+            else:
+                # подгрузились новые карточки (или кнопку перерисовали) — и список успокоился
+                if not wait_count_changed(driver, cards_selector, before, timeout=10):
+                    wait_stale(driver, btn, timeout=2)
+                settle(driver, strategy, cards_selector, legacy_sleep=2)
         except TimeoutException:
             msg = f"{cat_prefix} ℹ️ Кнопка 'Показать ещё' больше не найдена"
             print(msg)
@@ -348,63 +566,23 @@ def _parse_partners(
         
     if clicks == max_clicks:
         print(f"{cat_prefix} ⚠️ Превышен лимит кликов 'Показать ещё'")
+    scrape_metrics.add_phase("show_more", time.perf_counter() - show_more_started)
 
-    cards = driver.find_elements(By.CSS_SELECTOR, pcfg["partners_list"])
-    msg_found = f"{cat_prefix} 🔍 Найдено партнёров: {len(cards)}"
+    with scrape_metrics.phase("extract"):
+        raw_cards = extract_cards(driver, pcfg)
+    scrape_metrics.add(cards=len(raw_cards))
+    msg_found = f"{cat_prefix} 🔍 Найдено партнёров: {len(raw_cards)}"
     print(msg_found)
     if progress:
         progress(banks_done, banks_total, msg_found)
 
-    result: List[Dict[str, Any]] = []
-
-    for card in cards:
-        try:
-            name_el = card.find_element(By.CSS_SELECTOR, pcfg["partner_name"])
-            name_t = name_el.text.strip()
-
-            if not name_t:
-                tc = (name_el.get_attribute("textContent") or "").strip()
-                if tc:
-                    name_t = tc
-
-            if "," in name_t:
-                name = name_t.split(",", 1)[0].strip()
-                rest = name_t.split(",", 1)[1].strip()
-            else:
-                name = name_t
-                rest = None
-                
-            if not name:
-                name = "—"
-        except Exception:
-            print(f"⚠️ Не удалось найти имя партнёра")
-            name = "—"
-            rest = None
-
-        bonus = None
-        try:
-            bonus_el = card.find_element(By.CSS_SELECTOR, pcfg["partner_bonus"])
-            bonus_raw = bonus_el.text.strip()
-            bonus = bonus_raw.replace(pcfg["bonus_unit"], "").strip() or None
-        except Exception:
-            if rest:
-                bonus = rest.replace(pcfg["bonus_unit"], "").strip() or None
-
-        try:
-            href_raw = card.get_attribute("href") or ""
-            link = urljoin(base_url, href_raw) if href_raw else ""
-        except Exception:
-            link = ""
-
-        result.append({
-            "partner_name": name,
-            "partner_bonus": bonus,
-            "partner_link": link,
-        })
+    result = [_build_partner(raw, pcfg, base_url) for raw in raw_cards]
 
     try:
         print("💾 Сохраняем партнёров...")
-        save_partners(result, bank_id, category_id)
+        with scrape_metrics.phase("db_save"):
+            save_partners(result, bank_id, category_id)
+        scrape_metrics.add(saved=len(result))
         msg_saved = f"{cat_prefix} ✅ Сохранено партнёров: {len(result)}"
         print(msg_saved)
         if progress:
@@ -417,41 +595,262 @@ def _parse_partners(
 
     return result
 
-def update_all_banks_categories(progress: ProgressFn = None) -> None:
-    """Обходит все банки и запускает парсинг"""
-    
-    bank_ids = get_all_bank_ids()
-    total = len(bank_ids)
-    
-    if total == 0:
-        if progress:
-            progress(1, 1, "В таблице banks нет записей")
-        return
+# ---------- ПАРАЛЛЕЛЬНЫЙ ОБХОД ----------
+# ориентировочная память одного headless Chrome с открытой страницей банка
+CHROME_MB_PER_WORKER = 450
+MAX_SCRAPE_WORKERS = 4
 
-    done = 0
-    
+
+def _mem_available_mb() -> Optional[int]:
     try:
-        for bank_id in bank_ids:
-            if bank_id == 13:
-                continue
-            if progress:
-                progress(done, total, f"[bank {bank_id}] ▶️ Старт парсинга банка")
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def pick_scrape_workers() -> int:
+    """
+    Число параллельных браузеров: SCRAPE_WORKERS из окружения, иначе —
+    по свободной памяти (MemAvailable / CHROME_MB_PER_WORKER, с запасом
+    на сам бот), но не больше MAX_SCRAPE_WORKERS.
+    """
+    env = os.getenv("SCRAPE_WORKERS")
+    if env:
+        return max(1, int(env))
+    mem = _mem_available_mb()
+    if mem is None:
+        return 1
+    return max(1, min(MAX_SCRAPE_WORKERS, (mem - 300) // CHROME_MB_PER_WORKER))
+
+
+# ---------- ПРОГОН С ЧЕКПОИНТАМИ ----------
+# незавершённый прогон старше этого не продолжаем, а начинаем заново
+SCRAPE_RESUME_HOURS = float(os.getenv("SCRAPE_RESUME_HOURS", "24"))
+
+
+def _hours_ago(hours: float) -> str:
+    return (datetime.datetime.now() - datetime.timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# банки, которые сейчас парсятся (ручной /update, планировщик): один банк —
+# не больше одного парсинга, иначе две сверки save_partners идут вперемешку
+_in_flight: Set[int] = set()
+_in_flight_cond = threading.Condition()
+
+
+def bank_in_flight(bank_id: int) -> bool:
+    with _in_flight_cond:
+        return bank_id in _in_flight
+
+
+@contextmanager
+def bank_slot(bank_id: int) -> Iterator[None]:
+    """Занимает банк на время парсинга; если он уже парсится — ждёт завершения."""
+    with _in_flight_cond:
+        if bank_id in _in_flight:
+            print(f"[bank {bank_id}] ⏳ Банк уже парсится, ждём завершения")
+        while bank_id in _in_flight:
+            _in_flight_cond.wait()
+        _in_flight.add(bank_id)
+    try:
+        yield
+    finally:
+        with _in_flight_cond:
+            _in_flight.discard(bank_id)
+            _in_flight_cond.notify_all()
 
-            try:
+
+class CategoryCheckpoint:
+    """Категории одного банка в прогоне: какие уже готовы, запись итогов."""
+
+    def __init__(self, run_id: int, bank_id: int, done: Set[str]) -> None:
+        self.run_id = run_id
+        self.bank_id = bank_id
+        self.done = set(done)
+        self.failed: List[str] = []
+
+    def is_done(self, category_name: str) -> bool:
+        return category_name in self.done
+
+    def record(self, category_name: str, started: float, error: Optional[str] = None) -> None:
+        duration = time.perf_counter() - started
+        try:
+            set_scrape_task(
+                self.run_id, self.bank_id, "failed" if error else "done",
+                category_name=category_name, duration_s=round(duration, 2), error=error,
+            )
+        except Exception as e:
+            print(f"[bank {self.bank_id}] ⚠️ Не удалось записать чекпоинт '{category_name}': {e}")
+        if error:
+            self.failed.append(category_name)
+        else:
+            self.done.add(category_name)
+
+
+def run_scrape(
+    bank_ids: Optional[List[int]] = None,
+    kind: str = "manual",
+    progress: ProgressFn = None,
+    workers: int = 1,
+    failed_only: bool = False,
+    cleanup: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """
+    Прогон по банкам с записью задач в scrape_runs / scrape_tasks.
+
+    Незавершённый прогон того же kind (процесс упал посреди работы)
+    продолжается: выполняются только задачи pending/running, а внутри
+    банка default-парсер пропускает уже готовые категории.
+    failed_only=True — повторить упавшие задачи последнего прогона kind
+    (None, если повторять нечего). cleanup=False — не сбрасывать статистику
+    HTTP-кэша и не закрывать браузеры (этим управляет вызывающий).
+    Возвращает итог прогона из scrape_runs.
+    """
+    if failed_only:
+        last = get_scrape_run(kind=kind)
+        if not last or not reopen_failed_scrape_tasks(last["id"]):
+            return None
+        run_id = last["id"]
+    else:
+        open_run = get_scrape_run(kind=kind, unfinished=True)
+        if open_run and open_run["started_at"] < _hours_ago(SCRAPE_RESUME_HOURS):
+            # слишком старый: «готовые» банки в нём уже неактуальны
+            finish_scrape_run(open_run["id"])
+            open_run = None
+        if open_run:
+            run_id = open_run["id"]
+            print(f"↩️ Продолжаем прогон #{run_id} ({kind}) с незавершённых задач")
+        else:
+            run_id = create_scrape_run(kind, bank_ids if bank_ids is not None else get_all_bank_ids())
+
+    tasks = get_scrape_tasks(run_id)
+    done_categories: Dict[int, Set[str]] = {}
+    for t in tasks:
+        if t["category_name"] and t["state"] == "done":
+            done_categories.setdefault(t["bank_id"], set()).add(t["category_name"])
+    pending = [t["bank_id"] for t in tasks if not t["category_name"] and t["state"] in ("pending", "running")]
+    total = len(pending)
+
+    # progress (редактирование сообщения в Telegram) зовут сразу несколько
+    # потоков — сериализуем и подставляем общий счётчик готовых банков
+    lock = threading.Lock()
+    state = {"done": 0}
+    if cleanup:
+        http_cache.reset_stats()
+
+    def report(_done: int, _total: int, note: str) -> None:
+        if progress:
+            with lock:
+                progress(state["done"], total, note)
+
+    def run_bank(bank_id: int) -> None:
+        with bank_slot(bank_id):
+            _run_bank(bank_id)
+
+    def _run_bank(bank_id: int) -> None:
+        started = time.perf_counter()
+        try:
+            strategy = normalize_strategy(fetch_categories_scrape_config(bank_id).get("wait_strategy"))
+        except Exception:
+            strategy = "?"
+        report(0, total, f"[bank {bank_id}] ▶️ Старт парсинга банка")
+        set_scrape_task(run_id, bank_id, "running")
+        checkpoint = CategoryCheckpoint(run_id, bank_id, done_categories.get(bank_id, set()))
+        error = None
+        try:
+            with scrape_metrics.bank(bank_id, run_id):
                 fetch_categories_for_bank(
                     bank_id,
-                    progress=progress,
-                    banks_done=done,
+                    progress=report if progress else None,
+                    banks_done=state["done"],
                     banks_total=total,
+                    checkpoint=checkpoint,
                 )
-            except Exception as e:
-                print(f"[bank {bank_id}] ❌ Ошибка банка: {e}")
-            finally:
-                done += 1
-                if progress:
-                    progress(done, total, f"[bank {bank_id}] ⏭ Переход к следующему банку")
+            if checkpoint.failed:
+                error = f"категорий с ошибкой: {len(checkpoint.failed)} ({', '.join(checkpoint.failed)})"
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            print(f"[bank {bank_id}] ❌ Ошибка банка: {e}")
+        # не в finally: если процесс прерван, задача остаётся running и продолжится
+        elapsed = time.perf_counter() - started
+        set_scrape_task(
+            run_id, bank_id, "failed" if error else "done",
+            duration_s=round(elapsed, 2), error=error,
+        )
+        with lock:
+            state["done"] += 1
+        print(f"[bank {bank_id}] ⏱ {elapsed:.1f} с (wait_strategy={strategy})")
+        report(0, total, f"[bank {bank_id}] ⏭ Банк обработан за {elapsed:.0f} с")
 
-                    
+    workers = max(1, min(workers, total or 1))
+    try:
+        if workers == 1:
+            for bank_id in pending:
+                run_bank(bank_id)
+        else:
+            print(f"🚀 Параллельный парсинг: {total} банков, воркеров: {workers}")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrape") as ex:
+                futures = [ex.submit(run_bank, bank_id) for bank_id in pending]
+                for fut in as_completed(futures):
+                    fut.result()
     finally:
-        _cleanup_driver()
-        gc.collect()
\ No newline at end of file
+        if cleanup:
+            _cleanup_driver()
+            gc.collect()
+            print(f"🗄 HTTP-кэш: {http_cache.summary()}")
+
+    run = finish_scrape_run(run_id)
+    print(
+        f"🏁 Прогон #{run_id} ({kind}): готово {run['tasks_done']}/{run['tasks_total']}, "
+        f"с ошибкой {run['tasks_failed']}"
+    )
+    return run
+
+
+def resume_unfinished_run(
+    kind: str = "manual",
+    progress: ProgressFn = None,
+    workers: int = 1,
+) -> Optional[Dict[str, Any]]:
+    """
+    При старте процесса: продолжает прогон kind, оборванный рестартом
+    (None — продолжать нечего). Прогон старше SCRAPE_RESUME_HOURS только
+    закрывается — новый полный прогон здесь не начинается.
+    """
+    open_run = get_scrape_run(kind=kind, unfinished=True)
+    if not open_run:
+        return None
+    if open_run["started_at"] < _hours_ago(SCRAPE_RESUME_HOURS):
+        finish_scrape_run(open_run["id"])
+        print(f"🗑 Прогон #{open_run['id']} ({kind}) устарел — закрыт без продолжения")
+        return None
+    return run_scrape(kind=kind, progress=progress, workers=workers)
+
+
+def failed_scrape_tasks(run_id: int) -> List[Dict[str, Any]]:
+    """Упавшие задачи прогона (банки и категории) — для отчёта."""
+    return [t for t in get_scrape_tasks(run_id) if t["state"] == "failed"]
+
+
+def update_all_banks_categories(
+    progress: ProgressFn = None,
+    workers: int = 1,
+    failed_only: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Обходит все банки (включая Кактус) и запускает парсинг — прогон
+    kind='manual' с чекпоинтами (см. run_scrape).
+    workers > 1 — банки обрабатываются параллельно, у каждого воркера свой
+    headless Chrome; запись в БД всё равно идёт через единственное
+    соединение-писатель пула (back_db), поэтому SQLite не конкурирует.
+    """
+    bank_ids = get_all_bank_ids()
+    if not bank_ids:
+        if progress:
+            progress(1, 1, "В таблице banks нет записей")
+        return None
+    return run_scrape(bank_ids, "manual", progress, workers, failed_only=failed_only)
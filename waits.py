@@ -0,0 +1,162 @@
+# waits.py
+"""
+Ожидания по условиям вместо фиксированных time.sleep в Selenium-парсерах.
+
+Стратегия задаётся на банк колонкой banks.wait_strategy:
+    sleep   — прежние фиксированные паузы (для сравнения и как запасной вариант);
+    cards   — ждём, пока число карточек/элементов перестанет меняться;
+    network — как cards, но сначала ждём, пока у страницы не останется
+              незавершённых fetch/XHR (счётчик ставится через CDP до загрузки
+              страницы — install_network_tracker).
+"""
+import time
+from typing import Optional
+
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+WAIT_STRATEGIES = ("sleep", "cards", "network")
+DEFAULT_WAIT_STRATEGY = "cards"
+
+# сколько число элементов должно не меняться, чтобы считать список загруженным
+STABLE_FOR = 0.6
+POLL = 0.15
+
+_COUNT_JS = "return document.querySelectorAll(arguments[0]).length;"
+_COUNT_READY_JS = "return [document.querySelectorAll(arguments[0]).length, document.readyState];"
+
+# счётчик незавершённых fetch/XHR + число загруженных ресурсов
+_NETWORK_TRACKER_JS = """
+(function () {
+  if (window.__pendingRequests !== undefined) return;
+  window.__pendingRequests = 0;
+  const done = () => { window.__pendingRequests = Math.max(0, window.__pendingRequests - 1); };
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function () {
+      window.__pendingRequests++;
+      return origFetch.apply(this, arguments).finally(done);
+    };
+  }
+  const origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    window.__pendingRequests++;
+    this.addEventListener('loadend', done, { once: true });
+    return origSend.apply(this, arguments);
+  };
+})();
+"""
+
+_NETWORK_STATE_JS = """
+return [
+  document.readyState,
+  window.__pendingRequests === undefined ? -1 : window.__pendingRequests,
+  performance.getEntriesByType('resource').length
+];
+"""
+
+
+def normalize_strategy(value: Optional[str]) -> str:
+    value = (value or "").strip().lower()
+    return value if value in WAIT_STRATEGIES else DEFAULT_WAIT_STRATEGY
+
+
+def install_network_tracker(driver) -> bool:
+    """Через CDP вешает счётчик запросов на все следующие загрузки страниц."""
+    try:
+        driver.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument", {"source": _NETWORK_TRACKER_JS}
+        )
+        return True
+    except Exception as e:
+        print(f"⚠️ Не удалось установить трекер сети: {e}")
+        return False
+
+
+def count(driver, selector: str) -> int:
+    return driver.execute_script(_COUNT_JS, selector)
+
+
+def wait_count_stable(driver, selector: str, timeout: float = 10.0,
+                      stable_for: float = STABLE_FOR, min_count: int = 1,
+                      empty_after: Optional[float] = None) -> int:
+    """
+    Ждёт, пока число элементов selector (не меньше min_count) не меняется
+    stable_for секунд. Возвращает последнее число; по таймауту — не падает.
+    empty_after — если страница загружена, а элементов меньше min_count
+    столько секунд подряд, список считается пустым (пустая категория не
+    ждёт весь timeout).
+    """
+    deadline = time.monotonic() + timeout
+    last = -1
+    since = time.monotonic()
+    while time.monotonic() < deadline:
+        n, ready = driver.execute_script(_COUNT_READY_JS, selector)
+        now = time.monotonic()
+        if n != last:
+            last, since = n, now
+        elif n >= min_count and now - since >= stable_for:
+            return n
+        elif (n < min_count and empty_after is not None and ready == "complete"
+              and now - since >= empty_after):
+            return n
+        time.sleep(POLL)
+    return last
+
+
+def wait_count_changed(driver, selector: str, before: int, timeout: float = 10.0) -> bool:
+    """Ждёт, пока число элементов станет отличным от before (после «Показать ещё»)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if count(driver, selector) != before:
+            return True
+        time.sleep(POLL)
+    return False
+
+
+def wait_network_idle(driver, timeout: float = 10.0, stable_for: float = 0.5) -> bool:
+    """
+    Страница загружена, нет незавершённых fetch/XHR, и число загруженных
+    ресурсов не растёт stable_for секунд. Без трекера — только по ресурсам.
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    since = time.monotonic()
+    while time.monotonic() < deadline:
+        ready, pending, resources = driver.execute_script(_NETWORK_STATE_JS)
+        now = time.monotonic()
+        if ready != "complete" or pending > 0 or resources != last:
+            last, since = resources, now
+        elif now - since >= stable_for:
+            return True
+        time.sleep(POLL)
+    return False
+
+
+def wait_stale(driver, element: Optional[WebElement], timeout: float = 10.0) -> bool:
+    """Ждёт, пока элемент исчезнет из DOM (контент перерисован после клика)."""
+    if element is None:
+        return False
+    try:
+        WebDriverWait(driver, timeout).until(EC.staleness_of(element))
+        return True
+    except TimeoutException:
+        return False
+
+
+def settle(driver, strategy: str, selector: Optional[str], legacy_sleep: float,
+           timeout: float = 10.0, min_count: int = 1) -> None:
+    """
+    Точка ожидания вместо time.sleep(legacy_sleep): по стратегии банка ждёт
+    тишины в сети и/или стабильного числа элементов selector. Пустой список
+    ждётся не дольше прежней паузы legacy_sleep.
+    """
+    if strategy == "sleep":
+        time.sleep(legacy_sleep)
+        return
+    if strategy == "network":
+        wait_network_idle(driver, timeout)
+    if selector:
+        wait_count_stable(driver, selector, timeout, min_count=min_count, empty_after=legacy_sleep)
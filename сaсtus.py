@@ -1,10 +1,12 @@
+import os
 import time
 import re
 import gc
-from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from urllib.parse import urljoin
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
@@ -15,33 +17,44 @@ from selenium.common.exceptions import (
 )
 import urllib3
 
-from back_db import save_single_category, save_partners
+from back_db import (
+    save_single_category,
+    save_shared_partners,
+    get_shared_category_partners,
+    get_latest_categories_by_bank,
+    fetch_categories_scrape_config,
+    normalize,
+)
+from driver_pool import DRIVERS
+from waits import install_network_tracker, normalize_strategy, settle, wait_stale
+import http_client
+import html_parse
+import scrape_metrics
 
 BASE_URL = "https://www.mtbank.by/cards/cactus/part/"
-
-def _driver() -> webdriver.Chrome:
-    """Создает новый драйвер специально для Кактуса"""
-    opts = Options()
-    opts.add_argument("--headless=new")
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-dev-shm-usage")
-    opts.add_argument("--window-size=1920,1080")
-    opts.add_argument("--disable-gpu")
-    opts.add_argument("--disable-extensions")
-    opts.add_argument("--disable-plugins")
-    opts.add_argument("--memory-pressure-off")
-    
-    driver = webdriver.Chrome(options=opts)
-    driver.set_page_load_timeout(30)
-    return driver
+CARD_SELECTOR = ".about-banners__item"
+CATEGORY_SELECTOR = ".checkboxs.js-bind-checkboxes .checkbox-wrap"
+# js — один execute_script на страницу, elements — поэлементный обход карточек
+DOM_EXTRACT = os.getenv("DOM_EXTRACT", "js")
+
+# url — категории и страницы открываются прямыми URL фильтра (HTTP или Selenium),
+# click — прежний обход кликами по чекбоксам и пагинации (и запасной вариант для url)
+CACTUS_MODE = os.getenv("CACTUS_MODE", "url")
+CACTUS_WORKERS = int(os.getenv("CACTUS_WORKERS", "2"))
+CACTUS_RETRIES = int(os.getenv("CACTUS_RETRIES", "2"))
+# параметр страницы, если в ссылках пагинации его не нашлось
+CACTUS_PAGE_PARAM = os.getenv("CACTUS_PAGE_PARAM", "PAGEN_1")
+MAX_PAGES = 50
+
+FILTER_PARAM = "filter[59][value][]"
+
+def _driver(lean: bool = True) -> webdriver.Chrome:
+    """Драйвер для Кактуса из общего пула (таймаут загрузки 30 с)"""
+    return scrape_metrics.track_driver(DRIVERS.acquire(page_load_timeout=30, lean=lean))
 
 def _cleanup_cactus_driver(driver: webdriver.Chrome):
-    """Очищает драйвер Кактуса"""
-    try:
-        if driver:
-            driver.quit()
-    except:
-        pass
+    """Возвращает драйвер Кактуса в пул"""
+    DRIVERS.release(driver)
     gc.collect()
 
 
@@ -64,14 +77,146 @@ def fetch_cactus_partners(
     banks_done: int = 0,
     banks_total: int = 0,
 ) -> List[Dict[str, Any]]:
-    """ОСНОВНАЯ ФУНКЦИЯ - создает свой драйвер и закрывает его в конце"""
+    """
+    ОСНОВНАЯ ФУНКЦИЯ. CACTUS_MODE=url — категории по прямым URL фильтра
+    (см. _fetch_by_url); категории, которые так не получились, и режим
+    click — обходом кликами. Собранные категории сохраняются одним
+    списком уникальных партнёров (см. _save_shared).
+    """
+    if CACTUS_MODE != "url":
+        done, listed = _fetch_by_clicks(bank_id, progress, banks_done, banks_total)
+        return _save_shared(bank_id, done, missing=_unread(listed, done))
+
+    try:
+        done, failed = _fetch_by_url(bank_id, progress, banks_done, banks_total)
+    except Exception as e:
+        print(f"[bank {bank_id}] ❌ Ошибка Кактуса по прямым URL: {e}")
+        done, failed = [], None
+    if failed is None:
+        print(f"[bank {bank_id}] ↩️ Кактус: прямые URL не сработали, обходим кликами")
+        done, listed = _fetch_by_clicks(bank_id, progress, banks_done, banks_total)
+        return _save_shared(bank_id, done, missing=_unread(listed, done))
+    if failed:
+        names = ", ".join(name for name, _ in failed)
+        print(f"[bank {bank_id}] ↩️ Кактус: {len(failed)} категорий кликами: {names}")
+        clicked, _ = _fetch_by_clicks(
+            bank_id, progress, banks_done, banks_total,
+            only_values={value for _, value in failed},
+        )
+        done += clicked
+    return _save_shared(bank_id, done, missing=_unread(failed, done))
+
+
+def _unread(listed: List[Tuple[str, str]], done: List[Dict[str, Any]]) -> List[str]:
+    """Категории из списка, которые не прочитаны (сбой или ни одного партнёра)."""
+    got = {c["category_name"] for c in done if c["partners"]}
+    return [name for name, _ in listed if name not in got]
+
+
+# ---------- ОБЩИЙ СПИСОК ПАРТНЁРОВ ----------
+def _bonus_value(bonus: Optional[str]) -> float:
+    try:
+        return float(bonus) if bonus else -1.0
+    except ValueError:
+        return -1.0
+
+
+def _merge_partners(categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Один партнёр на имя (по back_db.normalize) из всех категорий:
+    наибольший бонус, непустая ссылка; порядок — первого появления.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for category in categories:
+        for partner in category["partners"]:
+            key = normalize(partner["partner_name"])
+            best = merged.get(key)
+            if best is None:
+                merged[key] = dict(partner)
+                continue
+            if _bonus_value(partner.get("partner_bonus")) > _bonus_value(best.get("partner_bonus")):
+                best["partner_bonus"] = partner.get("partner_bonus")
+            if not best.get("partner_link") and partner.get("partner_link"):
+                best["partner_link"] = partner["partner_link"]
+    return list(merged.values())
+
+
+def _save_shared(
+    bank_id: int,
+    categories: List[Dict[str, Any]],
+    missing: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Сохраняет категории (с числом партнёров) и одной сверкой — уникальных
+    партнёров банка с их принадлежностью к категориям. Для категорий из
+    missing (не прочитаны ни по URL, ни кликами) и категорий без партнёров
+    берётся прошлый состав, чтобы их партнёры не ушли в удалённые из-за
+    сбоя одной категории.
+    """
+    missing = list(missing or [])
+    missing += [c["category_name"] for c in categories if not c["partners"] and c["category_name"] not in missing]
+    categories = [c for c in categories if c["partners"]]
+    if missing:
+        latest = {name: cat_id for cat_id, name, _ in get_latest_categories_by_bank(bank_id)}
+        for name in missing:
+            if name in latest:
+                categories.append({
+                    "category_id": latest[name],
+                    "category_name": name,
+                    "partners": get_shared_category_partners(bank_id, name),
+                })
+
+    saved: List[Dict[str, Any]] = []
+    memberships: List[Tuple[int, str]] = []
+    for category in categories:
+        category_id = category.get("category_id")
+        if category_id is None:
+            info = {
+                "category_name": category["category_name"],
+                "partners_count": len(category["partners"]),
+                "category_url": category["category_url"],
+            }
+            category_id = save_single_category(info, bank_id)
+            saved.append(info)
+        memberships.extend((category_id, p["partner_name"]) for p in category["partners"])
+
+    partners = _merge_partners(categories)
+    if not partners:
+        print(f"[bank {bank_id}] ⚠️ Кактус: партнёры не найдены, список в БД не меняем")
+        return saved
+
+    with scrape_metrics.phase("db_save"):
+        save_shared_partners(partners, bank_id, memberships)
+    scrape_metrics.add(saved=len(partners))
+    total = sum(len(c["partners"]) for c in categories)
+    print(f"[bank {bank_id}] ✅ Кактус: сохранено уникальных партнёров {len(partners)} "
+          f"(в категориях {total}, категорий {len(categories)})")
+    return saved
+
+
+def _fetch_by_clicks(
+    bank_id: int,
+    progress=None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+    only_values: Optional[set] = None,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """
+    Обход кликами по чекбоксам; берёт драйвер из пула и возвращает его в конце.
+    Возвращает (прочитанные категории, все найденные на странице [(имя, value)]).
+    """
 
     driver = None
     categories_data: List[Dict[str, Any]] = []
+    categories: List[Tuple[str, str]] = []
 
     try:
-        driver = _driver()
+        cfg = fetch_categories_scrape_config(bank_id)
+        strategy = normalize_strategy(cfg.get("wait_strategy"))
+        driver = _driver(lean=cfg.get("lean_browsing", True))
         print("✅ Драйвер Кактуса успешно инициализирован")
+        if strategy == "network":
+            install_network_tracker(driver)
 
         note = f"[bank {bank_id}] 🌵 Кактус - запуск парсера"
         print(note)
@@ -80,25 +225,29 @@ def fetch_cactus_partners(
 
         # Загрузка страницы
         try:
-            driver.get(BASE_URL)
+            with scrape_metrics.phase("page_load"):
+                driver.get(BASE_URL)
         except TimeoutException as e:
             msg = f"[bank {bank_id}] Таймаут при загрузке {BASE_URL}: {e}"
             print(msg)
             if progress:
                 progress(banks_done, banks_total, msg)
-            return []
+            return categories_data, categories
         except (WebDriverException, urllib3.exceptions.ReadTimeoutError, TimeoutError) as e:
             msg = f"[bank {bank_id}] ❌ Ошибка при загрузке {BASE_URL}: {e}"
             print(msg)
             if progress:
                 progress(banks_done, banks_total, msg)
-            return []
+            return categories_data, categories
 
-        time.sleep(3)
-        _click_cookie(driver, "Согласен")
+        settle(driver, strategy, CATEGORY_SELECTOR, legacy_sleep=3)
+        with scrape_metrics.phase("cookie"):
+            _click_cookie(driver, "Согласен")
 
         # Парсинг категорий и обработка
         categories = _parse_categories(driver)
+        if only_values is not None:
+            categories = [c for c in categories if c[1] in only_values]
         print(f"[bank {bank_id}] 📂 Найдено категорий: {len(categories)}")
 
         if not categories:
@@ -106,7 +255,7 @@ def fetch_cactus_partners(
             print(note)
             if progress:
                 progress(banks_done, banks_total, note)
-            return []
+            return categories_data, categories
 
         # Обработка категорий
         for idx, (category_name, category_value) in enumerate(categories, 1):
@@ -123,6 +272,7 @@ def fetch_cactus_partners(
                 progress=progress,
                 banks_done=banks_done,
                 banks_total=banks_total,
+                strategy=strategy,
             )
 
             if category_data:
@@ -130,23 +280,249 @@ def fetch_cactus_partners(
 
             # Reset filter only if it was successfully applied
             if category_data:
-                _reset_category_filter(driver, category_value)
-            time.sleep(1)
+                _reset_category_filter(driver, category_value, strategy)
+            if strategy == "sleep":
+                time.sleep(1)
 
+        scrape_metrics.end_category()
         print(f"[bank {bank_id}] ✅ Кактус: обработано {len(categories_data)} категорий")
-        return categories_data
+        return categories_data, categories
 
     except Exception as e:
         print(f"[bank {bank_id}] ❌ Ошибка парсера Кактуса: {e}")
         import traceback
         traceback.print_exc()
-        return []
+        return categories_data, categories
 
     finally:
-        print(f"[bank {bank_id}] Закрываем драйвер Кактуса")
+        print(f"[bank {bank_id}] Возвращаем драйвер Кактуса в пул")
         _cleanup_cactus_driver(driver)
 
 
+# ---------- ПРЯМЫЕ URL ФИЛЬТРА ----------
+# страница: (сырые карточки [{name, text, href}], пагинация {"param", "last"})
+PageFetcher = Callable[[str], Tuple[List[Dict[str, Any]], Dict[str, Any]]]
+
+_PAGINATION_JS = """
+return Array.from(document.querySelectorAll('.pagination__list a.pagination__page'))
+  .map((a) => [(a.innerText || '').trim(), a.getAttribute('href') || '']);
+"""
+
+
+def _category_url(category_value: str, page: int = 1, page_param: str = CACTUS_PAGE_PARAM) -> str:
+    url = f"{BASE_URL}?{FILTER_PARAM}={category_value}"
+    return url if page == 1 else f"{url}&{page_param}={page}"
+
+
+def _pagination_info(links: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Номер последней видимой страницы и имя параметра страницы из ссылок пагинации."""
+    last, param = 1, None
+    for text, href in links:
+        if text.isdigit():
+            last = max(last, int(text))
+        match = re.search(r"(PAGEN_\d+|page)=(\d+)", href or "")
+        if match:
+            param = param or match.group(1)
+            last = max(last, int(match.group(2)))
+    return {"param": param, "last": last}
+
+
+def _fingerprint(cards: List[Dict[str, Any]]) -> Tuple[str, ...]:
+    return tuple((c.get("name") or "") for c in cards)
+
+
+def _http_page(url: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Any]:
+    with scrape_metrics.phase("page_load"):
+        page_html = http_client.fetch_html(url, timeout=20)
+    with scrape_metrics.phase("extract"):
+        return _http_cards(page_html)
+
+
+def _http_cards(page_html: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Any]:
+    doc = html_parse.parse(page_html)
+    cards = []
+    for card in doc.select(CARD_SELECTOR):
+        title = card.select_one(".subpage-banner__title")
+        text = card.select_one(".subpage-banner__text")
+        link = card.select_one(".subpage-banner__link")
+        cards.append({
+            "name": " ".join(title.text().split()) if title else None,
+            "text": " ".join(text.text().split()) if text else None,
+            "href": urljoin(BASE_URL, link.get("href") or "") if link and link.get("href") else "",
+        })
+    links = [(a.text().strip(), a.get("href") or "") for a in doc.select(".pagination__list a.pagination__page")]
+    return cards, _pagination_info(links), doc
+
+
+def _http_categories(doc) -> List[Tuple[str, str]]:
+    categories: List[Tuple[str, str]] = []
+    for wrap in doc.select(CATEGORY_SELECTOR):
+        text_el = wrap.select_one(".checkbox-el__text.js-checkbox-text")
+        checkbox = wrap.select_one("input[type='checkbox']")
+        name = text_el.text().strip() if text_el else ""
+        value = checkbox.get("value") if checkbox else None
+        if name and value:
+            categories.append((name, value))
+    return categories
+
+
+def _selenium_page(driver, url: str, strategy: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    with scrape_metrics.phase("page_load"):
+        driver.get(url)
+        try:
+            WebDriverWait(driver, 15).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, CARD_SELECTOR))
+            )
+        except TimeoutException:
+            return [], {"param": None, "last": 1}
+        settle(driver, strategy, CARD_SELECTOR, legacy_sleep=2)
+    with scrape_metrics.phase("extract"):
+        links = [tuple(x) for x in (driver.execute_script(_PAGINATION_JS) or [])]
+        return extract_cards(driver), _pagination_info(links)
+
+
+def _scrape_category_pages(
+    fetch_page: PageFetcher,
+    category_value: str,
+    baseline: Tuple[str, ...],
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Все страницы категории по прямым URL. None — не получилось (нет
+    карточек, фильтр или параметр страницы сервер проигнорировал).
+    """
+    cards, pagination = fetch_page(_category_url(category_value))
+    if not cards:
+        return None
+    first = _fingerprint(cards)
+    if baseline and first == baseline:
+        print(f"  ⚠️ Фильтр {category_value} не применился — та же выдача, что без фильтра")
+        return None
+
+    raw_cards = list(cards)
+    seen = {first}
+    param = pagination["param"] or CACTUS_PAGE_PARAM
+    last = pagination["last"]
+    page = 2
+    while page <= min(last, MAX_PAGES):
+        cards, pagination = fetch_page(_category_url(category_value, page, param))
+        if not cards:
+            return None
+        fp = _fingerprint(cards)
+        if fp in seen:
+            print(f"  ⚠️ Параметр {param} не сработал — страница {page} повторяет предыдущую")
+            return None
+        seen.add(fp)
+        raw_cards.extend(cards)
+        # видимая пагинация может показывать не все номера сразу
+        last = max(last, pagination["last"])
+        page += 1
+
+    return _cards_to_partners(raw_cards)
+
+
+def _category_result(category_name: str, category_value: str,
+                     partners: List[Dict[str, Any]]) -> Dict[str, Any]:
+    print(f"  ✅ {category_name}: партнёров {len(partners)}")
+    return {
+        "category_name": category_name,
+        "category_url": _category_url(category_value),
+        "partners": partners,
+    }
+
+
+def _fetch_by_url(
+    bank_id: int,
+    progress=None,
+    banks_done: int = 0,
+    banks_total: int = 0,
+) -> Tuple[List[Dict[str, Any]], Optional[List[Tuple[str, str]]]]:
+    """
+    Каждая категория — независимая задача: страница фильтра и её страницы
+    пагинации открываются напрямую. Сначала по HTTP (если сервер отдаёт
+    карточки в HTML), иначе Selenium — у каждого воркера свой драйвер из
+    пула. До CACTUS_RETRIES повторов на категорию.
+    Возвращает (прочитанные категории с партнёрами, [(имя, value)] неудавшихся) или
+    (…, None), если не удалось даже получить список категорий.
+    """
+    cfg = fetch_categories_scrape_config(bank_id)
+    strategy = normalize_strategy(cfg.get("wait_strategy"))
+    lean = cfg.get("lean_browsing", True)
+
+    engine = "http"
+    try:
+        base_cards, _, doc = _http_page(BASE_URL)
+        categories = _http_categories(doc)
+    except Exception as e:
+        print(f"[bank {bank_id}] ⚠️ Кактус по HTTP недоступен: {e}")
+        base_cards, categories = [], []
+
+    if not (base_cards and categories):
+        engine = "selenium"
+        driver = _driver(lean=lean)
+        try:
+            if strategy == "network":
+                install_network_tracker(driver)
+            base_cards, _ = _selenium_page(driver, BASE_URL, strategy)
+            with scrape_metrics.phase("cookie"):
+                _click_cookie(driver, "Согласен")
+            categories = _parse_categories(driver)
+        except Exception as e:
+            print(f"[bank {bank_id}] ❌ Ошибка загрузки {BASE_URL}: {e}")
+            categories = []
+        finally:
+            _cleanup_cactus_driver(driver)
+
+    if not categories:
+        return [], None
+
+    baseline = _fingerprint(base_cards)
+    note = f"[bank {bank_id}] 🌵 Кактус: {len(categories)} категорий по прямым URL ({engine})"
+    print(note)
+    if progress:
+        progress(banks_done, banks_total, note)
+
+    bank_metrics = scrape_metrics.current_bank()
+
+    def run_category(item: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        # поток пула: замер категории идёт в запись банка вызывающего потока
+        with scrape_metrics.use(bank_metrics):
+            scrape_metrics.begin_category(item[0])
+            return _run_category(item)
+
+    def _run_category(item: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        category_name, category_value = item
+        for attempt in range(1, CACTUS_RETRIES + 2):
+            driver = None
+            try:
+                if engine == "http":
+                    fetch_page = lambda url: _http_page(url)[:2]
+                else:
+                    driver = _driver(lean=lean)
+                    if strategy == "network":
+                        install_network_tracker(driver)
+                    fetch_page = lambda url: _selenium_page(driver, url, strategy)
+                partners = _scrape_category_pages(fetch_page, category_value, baseline)
+                if partners is not None:
+                    return _category_result(category_name, category_value, partners)
+            except Exception as e:
+                print(f"  ⚠️ {category_name}: ошибка на попытке {attempt}: {e}")
+            finally:
+                if driver is not None:
+                    _cleanup_cactus_driver(driver)
+            if attempt <= CACTUS_RETRIES:
+                time.sleep(attempt)
+        return None
+
+    workers = max(1, min(CACTUS_WORKERS, len(categories)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cactus") as ex:
+        results = list(ex.map(run_category, categories))
+
+    done = [r for r in results if r]
+    failed = [cat for cat, r in zip(categories, results) if not r]
+    print(f"[bank {bank_id}] ✅ Кактус по URL: {len(done)} категорий, не удалось: {len(failed)}")
+    return done, failed
+
+
 def _parse_categories(driver) -> List[Tuple[str, str]]:
     categories: List[Tuple[str, str]] = []
 
@@ -196,24 +572,16 @@ def _process_category(
     progress,
     banks_done: int,
     banks_total: int,
+    strategy: str = "cards",
 ) -> Optional[Dict[str, Any]]:
-    """Активирует фильтр категории, обходит все страницы и сохраняет партнёров."""
+    """Активирует фильтр категории и обходит все страницы; сохранение — в _save_shared."""
 
     category_url = f"{BASE_URL}?filter[59][value][]={category_value}"
-    category = {
-        "category_name": category_name,
-        "partners_count": 0,
-        "category_url": category_url,
-    }
-
-    try:
-        category_id = save_single_category(category, bank_id)
-        print(f"✅ Категория сохранена в БД: id={category_id}")
-    except Exception as e:
-        print(f"❌ Ошибка сохранения категории: {e}")
-        return None
 
-    if not _apply_category_filter(driver, category_value):
+    scrape_metrics.begin_category(category_name)
+    with scrape_metrics.phase("category_click"):
+        applied = _apply_category_filter(driver, category_value, strategy)
+    if not applied:
         print(f"❌ Не удалось активировать фильтр для {category_name}")
         return None
 
@@ -222,7 +590,7 @@ def _process_category(
 
         # 1. Текущая страница (уже загружена)
         print("Страница (текущая после фильтра)")
-        current_partners = _parse_page_partners(driver)
+        current_partners = _parse_page_partners(driver, strategy)
         all_partners.extend(current_partners)
 
         # 2. Обход пагинации
@@ -232,11 +600,13 @@ def _process_category(
         while page_num <= max_pages:
             try:
                 # Кликаем по ссылке страницы (AJAX загрузка)
-                if not _click_pagination_page(driver, page_num):
+                with scrape_metrics.phase("pagination"):
+                    clicked = _click_pagination_page(driver, page_num, strategy)
+                if not clicked:
                     print(f"Нет ссылки на страницу {page_num}, заканчиваем пагинацию")
                     break
                 
-                page_partners = _parse_page_partners(driver)
+                page_partners = _parse_page_partners(driver, strategy)
                 if not page_partners:
                     print(f"На странице {page_num} нет партнёров, заканчиваем")
                     break
@@ -259,15 +629,14 @@ def _process_category(
                 break
 
         if all_partners:
-            save_partners(all_partners, bank_id, category_id)
-            print(f"  ✅ Сохранено всего партнёров: {len(all_partners)}")
+            print(f"  ✅ Всего партнёров в категории: {len(all_partners)}")
         else:
             print(f"⚠️ Партнёры не найдены для {category_name}")
 
         return {
             "category_name": category_name,
-            "partners_count": len(all_partners),
             "category_url": category_url,
+            "partners": all_partners,
         }
 
     except Exception as e:
@@ -277,7 +646,24 @@ def _process_category(
         return None
 
 
-def _click_pagination_page(driver, page_num: int) -> bool:
+def _first_card(driver):
+    cards = driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR)
+    return cards[0] if cards else None
+
+
+def _wait_cards_replaced(driver, old_card, strategy: str) -> None:
+    """После AJAX-клика: старые карточки исчезли, новые перестали добавляться."""
+    WebDriverWait(driver, 15).until(
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, CARD_SELECTOR))
+    )
+    if strategy == "sleep":
+        time.sleep(2)
+        return
+    wait_stale(driver, old_card, timeout=5)
+    settle(driver, strategy, CARD_SELECTOR, legacy_sleep=2)
+
+
+def _click_pagination_page(driver, page_num: int, strategy: str = "cards") -> bool:
     """Кликает по ссылке страницы пагинации вместо перехода по URL"""
     try:
         # Ищем все ссылки пагинации
@@ -289,16 +675,15 @@ def _click_pagination_page(driver, page_num: int) -> bool:
             try:
                 link_text = link.text.strip()
                 if link_text == str(page_num):
+                    old_card = _first_card(driver)
                     # Скроллим к ссылке и кликаем
                     driver.execute_script("arguments[0].scrollIntoView({block:'center'});", link)
-                    time.sleep(0.5)
+                    if strategy == "sleep":
+                        time.sleep(0.5)
                     driver.execute_script("arguments[0].click();", link)
                     print(f"✅ Клик по странице {page_num}")
                     # Ждём загрузки контента через AJAX
-                    WebDriverWait(driver, 15).until(
-                        EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".about-banners__item"))
-                    )
-                    time.sleep(2)
+                    _wait_cards_replaced(driver, old_card, strategy)
                     return True
             except StaleElementReferenceException:
                 continue
@@ -313,7 +698,7 @@ def _click_pagination_page(driver, page_num: int) -> bool:
         return False
 
 
-def _apply_category_filter(driver, category_value: str) -> bool:
+def _apply_category_filter(driver, category_value: str, strategy: str = "cards") -> bool:
     """Apply category filter with retry logic and improved error handling"""
     max_retries = 3
     checkbox_xpath = f"//input[@type='checkbox' and @value='{category_value}']"
@@ -326,17 +711,17 @@ def _apply_category_filter(driver, category_value: str) -> bool:
             )
             
             checkbox = driver.find_element(By.XPATH, checkbox_xpath)
+            old_card = None
 
             if not checkbox.is_selected():
+                old_card = _first_card(driver)
                 driver.execute_script("arguments[0].scrollIntoView({block:'center'});", checkbox)
-                time.sleep(0.5)
+                if strategy == "sleep":
+                    time.sleep(0.5)
                 driver.execute_script("arguments[0].click();", checkbox)
                 print(f"✅ Фильтр активирован (попытка {attempt}): {category_value}")
 
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".about-banners__item"))
-            )
-            time.sleep(2)
+            _wait_cards_replaced(driver, old_card, strategy)
             return True
 
         except TimeoutException:
@@ -356,7 +741,7 @@ def _apply_category_filter(driver, category_value: str) -> bool:
     return False
 
 
-def _reset_category_filter(driver, category_value: str) -> None:
+def _reset_category_filter(driver, category_value: str, strategy: str = "cards") -> None:
     """Reset filter only if element exists"""
     if not category_value:
         return
@@ -373,78 +758,89 @@ def _reset_category_filter(driver, category_value: str) -> None:
         checkbox = checkboxes[0]
 
         if checkbox.is_selected():
+            old_card = _first_card(driver)
             driver.execute_script("arguments[0].scrollIntoView({block:'center'});", checkbox)
-            time.sleep(0.3)
+            if strategy == "sleep":
+                time.sleep(0.3)
             driver.execute_script("arguments[0].click();", checkbox)
-            time.sleep(1)
+            if strategy == "sleep":
+                time.sleep(1)
+            else:
+                wait_stale(driver, old_card, timeout=5)
+                settle(driver, strategy, CARD_SELECTOR, legacy_sleep=1)
             print(f"✅ Фильтр снят: {category_value}")
     except Exception as e:
         print(f"⚠️ Ошибка снятия фильтра: {e}")
 
 
-def _parse_page_partners(driver) -> List[Dict[str, Any]]:
+# {name, text, href} по карточке; null — элемента нет
+_EXTRACT_CARDS_JS = """
+const text = (el) => el ? (el.innerText || '').trim() : null;
+return Array.from(document.querySelectorAll(arguments[0])).map((card) => {
+  const link = card.querySelector('.subpage-banner__link');
+  return {
+    name: text(card.querySelector('.subpage-banner__title')),
+    text: text(card.querySelector('.subpage-banner__text')),
+    href: link ? (link.href || '') : ''
+  };
+});
+"""
+
+
+def _extract_cards_js(driver) -> List[Dict[str, Any]]:
+    return driver.execute_script(_EXTRACT_CARDS_JS, CARD_SELECTOR) or []
+
+
+def _extract_cards_elements(driver) -> List[Dict[str, Any]]:
+    raw_cards: List[Dict[str, Any]] = []
+    for card in driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR):
+        raw: Dict[str, Any] = {"name": None, "text": None, "href": ""}
+        try:
+            raw["name"] = card.find_element(By.CSS_SELECTOR, ".subpage-banner__title").text.strip()
+        except NoSuchElementException:
+            pass
+        try:
+            raw["text"] = card.find_element(By.CSS_SELECTOR, ".subpage-banner__text").text.strip()
+        except NoSuchElementException:
+            pass
+        try:
+            link_elem = card.find_element(By.CSS_SELECTOR, ".subpage-banner__link")
+            raw["href"] = link_elem.get_attribute("href") or ""
+        except NoSuchElementException:
+            pass
+        raw_cards.append(raw)
+    return raw_cards
+
+
+def extract_cards(driver, mode: str = "") -> List[Dict[str, Any]]:
+    """Сырые карточки страницы: один execute_script, при ошибке — поэлементно."""
+    if (mode or DOM_EXTRACT) == "js":
+        try:
+            return _extract_cards_js(driver)
+        except WebDriverException as e:
+            print(f"  ⚠️ JS-извлечение не удалось ({e}), обходим карточки поэлементно")
+    return _extract_cards_elements(driver)
+
+
+def _parse_page_partners(driver, strategy: str = "cards") -> List[Dict[str, Any]]:
     """Парсит партнёров со страницы"""
     partners: List[Dict[str, Any]] = []
 
     try:
         WebDriverWait(driver, 15).until(
-            lambda d: len(d.find_elements(By.CSS_SELECTOR, ".about-banners__item")) > 0
+            lambda d: len(d.find_elements(By.CSS_SELECTOR, CARD_SELECTOR)) > 0
         )
-        time.sleep(2)
+        settle(driver, strategy, CARD_SELECTOR, legacy_sleep=2)
 
-        cards = driver.find_elements(By.CSS_SELECTOR, ".about-banners__item")
+        with scrape_metrics.phase("extract"):
+            cards = extract_cards(driver)
         print(f"  📄 Найдено карточек: {len(cards)}")
 
         if not cards:
             print("  ⚠️ Карточки не найдены")
             return partners
 
-        for idx, card in enumerate(cards, 1):
-            try:
-                # Парсим название
-                try:
-                    title_elem = card.find_element(By.CSS_SELECTOR, ".subpage-banner__title")
-                    name = title_elem.text.strip()
-                except NoSuchElementException:
-                    print(f"    ⚠️ Карточка #{idx}: название не найдено")
-                    continue
-
-                if not name:
-                    continue
-
-                # Парсим бонус
-                bonus = None
-                try:
-                    text_elem = card.find_element(By.CSS_SELECTOR, ".subpage-banner__text")
-                    bonus_text = text_elem.text.strip()
-                    # Ищем процент (1%, 1.5%, 10%, и т.д.)
-                    match = re.search(r"(\d+(?:[.,]\d+)?)\s*%", bonus_text)
-
-                    if match:
-                        bonus = match.group(1).replace(",", ".")
-                except NoSuchElementException:
-                    pass
-
-                # Парсим ссылку
-                link = ""
-                try:
-                    link_elem = card.find_element(By.CSS_SELECTOR, ".subpage-banner__link")
-                    link = link_elem.get_attribute("href") or ""
-                except NoSuchElementException:
-                    pass
-
-                partners.append(
-                    {
-                        "partner_name": name,
-                        "partner_bonus": bonus,
-                        "partner_link": link,
-                    }
-                )
-                print(f"    ✅ #{idx}: {name} | Бонус: {bonus or 'нет'}")
-
-            except Exception as e:
-                print(f"    ⚠️ Ошибка парсинга карточки #{idx}: {e}")
-
+        partners = _cards_to_partners(cards)
         print(f"  ✅ Распарсено на этой странице: {len(partners)} партнёров")
         return partners
 
@@ -455,4 +851,43 @@ def _parse_page_partners(driver) -> List[Dict[str, Any]]:
         print(f"  ❌ Ошибка парсинга: {e}")
         import traceback
         traceback.print_exc()
-        return []
\ No newline at end of file
+        return []
+
+
+def _cards_to_partners(cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Сырые карточки {name, text, href} → партнёры; пробелы в названии схлопываются, бонус — процент из текста."""
+    scrape_metrics.add(cards=len(cards))
+    partners: List[Dict[str, Any]] = []
+    for idx, card in enumerate(cards, 1):
+        try:
+            name = card.get("name")
+            if name is None:
+                print(f"    ⚠️ Карточка #{idx}: название не найдено")
+                continue
+            # одинаково для HTTP, JS и поэлементного обхода: иначе при смене режима
+            # тот же партнёр с другими пробелами в общем списке — удалённый + новый
+            name = " ".join(name.split())
+
+            if not name:
+                continue
+
+            # Ищем процент (1%, 1.5%, 10%, и т.д.)
+            bonus = None
+            match = re.search(r"(\d+(?:[.,]\d+)?)\s*%", card.get("text") or "")
+            if match:
+                bonus = match.group(1).replace(",", ".")
+
+            link = card.get("href") or ""
+
+            partners.append(
+                {
+                    "partner_name": name,
+                    "partner_bonus": bonus,
+                    "partner_link": link,
+                }
+            )
+            print(f"    ✅ #{idx}: {name} | Бонус: {bonus or 'нет'}")
+
+        except Exception as e:
+            print(f"    ⚠️ Ошибка парсинга карточки #{idx}: {e}")
+    return partners
\ No newline at end of file